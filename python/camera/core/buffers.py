@@ -0,0 +1,266 @@
+"""
+Fixed-size buffers of the most recent values, used by the emergence calculators
+for their windows of observations and the median filters of psi.
+
+`RingBuffer` stores its values in a preallocated numpy array and overwrites the
+oldest one on every append, instead of shifting a list. `RollingMedian` keeps a
+running median of the values in a `RingBuffer` with two heaps per component,
+so that each update costs O(log n) instead of sorting the whole buffer.
+"""
+
+import heapq
+import numpy as np
+
+from typing import Iterable, Optional, Tuple, Union
+
+
+class RingBuffer():
+    def __init__(self, capacity: int, shape: Tuple[int, ...] = (), dtype: type = float) -> None:
+        """
+        Buffer of the latest `capacity` values of a given shape, stored in a
+        preallocated numpy array of shape (capacity, *shape).
+
+        Params
+        ------
+        capacity
+            maximum number of values. If zero or less, the buffer is unbounded
+            and its array grows as needed
+        shape
+            shape of each value
+        dtype
+            type of the values
+        """
+        self.capacity = capacity if capacity > 0 else None
+        self.shape = tuple(shape)
+        self.data = np.empty((capacity if self.capacity else 64,) + self.shape, dtype = dtype)
+        self.clear()
+
+
+    def clear(self) -> None:
+        """
+        Drop all values, keeping the preallocated array.
+        """
+        self.start = 0
+        self.size = 0
+
+
+    def __len__(self) -> int:
+        return self.size
+
+
+    @property
+    def full(self) -> bool:
+        """
+        Whether the next append evicts the oldest value.
+        """
+        return self.size == self.capacity
+
+
+    def append(self, x: Union[float, np.ndarray]) -> None:
+        """
+        Append a value, evicting the oldest one if the buffer is full.
+        """
+        if self.size == len(self.data):
+            if self.capacity is None:
+                # unbounded, double the array
+                data = np.empty((2 * len(self.data),) + self.shape, dtype = self.data.dtype)
+                data[:self.size] = self.array()
+                self.data = data
+                self.start = 0
+            else:
+                self.data[self.start] = x
+                self.start = (self.start + 1) % len(self.data)
+                return
+
+        self.data[(self.start + self.size) % len(self.data)] = x
+        self.size += 1
+
+
+    def extend(self, values: Iterable[Union[float, np.ndarray]]) -> None:
+        """
+        Append every value in order.
+        """
+        for x in values:
+            self.append(x)
+
+
+    def __getitem__(self, i: Union[int, np.ndarray]) -> np.ndarray:
+        """
+        Values at the given positions counted from the oldest one, or from the
+        latest one if negative, e.g. `buffer[-1]` is the latest value.
+        """
+        i = np.asarray(i)
+        i = np.where(i < 0, i + self.size, i)
+        if np.any((i < 0) | (i >= self.size)):
+            raise IndexError('RingBuffer index out of range')
+
+        return self.data[(self.start + i) % len(self.data)]
+
+
+    def array(self) -> np.ndarray:
+        """
+        Copy of the values from the oldest to the latest, as a numpy array of
+        shape (len(self), *shape).
+        """
+        end = self.start + self.size
+        if end <= len(self.data):
+            return self.data[self.start:end].copy()
+
+        return np.concatenate([ self.data[self.start:], self.data[:end - len(self.data)] ])
+
+
+class SlidingMedian():
+    """
+    Median of a multiset of floats supporting insertions and removals in
+    O(log n), with a max-heap of the lower half of the values and a min-heap of
+    the upper half. Removed values are only deleted from a heap once they reach
+    its top. NaN values are ignored, as in `np.nanmedian`.
+    """
+
+    def __init__(self) -> None:
+        self.low = []
+        self.high = []
+        self.n_low = 0
+        self.n_high = 0
+        self.removed = {}
+
+
+    def prune(self, heap: list, sign: float) -> None:
+        """
+        Pop the removed values from the top of a heap.
+        """
+        while heap and sign * heap[0] in self.removed:
+            x = sign * heapq.heappop(heap)
+            self.removed[x] -= 1
+            if not self.removed[x]:
+                del self.removed[x]
+
+
+    def balance(self) -> None:
+        """
+        Keep the lower half one value larger than the upper half at most.
+        """
+        if self.n_low > self.n_high + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.n_low -= 1
+            self.n_high += 1
+            self.prune(self.low, -1)
+        elif self.n_low < self.n_high:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.n_high -= 1
+            self.n_low += 1
+            self.prune(self.high, 1)
+
+
+    def insert(self, x: float) -> None:
+        if x != x:
+            return
+
+        if not self.n_low or x <= -self.low[0]:
+            heapq.heappush(self.low, -x)
+            self.n_low += 1
+        else:
+            heapq.heappush(self.high, x)
+            self.n_high += 1
+        self.balance()
+
+
+    def remove(self, x: float) -> None:
+        if x != x:
+            return
+
+        self.removed[x] = self.removed.get(x, 0) + 1
+        if x <= -self.low[0]:
+            self.n_low -= 1
+            if x == -self.low[0]:
+                self.prune(self.low, -1)
+        else:
+            self.n_high -= 1
+            if x == self.high[0]:
+                self.prune(self.high, 1)
+        self.balance()
+
+
+    def median(self) -> float:
+        """
+        Median of the values, NaN if there are none.
+        """
+        if not self.n_low:
+            return np.nan
+        if self.n_low > self.n_high:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+
+class RollingMedian():
+    def __init__(self, size: int, shape: Tuple[int, ...] = (), fill: Optional[Union[float, np.ndarray]] = None) -> None:
+        """
+        Element-wise median of the latest `size` values, ignoring NaNs, e.g. to
+        median-filter psi. Equivalent to `np.nanmedian(values, axis = 0)` on a
+        list of the latest values, but each update costs O(log size) per
+        component.
+
+        Params
+        ------
+        size
+            number of values in the median
+        shape
+            shape of each value
+        fill
+            if given, initial value of the whole buffer
+        """
+        self.values = RingBuffer(size, shape)
+        self.medians = [ SlidingMedian() for _ in range(int(np.prod(shape, dtype = int))) ]
+
+        if fill is not None:
+            self.extend([ fill ] * size)
+
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+    def append(self, x: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Append a value, evicting the oldest one if the buffer is full, and
+        return the updated median.
+        """
+        x = np.broadcast_to(np.asarray(x, dtype = float), self.values.shape).ravel()
+
+        if self.values.full:
+            oldest = self.values[0].ravel()
+            for median, y in zip(self.medians, oldest):
+                median.remove(float(y))
+
+        self.values.append(x.reshape(self.values.shape))
+        for median, y in zip(self.medians, x):
+            median.insert(float(y))
+
+        return self.median()
+
+
+    def extend(self, values: Iterable[Union[float, np.ndarray]]) -> None:
+        """
+        Append every value in order.
+        """
+        for x in values:
+            self.append(x)
+
+
+    def median(self) -> Union[float, np.ndarray]:
+        """
+        Median of the values in the buffer, NaN where there are no values other
+        than NaN. A float for scalar values, otherwise a numpy array.
+        """
+        medians = [ median.median() for median in self.medians ]
+        if not self.values.shape:
+            return float(medians[0])
+
+        return np.array(medians, dtype = float).reshape(self.values.shape)
+
+
+    def array(self) -> np.ndarray:
+        """
+        Copy of the values from the oldest to the latest.
+        """
+        return self.values.array()
@@ -1,16 +1,173 @@
+import contextlib
 import cv2
 import datetime
 import imutils
 import logging
 import numpy as np
+import os
 import sys
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
-from typing import Any, List, Tuple, Optional, Union
+from typing import Any, Callable, List, Tuple, Optional, Union
 
 # initialise logging to file
 import camera.core.logger
 
+# directory of the camera package, against which relative cache paths are resolved
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# thread pools of the tiled mode by number of workers, shared by all the
+# detectors, as a new detector is created on every start and recalibration
+_tile_pools = {}
+_tile_pools_lock = threading.Lock()
+
+
+def contour_stats(contours: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Areas and bounding boxes of all the contours at once, from their points
+    concatenated into a single array. The areas follow the shoelace formula of
+    `cv2.contourArea` and the boxes the integer convention of
+    `cv2.boundingRect`, so that both match OpenCV exactly.
+
+    Params
+    ------
+    contours
+        list of contours, as returned by `cv2.findContours`
+
+    Returns
+    ------
+        numpy arrays of shape (K,) with the areas and (K, 4) with the bounding
+        boxes (x, y, w, h) in pixels
+    """
+    if not len(contours):
+        return np.empty(0), np.empty((0, 4))
+
+    sizes = np.fromiter(map(len, contours), dtype = int, count = len(contours))
+    start = np.concatenate([ [ 0 ], np.cumsum(sizes)[:-1] ])
+    points = np.concatenate(contours).reshape(-1, 2).astype(float)
+
+    # index of the next point of each point along its closed contour
+    following = np.arange(1, len(points) + 1)
+    following[start + sizes - 1] = start
+
+    cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+    areas = np.abs(np.add.reduceat(cross, start)) / 2
+
+    lower = np.minimum.reduceat(points, start)
+    upper = np.maximum.reduceat(points, start)
+
+    return areas, np.hstack([ lower, upper - lower + 1 ])
+
+
+def colour_lut(min_hsv: np.ndarray, max_hsv: np.ndarray) -> np.ndarray:
+    """
+    Lookup table of the colour threshold of a `Detector`, with one entry for
+    each of the 2^24 BGR colours, indexed by b | g << 8 | r << 16. Every colour
+    is converted to HSV and thresholded with the same OpenCV calls as the
+    frames, so that looking up the pixels of a frame gives exactly the same
+    mask as `cv2.inRange` on its HSV conversion.
+
+    Params
+    ------
+    min_hsv, max_hsv
+        numpy arrays of shape (3,) with the HSV bounds of the threshold
+
+    Returns
+    ------
+        numpy array of shape (2^24,) and type uint8, 255 for the colours within
+        the bounds and 0 otherwise
+    """
+    # the bytes of the little-endian indices are the colours in BGR order
+    colours = np.arange(1 << 24, dtype = '<u4').view(np.uint8).reshape(-1, 1, 4)
+    colours = np.ascontiguousarray(colours[:, :, :3])
+
+    return cv2.inRange(cv2.cvtColor(colours, cv2.COLOR_BGR2HSV), min_hsv, max_hsv).ravel()
+
+
+def yuv_lut(min_hsv: np.ndarray, max_hsv: np.ndarray) -> np.ndarray:
+    """
+    Lookup table translating the HSV colour threshold of a `Detector` into the
+    equivalent region of the YUV colour space of I420 frames, with one entry
+    for each of the 2^24 YUV colours, indexed by y | u << 8 | v << 16 as in
+    `colour_lut`. Every colour is converted to BGR as a uniform 2x2 block of an
+    I420 image, with the same OpenCV conversion as the I420 frames, then to HSV
+    and thresholded.
+
+    Params
+    ------
+    min_hsv, max_hsv
+        numpy arrays of shape (3,) with the HSV bounds of the threshold
+
+    Returns
+    ------
+        numpy array of shape (2^24,) and type uint8, 255 for the colours within
+        the bounds and 0 otherwise
+    """
+    lut = np.empty(1 << 24, np.uint8)
+
+    # one 2x2 block for each luma and blue chroma, in a single I420 image of
+    # height 2 whose last row holds the chroma planes
+    W = 1 << 17
+    i420 = np.empty((3, W), np.uint8)
+    k = np.arange(1 << 16)
+    i420[:2] = np.repeat(k & 255, 2)
+    i420[2, :W // 2] = k >> 8
+
+    for v in range(256):
+        i420[2, W // 2:] = v
+        bgr = np.ascontiguousarray(cv2.cvtColor(i420, cv2.COLOR_YUV2BGR_I420)[:1, ::2])
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        lut[v << 16:(v + 1) << 16] = cv2.inRange(hsv, min_hsv, max_hsv).ravel()
+
+    return lut
+
+
+def merge_windows(windows: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """
+    Merge overlapping windows into their bounding windows, so that no pixel is
+    processed twice and no blob is split between two windows.
+
+    Params
+    ------
+    windows
+        list of windows (x0, y0, x1, y1) in pixels, with exclusive upper bounds
+
+    Returns
+    ------
+        list of disjoint windows covering the same pixels
+    """
+    merged = list(windows)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+
+    return merged
+
+
+def tile_pool(workers: int) -> ThreadPoolExecutor:
+    """
+    Thread pool with the given number of workers shared by the detectors in
+    the tiled mode, created on first use and kept until the process exits.
+    """
+    with _tile_pools_lock:
+        if workers not in _tile_pools:
+            _tile_pools[workers] = ThreadPoolExecutor(max_workers = workers,
+                                                      thread_name_prefix = 'tiles')
+        return _tile_pools[workers]
+
+
 class Detector():
     def __init__(self, config: SimpleNamespace) -> None:
         """
@@ -28,6 +185,34 @@ class Detector():
             min_hsv, max_hsv         : np.ndarray
                 numpy arrays of shape (3,) where the elements represent HSV values to
                 be used as colour range for the objects to be detected
+            roi_interval             : int
+                if positive, `detect_tracked` only processes windows around the
+                positions predicted by the tracker, and scans the full frame
+                every `roi_interval` frames (default: 0, always full frame)
+            roi_margin               : int
+                margin in pixels around each predicted or candidate bounding
+                box (default: 24)
+            pyramid_scale            : float
+                if below 1, `detect_colour` finds candidate blobs on a copy of
+                the frame downscaled by this factor, rounded to a power of two,
+                and only processes the windows around them at full resolution
+                (default: 1)
+            colour_lut               : bool
+                if set, threshold the frames by looking up their BGR pixels in
+                a table built from the HSV bounds, instead of converting them
+                to HSV (default: False)
+            lut_cache                : str
+                directory where the lookup tables are saved, keyed by the HSV
+                bounds, so that they are only built once, relative to the
+                camera package unless absolute. If empty, they are rebuilt by
+                every detector (default: '')
+            tiles                    : int
+                if above 1, `detect_colour` splits the frame into this many
+                horizontal strips processed in parallel threads, and finds the
+                same boxes as on the full frame (default: 1)
+            tile_workers             : int
+                number of threads processing the strips, or one per strip if
+                zero (default: 0)
         """
         def to_hsv(hsv):
             return np.array([ hsv.hue, hsv.saturation, hsv.value], np.uint8)
@@ -36,9 +221,91 @@ class Detector():
         self.min_hsv = to_hsv(config.min_colour)
         self.max_hsv = to_hsv(config.max_colour)
 
+        self.roi_interval = getattr(config, 'roi_interval', 0)
+        self.roi_margin = getattr(config, 'roi_margin', 24)
+        self.frames_since_scan = 0
+
+        self.pyramid_scale = getattr(config, 'pyramid_scale', 1)
+
+        self.lut_cache = getattr(config, 'lut_cache', '')
+        if self.lut_cache:
+            self.lut_cache = os.path.join(PACKAGE_DIR, self.lut_cache)
+        self.lut = self.load_lut() if getattr(config, 'colour_lut', False) else None
+
+        self.tiles = getattr(config, 'tiles', 1)
+        self.tile_workers = getattr(config, 'tile_workers', 0) or self.tiles
+
+        # reach in pixels of the dilation, and scale of the blob images
+        self.kernel = np.ones((5, 5), "uint8")
+        self.halo = 2
+        self.scale = 1
+
+
+    def load_lut(self, build: Callable = colour_lut, name: str = 'lut') -> np.ndarray:
+        """
+        Lookup table of the colour threshold from `build`, `colour_lut` by
+        default, loaded from `lut_cache` if it has been saved under the same
+        name for the same bounds and version of OpenCV, and built and saved
+        there otherwise. The tables are saved with one bit per colour, i.e.
+        2 MB each.
+        """
+        key = '-'.join(map(str, self.min_hsv)) + '_' + '-'.join(map(str, self.max_hsv))
+        path = os.path.join(self.lut_cache, f'{name}_{key}_cv{cv2.__version__}.npy') \
+               if self.lut_cache else ''
+
+        if path and os.path.isfile(path):
+            try:
+                lut = np.unpackbits(np.load(path)) * np.uint8(255)
+                if lut.shape == (1 << 24,):
+                    logging.info(f'Loaded colour lookup table from {path}')
+                    return lut
+            except (OSError, ValueError) as e:
+                logging.info(f'Cannot load colour lookup table from {path}: {e}')
+
+        lut = build(self.min_hsv, self.max_hsv)
+        logging.info(f'Built colour lookup table {name} for HSV bounds {key}')
+
+        if path:
+            # write under a temporary name then rename, as for checkpoints
+            os.makedirs(self.lut_cache, exist_ok = True)
+            tmp_path = f'{path}.tmp.npy'
+            np.save(tmp_path, np.packbits(lut > 0))
+            os.replace(tmp_path, path)
+
+        return lut
+
+
+    def lookup_mask(self,
+            frame: np.ndarray,
+            bgra: Optional[np.ndarray] = None,
+            dst: Optional[np.ndarray] = None
+        ) -> np.ndarray:
+        """
+        Colour mask of a BGR frame looked up in `lut`, the same as `cv2.inRange`
+        on its HSV conversion. The frame is converted to BGRA so that each pixel
+        can be read as a 32-bit index, the alpha byte of which is cleared.
+
+        Params
+        ------
+        frame
+            frame or window of a frame in BGR
+        bgra, dst
+            optional buffers of shape (h, w, 4) and (h, w) and type uint8 for
+            the BGRA frame and the mask
+
+        Returns
+        ------
+            the mask, of shape (h, w) and type uint8
+        """
+        bgra = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst = bgra)
+        index = bgra.view('<u4')[..., 0]
+        np.bitwise_and(index, 0xFFFFFF, out = index)
+
+        return np.take(self.lut, index, out = dst)
+
 
     def log_detected(self,
-            boxes: List[Tuple[float, float, float, float]]
+            boxes: np.ndarray
         ) -> None:
         """
         Write detected boxes to logfile
@@ -47,7 +314,7 @@ class Detector():
         ------
         Write to logfile
         """
-        for i, box in enumerate(boxes):
+        for i, box in enumerate(map(tuple, np.asarray(boxes).tolist())):
             logging.info(f'{i+1}, {box}')
 
         if len(boxes):
@@ -141,7 +408,7 @@ class Detector():
     def detect_colour(self,
             frame: np.ndarray,
             dump: bool = False
-        ) -> List[Tuple[float, float, float, float]]:
+        ) -> np.ndarray:
         """
         Gets the initial regions of interest (ROIs) to be tracked, which are green
         LEDs in a dark image. Uses a conversion to hue-saturation-luminosity to pick
@@ -157,18 +424,268 @@ class Detector():
 
         Returns
         ------
-            a list of tuples, with the coordinates of the bounding boxes of the
-            detected objects
+            numpy array of shape (K, 4), with the coordinates (x, y, w, h) of the
+            bounding boxes of the detected objects, normalised to the size of
+            the frame
 
         Side-effects
         ------
             centre of mass coordinates are logged for the detected boxes
         """
-        # Convert the frame in RGB color space to HSV
-        hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        # Obtain frame width and height
+        fw = frame.shape[1]
+        fh = frame.shape[0]
+
+        if self.pyramid_scale < 1 and not dump:
+            bboxes = self.find_boxes_in_windows(frame, self.candidate_windows(frame))
+        elif self.tiles > 1 and not dump:
+            bboxes = self.find_boxes_in_tiles(frame)
+        else:
+            bboxes = self.find_boxes(frame, 0, 0, fw, fh, dump)
+
+        self.log_detected(bboxes)
+
+        return bboxes
+
+
+    def candidate_windows(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """
+        Windows of the frame which may contain an object, found by thresholding
+        a copy of the frame downscaled by `pyramid_scale`, rounded to a power of
+        two. The frame is halved repeatedly, averaging blocks of 2x2 pixels,
+        which keeps point-like LEDs above the colour threshold and is much
+        faster in OpenCV than averaging larger blocks at once.
+
+        Params
+        ------
+        frame
+            a single frame of a cv2.VideoCapture() or picamera stream
+
+        Returns
+        ------
+            list of windows (x0, y0, x1, y1) in pixels of the full frame,
+            around every candidate blob with a margin of `roi_margin`
+        """
+        small = frame
+        for _ in range(int(round(-np.log2(self.pyramid_scale)))):
+            small = cv2.resize(small, None, fx = 0.5, fy = 0.5, interpolation = cv2.INTER_AREA)
+        s = small.shape[1] / frame.shape[1]
+
+        if self.lut is not None:
+            mask = self.lookup_mask(small)
+        else:
+            mask = cv2.inRange(cv2.cvtColor(small, cv2.COLOR_BGR2HSV), self.min_hsv, self.max_hsv)
+
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = contour_stats(contours)[1] / s
+
+        return self.windows_around(boxes, frame.shape[1], frame.shape[0], normalised = False)
+
+
+    def windows_around(self,
+            boxes: np.ndarray,
+            fw: int, fh: int,
+            normalised: bool = True
+        ) -> List[Tuple[int, int, int, int]]:
+        """
+        Windows of `roi_margin` pixels around bounding boxes, clipped to the
+        frame.
+
+        Params
+        ------
+        boxes
+            numpy array of shape (K, 4) or list of bounding boxes (x, y, w, h)
+        fw, fh
+            width and height of the frame in pixels
+        normalised
+            if set, the boxes are normalised to the size of the frame,
+            otherwise they are in pixels
+
+        Returns
+        ------
+            list of windows (x0, y0, x1, y1) in pixels
+        """
+        m = self.roi_margin
+        scale = np.array([ fw, fh ] if normalised else [ 1, 1 ])
+        boxes = np.asarray(boxes, dtype = float).reshape(-1, 4)
+
+        lower = np.maximum(0, (boxes[:, :2] * scale).astype(int) - m)
+        upper = np.minimum([ fw, fh ], ((boxes[:, :2] + boxes[:, 2:]) * scale).astype(int) + m + 1)
+        valid = np.all(lower < upper, axis = 1)
+
+        return [ tuple(w) for w in np.hstack([ lower, upper ])[valid].tolist() ]
+
+
+    def find_boxes_in_windows(self,
+            frame: np.ndarray,
+            windows: List[Tuple[int, int, int, int]]
+        ) -> np.ndarray:
+        """
+        Find the bounding boxes of the objects in windows of the frame, merging
+        the overlapping windows first.
+        """
+        fw = frame.shape[1]
+        fh = frame.shape[0]
+
+        bboxes = [ np.empty((0, 4)) ]
+        for (x0, y0, x1, y1) in merge_windows(windows):
+            bboxes.append(self.find_boxes(frame[y0:y1, x0:x1], x0, y0, fw, fh))
+
+        return np.concatenate(bboxes)
+
+
+    def find_boxes_in_tiles(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Find the bounding boxes of the objects in `tiles` horizontal strips of
+        the frame in parallel, e.g. for 4K frames, with the same boxes as on the
+        full frame. The blob image of each strip is computed with a halo of the
+        rows within reach of the dilation, so that together they make up that
+        of the full frame. The blobs are then extracted from segments of the
+        blob image cut at the first empty row after each strip border, which no
+        blob can straddle. If there is none, the next segment is merged.
+
+        Params
+        ------
+        frame
+            a single frame of a cv2.VideoCapture() or picamera stream
+
+        Returns
+        ------
+            numpy array of shape (K, 4) with the bounding boxes of the detected
+            objects, as `detect_colour`
+        """
+        fw = frame.shape[1]
+        fh = frame.shape[0]
+
+        pool = tile_pool(self.tile_workers)
+        image = np.empty((fh, fw), np.uint8)
+        rows = np.linspace(0, fh, self.tiles + 1).astype(int).tolist()
+
+        def blobs_in_strip(y0, y1):
+            top, bottom = max(0, y0 - self.halo), min(fh, y1 + self.halo)
+            image[y0:y1] = self.blob_image(frame[top:bottom])[y0 - top:y1 - top]
+
+        list(pool.map(blobs_in_strip, rows[:-1], rows[1:]))
+
+        cuts = [ 0 ]
+        for y in rows[1:-1]:
+            y = max(y, cuts[-1] + 1)
+            while y < fh and image[y].any():
+                y += 1
+            if y < fh:
+                cuts.append(y)
+        cuts.append(fh)
+
+        extract = lambda y0, y1: self.extract_blobs(image[y0:y1], 0, y0, fw, fh, self.scale)
+        return np.concatenate([ np.empty((0, 4)) ] + list(pool.map(extract, cuts[:-1], cuts[1:])))
+
+
+    def detect_tracked(self,
+            frame: np.ndarray,
+            tracker: Any,
+            lock: Optional[Any] = None
+        ) -> np.ndarray:
+        """
+        Detect the objects in the windows around the bounding boxes predicted by
+        the tracker for this frame, instead of the whole frame. The full frame
+        is scanned every `roi_interval` frames, or as soon as the tracker lost
+        an object or tracks fewer objects than the maximum number of players,
+        so that new or lost players are picked up.
+
+        Params
+        ------
+        frame
+            a single frame of a cv2.VideoCapture() or picamera stream
+        tracker
+            an `EuclideanMultiTracker` updated with the detections of the
+            previous frames
+        lock
+            if given, held while reading the tracker, e.g. when it is updated
+            by another thread
+
+        Returns
+        ------
+            numpy array of shape (K, 4) with the bounding boxes of the detected
+            objects, as `detect_colour`
+        """
+        self.frames_since_scan += 1
+        with lock or contextlib.nullcontext():
+            if self.roi_interval <= 0 or self.frames_since_scan >= self.roi_interval \
+                    or tracker.lost > 0 or len(tracker.momodels) < tracker.num_players:
+                predicted = None
+            else:
+                predicted = tracker.predict_bboxes()
 
-        # create image mask by selecting the range of green hues from the HSV image
-        green_mask = cv2.inRange(hsv_frame, self.min_hsv, self.max_hsv)
+        if predicted is None:
+            self.frames_since_scan = 0
+            return self.detect_colour(frame)
+
+        windows = self.windows_around(predicted, frame.shape[1], frame.shape[0])
+        bboxes = self.find_boxes_in_windows(frame, windows)
+
+        self.log_detected(bboxes)
+
+        return bboxes
+
+
+    def find_boxes(self,
+            frame: np.ndarray,
+            x0: int, y0: int, fw: int, fh: int,
+            dump: bool = False
+        ) -> np.ndarray:
+        """
+        Find the bounding boxes of the objects in a frame, or in a window of a
+        frame.
+
+        Params
+        ------
+        frame
+            frame or window of a frame in BGR
+        x0, y0
+            position in pixels of the top-left corner of the window in the frame
+        fw, fh
+            width and height of the frame in pixels, used to normalise the
+            bounding boxes
+        dump
+            if set, save processing steps as images for debugging
+
+        Returns
+        ------
+            numpy array of shape (K, 4), with the coordinates (x, y, w, h) of the
+            bounding boxes of the detected objects normalised to the size of
+            the frame
+        """
+        return self.extract_blobs(self.blob_image(frame, dump), x0, y0, fw, fh)
+
+
+    def blob_image(self,
+            frame: np.ndarray,
+            dump: bool = False
+        ) -> np.ndarray:
+        """
+        Grey image of a frame, or of a window of a frame, masked by the dilated
+        colour mask, the non-zero pixels of which make up the blobs.
+
+        Params
+        ------
+        frame
+            frame or window of a frame in BGR
+        dump
+            if set, save processing steps as images for debugging
+
+        Returns
+        ------
+            the image, of shape (h, w) and type uint8
+        """
+        if self.lut is not None and not dump:
+            # the same mask, looked up from the BGR pixels
+            green_mask = self.lookup_mask(frame)
+        else:
+            # Convert the frame in RGB color space to HSV
+            hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+            # create image mask by selecting the range of green hues from the HSV image
+            green_mask = cv2.inRange(hsv_frame, self.min_hsv, self.max_hsv)
 
         if dump:
             cv2.imwrite(f"{self.config.server.IMG_PATH}/hsv_frame.jpg" , hsv_frame)
@@ -176,35 +693,233 @@ class Detector():
 
         # we look for punctiform green objects, so perform image dilation on mask
         # to emphasise these points
-        kernel = np.ones((5, 5), "uint8")
-        green_mask = cv2.dilate(green_mask, kernel)
+        green_mask = cv2.dilate(green_mask, self.kernel)
         if dump:
             cv2.imwrite(f"{self.config.server.IMG_PATH}/green_mask_dilated.jpg", green_mask)
 
         res = cv2.bitwise_and(frame, frame, mask = green_mask)
         if dump:
             cv2.imwrite(f"{self.config.server.IMG_PATH}/img_masked.jpg", res)
-        res = cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
 
+        return cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
+
+
+    def extract_blobs(self,
+            image: np.ndarray,
+            x0: int, y0: int, fw: int, fh: int,
+            scale: float = 1
+        ) -> np.ndarray:
+        """
+        Bounding boxes of the blobs of non-zero pixels of the right size and
+        shape in a single-channel image, normalised to the size of the frame.
+        The areas and boxes of all the contours are computed at once and
+        filtered with array masks. See `find_boxes` for the parameters, and
+        `scale` is that of the image relative to the camera frame, by whose
+        square the contour areas are divided before they are compared with
+        `min_contour` and `max_contour`.
+        """
         # Find the contours of all green objects
-        contours, hierarchy = cv2.findContours(res,
+        contours, hierarchy = cv2.findContours(image,
             cv2.RETR_TREE,
             cv2.CHAIN_APPROX_SIMPLE)
 
-        # Obtain frame width and height
-        fw = frame.shape[1]
-        fh = frame.shape[0]
+        areas, boxes = contour_stats(contours)
+        areas /= scale ** 2
+        x, y, w, h = boxes.T
 
-        bboxes = []
-        # go through detected contours and reject if not the wrong size or shape
-        for i, contour in enumerate(contours):
-            box = cv2.contourArea(contour)
-            if(box >= self.config.min_contour and box <= self.config.max_contour):
-                x, y, w, h = cv2.boundingRect(contour)
+        # reject the contours of the wrong size or shape
+        keep = (areas >= self.config.min_contour) & (areas <= self.config.max_contour)
+        keep &= (w / h >= 0.8) | (w / h <= 1.2)
 
-                if (w / h >= 0.8 or w / h <= 1.2):
-                    bboxes.append((x/fw, y/fh, w/fw, h/fh))
+        return np.column_stack([ (x0 + x) / fw, (y0 + y) / fh, w / fw, h / fh ])[keep]
 
-        self.log_detected(bboxes)
 
-        return bboxes
+class BufferedDetector(Detector):
+    """
+    Detector producing the same bounding boxes as `Detector`, but writing the
+    output of every OpenCV step into buffers allocated once per resolution
+    instead of new arrays on every frame. The windows of the ROI and pyramid
+    modes are processed in views of the same buffers.
+
+    Instead of masking the colour frame and converting the result to grey,
+    which only matters to the blob extraction through the pixels of the
+    dilated mask that are black in grey, the grey frame is computed once and
+    masked on a single channel.
+
+    Each thread has its own buffers, so that the strips of the tiled mode can
+    be processed in parallel.
+    """
+
+    def __init__(self, config: SimpleNamespace) -> None:
+        """
+        See `Detector`.
+        """
+        super().__init__(config)
+        self.local = threading.local()
+
+
+    def allocate(self, h: int, w: int) -> Tuple[np.ndarray, ...]:
+        """
+        Views of shape (h, w) of the HSV (or BGRA, with a lookup table), mask,
+        dilated mask and grey buffers of the calling thread, reallocated when a
+        larger image is processed.
+        """
+        buffers = getattr(self.local, 'buffers', None)
+        if buffers is None or buffers[0].shape[0] < h or buffers[0].shape[1] < w:
+            H, W = h, w
+            if buffers is not None:
+                H, W = max(h, buffers[0].shape[0]), max(w, buffers[0].shape[1])
+            logging.info(f'Allocating detection buffers for {W}x{H} images')
+            channels = 3 if self.lut is None else 4
+            buffers = (np.empty((H, W, channels), np.uint8), np.empty((H, W), np.uint8),
+                       np.empty((H, W), np.uint8), np.empty((H, W), np.uint8))
+            self.local.buffers = buffers
+
+        return tuple(b[:h, :w] for b in buffers)
+
+
+    def blob_image(self,
+            frame: np.ndarray,
+            dump: bool = False
+        ) -> np.ndarray:
+        """
+        See `Detector.blob_image`. The image is a view of the grey buffer of
+        the calling thread, overwritten by the next frame.
+        """
+        if dump:
+            return super().blob_image(frame, dump)
+
+        converted, mask, dilated, grey = self.allocate(*frame.shape[:2])
+
+        if self.lut is not None:
+            self.lookup_mask(frame, converted, mask)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst = converted)
+            cv2.inRange(converted, self.min_hsv, self.max_hsv, dst = mask)
+        cv2.dilate(mask, self.kernel, dst = dilated)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst = grey)
+        cv2.bitwise_and(grey, dilated, dst = grey)
+
+        return grey
+
+
+class YUVDetector(Detector):
+    """
+    Detector taking the frames in the I420 format of the PiCamera instead of
+    BGR, i.e. arrays of shape (3h/2, w) holding the h x w luma plane Y followed
+    by the h/2 x w/2 chroma planes U and V, so that neither the camera nor the
+    detector converts them to another colour space.
+
+    The frames are processed at the resolution of the chroma planes, stacked
+    with the luma plane averaged over blocks of 2x2 pixels. The colour bounds
+    are translated into the equivalent YUV region by `yuv_lut`, the mask is
+    dilated by a kernel of half the size, and the blobs are extracted from the
+    masked luma, with `min_contour` and `max_contour` still in pixels of the
+    full frame. As the bounding boxes are normalised, they map back to the
+    full frame as they are.
+
+    The ROI and tiled modes work in the same way as `Detector`, with
+    `roi_margin` still in pixels of the full frame, and the pyramid mode is
+    not used.
+    """
+
+    def __init__(self, config: SimpleNamespace) -> None:
+        """
+        See `Detector`. The lookup table is always used, and saved in
+        `lut_cache` as in the `colour_lut` mode.
+        """
+        super().__init__(config)
+        self.kernel = np.ones((3, 3), "uint8")
+        self.halo = 1
+        self.scale = 0.5
+        self.yuv_lut = self.load_lut(yuv_lut, 'yuvlut')
+
+        self.roi_margin = (self.roi_margin + 1) // 2
+        self.pyramid_scale = 1
+        self.alpha = None
+
+
+    def quarter(self, frame: np.ndarray) -> np.ndarray:
+        """
+        YUV image at the resolution of the chroma planes of an I420 frame, of
+        shape (h/2, w/2, 4) with the averaged luma, the chroma and a zero
+        channel, so that each pixel can be read as a 32-bit index of `yuv_lut`.
+        """
+        h, w = frame.shape[0] * 2 // 3, frame.shape[1]
+        planes = frame.reshape(-1)
+        size = (h // 2) * (w // 2)
+
+        Y = cv2.resize(planes[:h * w].reshape(h, w), (w // 2, h // 2), interpolation = cv2.INTER_AREA)
+        U = planes[h * w:h * w + size].reshape(h // 2, w // 2)
+        V = planes[h * w + size:h * w + 2 * size].reshape(h // 2, w // 2)
+
+        if self.alpha is None or self.alpha.shape != Y.shape:
+            self.alpha = np.zeros_like(Y)
+
+        return cv2.merge([ Y, U, V, self.alpha ])
+
+
+    def detect_colour(self,
+            frame: np.ndarray,
+            dump: bool = False
+        ) -> np.ndarray:
+        """
+        See `Detector.detect_colour`, with `frame` in I420.
+        """
+        return super().detect_colour(self.quarter(frame), dump)
+
+
+    def detect_tracked(self,
+            frame: np.ndarray,
+            tracker: Any,
+            lock: Optional[Any] = None
+        ) -> np.ndarray:
+        """
+        See `Detector.detect_tracked`, with `frame` in I420.
+        """
+        return super().detect_tracked(self.quarter(frame), tracker, lock)
+
+
+    def find_boxes(self,
+            frame: np.ndarray,
+            x0: int, y0: int, fw: int, fh: int,
+            dump: bool = False
+        ) -> np.ndarray:
+        """
+        See `Detector.find_boxes`, with `frame` a window of the image returned
+        by `quarter`, and `fw` and `fh` the size of that image.
+        """
+        return self.extract_blobs(self.blob_image(frame, dump), x0, y0, fw, fh, self.scale)
+
+
+    def blob_image(self,
+            frame: np.ndarray,
+            dump: bool = False
+        ) -> np.ndarray:
+        """
+        See `Detector.blob_image`, with `frame` a window of the image returned
+        by `quarter`, and the blobs in its luma channel.
+        """
+        mask = np.take(self.yuv_lut, frame.view('<u4')[..., 0])
+        if dump:
+            cv2.imwrite(f"{self.config.server.IMG_PATH}/yuv_mask.jpg", mask)
+
+        mask = cv2.dilate(mask, self.kernel)
+        res = cv2.bitwise_and(np.ascontiguousarray(frame[..., 0]), mask)
+        if dump:
+            cv2.imwrite(f"{self.config.server.IMG_PATH}/yuv_masked.jpg", res)
+
+        return res
+
+
+def create_detector(config: SimpleNamespace, yuv: bool = False) -> Detector:
+    """
+    Create the detector selected by `config.buffered`, a `BufferedDetector` if
+    set and a `Detector` otherwise, or a `YUVDetector` if `yuv` is set, for
+    I420 frames.
+    """
+    if yuv:
+        return YUVDetector(config)
+    if getattr(config, 'buffered', False):
+        return BufferedDetector(config)
+    return Detector(config)
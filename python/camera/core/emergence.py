@@ -11,50 +11,32 @@ Pedro Mediano, Oct 2021
 """
 
 import click
+import concurrent.futures as cf
 import jpype as jp
 import logging
 import numpy as np
 import os
+import time
 
-from typing import Callable, Iterable
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional, Union
 
 # initialise logging to file
 import camera.core.logger
 
-INFODYNAMICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'infodynamics.jar')
+from camera.core.buffers import RingBuffer, RollingMedian
+from camera.core.groups import SubgroupEmergence
+from camera.core.macro import MacroSet
+from camera.core.jidt import GAUSSIAN_MI_CALCULATOR, javify, start_jvm
+from camera.core.ksg import ksg_psi
+from camera.core.surrogates import MODES, gaussian_psi, significance, significance_series, surrogate_psi
+from camera.core.gaussian import WindowedCovariance, local_mutual_info, logdet, mutual_info, submatrices, window_statistics
+
 SAMPLE_THRESHOLD = 180
 PSI_START = -5
 
-def javify(Xi: np.ndarray) -> jp.JArray:
-    """
-    Convert a numpy array into a Java array to pass to the JIDT classes and
-    functions.
-    Given a 1-dimensional np array of shape (D,)  , return Java array of size D
-    Given a 2-dimensional np array of shape (1, D), return Java array of size D
-
-    Params
-    ------
-    Xi
-        numpy array of shape (D,) or (1,D) representing one 'micro' part of the
-        system or one value of the macroscopic feature
-
-    Returns
-    ------
-    jXi
-        the Xi array cast to Java Array
-    """
-    if len(Xi.shape) == 1:
-        D = Xi.shape[0]
-        Xi = Xi[np.newaxis, :]
-        jXi = jp.JArray(jp.JDouble, D)(Xi.tolist())
-    else:
-        D = Xi.shape[1]
-        jXi = jp.JArray(jp.JDouble, D)(Xi.tolist())
-
-    return jXi
 
-
-def compute_macro(X: Iterable[np.ndarray]) -> np.ndarray:
+def compute_macro(X: Iterable[np.ndarray], dX: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Computes a supervenient macroscopic feature.
 
@@ -63,29 +45,35 @@ def compute_macro(X: Iterable[np.ndarray]) -> np.ndarray:
     X : iter of np.ndarray
         each element of X contains a 1D numpy array of shape (1,T) representing one
         'micro' part of the system.
+    dX : np.ndarray
+        displacements of each micro part since the previous frame, unused
 
     Returns
     -------
     V
         Macroscopic feature of interest of D-dimensions of shape (1,D)
     """
-    V = np.mean(X, axis = 0)
+    V = np.mean(X, axis = -2)
 
-    return V[np.newaxis, :]
+    return V[..., np.newaxis, :]
 
 
 class EmergenceCalculator():
     def __init__(self,
-            macro_fun: Callable[[np.ndarray], np.ndarray],
+            macro_fun: Callable[[np.ndarray, np.ndarray], np.ndarray],
             use_correction: bool = True,
             psi_buffer_size : int = 60,
             observation_window_size : int = 120,
-            use_local : bool = False
+            use_local : bool = False,
+            checkpoint_path : str = '',
+            checkpoint_interval : int = 120,
+            checkpoint_max_age : float = 60
         ) -> None:
         """
         Construct the emergence calculator by setting member variables and
         checking the JVM is started. The JIDT calculators will be initialised
-        later, when the first batch of data is provided.
+        later, when the first batch of data is provided. The JVM is shared by
+        all calculators in the process and is only shut down at exit.
 
         After calculating the value of emergence for a given frame, it is
         median-filtered with recent past values to reduce volatility.
@@ -93,8 +81,9 @@ class EmergenceCalculator():
         Parameters
         ----------
         macro_fun: Callable
-            a function that takes an iter of numpy arrays of the same shape (1,T)
-            and returns a numpy array of shape (1,D)
+            a function that takes the positions and displacements of the micro
+            parts as numpy arrays of shape (N,D) and returns a numpy array of
+            shape (1,D) or (D,), e.g. a `MacroSet` of features from `MACROS`
         use_correction : bool
             Whether to use the 1st-order lattice correction for emergence
             calculation.
@@ -108,6 +97,14 @@ class EmergenceCalculator():
             If true, computes psi the local (i.e. pointwise) mutual info of
             the latest sample. If false, uses the standard (i.e. average) mutual
             info of the observation window (Default: true).
+        checkpoint_path : str
+            If set, periodically save the state of the calculator to this file,
+            so that it can be resumed after a restart (default: '').
+        checkpoint_interval : int
+            Number of frames between checkpoints (default: 120).
+        checkpoint_max_age : float
+            Age in seconds of the latest checkpoint above which it is too old to
+            resume from (default: 60).
         """
 
         self.is_initialised = False
@@ -115,68 +112,213 @@ class EmergenceCalculator():
 
         self.use_correction = use_correction
         self.psi_buffer_size = psi_buffer_size
-        self.past_psi_vals = [PSI_START] * psi_buffer_size
+        self.past_psi_vals = RollingMedian(psi_buffer_size, fill = PSI_START)
 
         self.observation_window_size = observation_window_size
-        self.observations_V = []
-        self.observations_X = []
+        self.observations_V = None
+        self.observations_X = None
 
         self.use_local = use_local
 
         self.compute_macro = macro_fun
 
-        if not jp.isJVMStarted():
-            logging.info('Starting JVM...')
-            jp.startJVM(jp.getDefaultJVMPath(), '-ea', '-Djava.class.path=%s'%INFODYNAMICS_PATH)
-            logging.info('JVM started using jpype1')
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_max_age = checkpoint_max_age
+
+        self.start_backend()
 
         logging.info('Successfully initialised EmergenceCalculator with buffer {psi_buffer_size} and observation window {observation_window_size}.')
 
 
+    def start_backend(self) -> None:
+        """
+        Check the JVM is started, and start it otherwise.
+        """
+        start_jvm()
+
+
+    def reset(self) -> None:
+        """
+        Drop all observations and past psi values to start a new session with
+        the same parameters. The calculators are re-initialised on the next
+        frame, without restarting the backend.
+        """
+        self.is_initialised = False
+        self.sample_counter = 0
+        self.past_psi_vals = RollingMedian(self.psi_buffer_size, fill = PSI_START)
+        self.observations_V = None
+        self.observations_X = None
+
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        State of the calculator to be saved in a checkpoint: the sample counter,
+        the median filter buffer, the previous frame, and the observations in
+        the window.
+        """
+        state = { 'sample_counter': np.array(self.sample_counter),
+                  'past_psi_vals':  self.past_psi_vals.array() }
+
+        if self.is_initialised:
+            if self.observation_window_size <= 0:
+                raise ValueError('JIDT calculators without an observation window cannot be checkpointed')
+
+            state['past_X'] = np.asarray(self.past_X, dtype = float)
+            state['past_V'] = np.asarray(self.past_V, dtype = float)
+            if self.observations_X is not None:
+                state['observations_V'] = self.observations_V.array()
+                state['observations_X'] = self.observations_X.array()
+
+        return state
+
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        """
+        Restore the state saved by `state`.
+        """
+        self.reset()
+        self.sample_counter = int(state['sample_counter'])
+        self.past_psi_vals.extend(state['past_psi_vals'])
+
+        if 'past_X' in state:
+            if self.observation_window_size <= 0:
+                raise ValueError('JIDT calculators without an observation window cannot be resumed')
+
+            self.past_X = state['past_X']
+            self.past_V = state['past_V']
+            if 'observations_X' in state:
+                self.reset_observations(state['observations_X'].shape[1:], state['observations_V'].shape[1])
+                self.observations_V.extend(state['observations_V'])
+                self.observations_X.extend(state['observations_X'])
+            self.initialise_calculators(self.past_X, self.past_V)
+
+
+    def params(self) -> np.ndarray:
+        """
+        Parameters which must match for a checkpoint to be resumed.
+        """
+        return np.array([ self.observation_window_size, self.psi_buffer_size,
+                          self.use_local, self.use_correction ], dtype = float)
+
+
+    def save_checkpoint(self) -> None:
+        """
+        Save the state of the calculator to `checkpoint_path`. The file is
+        written under a temporary name then renamed, so that a crash while
+        saving never leaves a corrupt checkpoint.
+        """
+        dirname = os.path.dirname(self.checkpoint_path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        tmp_path = f'{self.checkpoint_path}.tmp.npz'
+        np.savez(tmp_path, backend = type(self).__name__, params = self.params(),
+                 **self.state())
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+    def resume(self) -> bool:
+        """
+        Restore the state of the calculator from the checkpoint at
+        `checkpoint_path`, if there is one no older than `checkpoint_max_age`
+        seconds, saved by a calculator of the same type and parameters.
+
+        Returns
+        ------
+        whether the calculator was resumed from the checkpoint
+        """
+        if not self.checkpoint_path or not os.path.isfile(self.checkpoint_path):
+            return False
+
+        age = time.time() - os.path.getmtime(self.checkpoint_path)
+        if age > self.checkpoint_max_age:
+            logging.info(f'Checkpoint {self.checkpoint_path} is {age:.0f}s old, not resuming')
+            return False
+
+        try:
+            with np.load(self.checkpoint_path) as f:
+                state = dict(f)
+            if str(state.pop('backend')) != type(self).__name__ or \
+                    not np.array_equal(state.pop('params'), self.params()):
+                logging.info(f'Checkpoint {self.checkpoint_path} has different parameters, not resuming')
+                return False
+
+            self.load_state(state)
+        except Exception as e:
+            logging.info(f'Could not resume from checkpoint {self.checkpoint_path}: {e!r}')
+            self.reset()
+            return False
+
+        logging.info(f'Resumed from checkpoint {self.checkpoint_path} at sample {self.sample_counter}')
+        return True
+
+
     def initialise_calculators(self, X: np.ndarray, V: np.ndarray) -> None:
         """
         """
+        X = np.asarray(X, dtype = float)
+        V = np.asarray(V, dtype = float)
         self.N = len(X)
 
         self.xmiCalcs = []
         for Xi in X:
-            Xi = Xi[np.newaxis, :]
-            self.xmiCalcs.append(jp.JClass('infodynamics.measures.continuous.gaussian.MutualInfoCalculatorMultiVariateGaussian')())
-            self.xmiCalcs[-1].initialise(Xi.shape[1], V.shape[1])
+            self.xmiCalcs.append(jp.JClass(GAUSSIAN_MI_CALCULATOR)())
+            self.xmiCalcs[-1].initialise(X.shape[1], V.shape[1])
             self.xmiCalcs[-1].startAddObservations()
 
-        self.vmiCalc = jp.JClass('infodynamics.measures.continuous.gaussian.MutualInfoCalculatorMultiVariateGaussian')()
+        self.vmiCalc = jp.JClass(GAUSSIAN_MI_CALCULATOR)()
         self.vmiCalc.initialise(V.shape[1], V.shape[1])
         self.vmiCalc.startAddObservations()
 
         self.is_initialised = True
 
 
-    def update_calculators(self, V: np.ndarray) -> None:
+    def update_calculators(self, X: np.ndarray, V: np.ndarray) -> None:
         """
+        Add the latest observation, from the previous frame to the frame with
+        positions X and macroscopic feature V, to the calculators. If an observation window
+        is used, the calculators are re-initialised and the whole window is
+        passed to each calculator as a single 2D array in one call.
         """
-        jV = javify(V)
-        jVp = javify(self.past_V)
-        jXp = [javify(Xip) for Xip in self.past_X]
+        past_X = np.asarray(self.past_X, dtype = float)
+        past_V = np.asarray(self.past_V, dtype = float)
+        V      = np.asarray(V, dtype = float)
 
         if self.observation_window_size <= 0:
-            self.vmiCalc.addObservations(jVp, jV)
-            for jXip,calc in zip(jXp, self.xmiCalcs):
-                calc.addObservations(jXip, jV)
+            jV = javify(V)
+            self.vmiCalc.addObservations(javify(past_V), jV)
+            for Xip,calc in zip(past_X, self.xmiCalcs):
+                calc.addObservations(javify(Xip), jV)
 
         else:
-            self.observations_V.append((jVp, jV))
-            self.observations_X.append((jXp, jV))
-            if len(self.observations_V) > self.observation_window_size:
-                self.observations_V.pop(0)
-                self.observations_X.pop(0)
+            Dv = V.shape[1]
+            if self.observations_X is None or self.observations_X.shape != past_X.shape:
+                if self.observations_X is not None:
+                    logging.info(f'Number of players changed to {len(past_X)}, resetting observations')
+                self.reset_observations(past_X.shape, 2 * Dv)
 
-            self.initialise_calculators(self.past_X, V)
-            for jVp, jV in self.observations_V:
-                self.vmiCalc.addObservations(jVp, jV)
-            for jXp, jV in self.observations_X:
-                for jXip,calc in zip(jXp, self.xmiCalcs):
-                    calc.addObservations(jXip, jV)
+            self.observations_V.append(np.hstack([ past_V[0], V[0] ]))
+            self.observations_X.append(past_X)
+
+            obs_V = self.observations_V.array()
+            # (N, T, D) so that each player's window is a contiguous block
+            obs_X = np.ascontiguousarray(np.swapaxes(self.observations_X.array(), 0, 1))
+
+            self.initialise_calculators(past_X, V)
+            jV = javify(obs_V[:, Dv:])
+            self.vmiCalc.addObservations(javify(obs_V[:, :Dv]), jV)
+            for Xip,calc in zip(obs_X, self.xmiCalcs):
+                calc.addObservations(javify(Xip), jV)
+
+
+    def reset_observations(self, shape_X: tuple, Dv: int) -> None:
+        """
+        Allocate empty ring buffers for the window of observations, given the
+        shape (N, D) of the positions and the dimension of the pairs (V, V').
+        """
+        self.observations_V = RingBuffer(self.observation_window_size, (Dv,))
+        self.observations_X = RingBuffer(self.observation_window_size, shape_X)
 
 
     def compute_psi(self, V: np.ndarray) -> float:
@@ -211,17 +353,31 @@ class EmergenceCalculator():
         return psi
 
 
+    def filter_psi(self, psi: float) -> float:
+        """
+        Median-filter psi with the last `psi_buffer_size` values.
+        """
+        return self.past_psi_vals.append(psi)
+
+
     def update_and_compute(self, X: Iterable[np.ndarray]) -> float:
         """
         """
-        V = self.compute_macro(X)
+        # copy, as the caller may reuse its buffer for the next frame
+        X = np.array(X, dtype = float)
+        if self.is_initialised and X.shape == np.shape(self.past_X):
+            dX = X - self.past_X
+        else:
+            dX = np.zeros_like(X)
+
+        V = np.atleast_2d(self.compute_macro(X, dX))
 
         psi = PSI_START
         if not self.is_initialised:
             self.initialise_calculators(X, V)
 
         else:
-            self.update_calculators(V)
+            self.update_calculators(X, V)
             if self.sample_counter > SAMPLE_THRESHOLD:
                 psi = self.compute_psi(V)
 
@@ -229,45 +385,944 @@ class EmergenceCalculator():
         self.past_V = V
         self.sample_counter += 1
 
-        self.past_psi_vals.append(psi)
-        if len(self.past_psi_vals) > self.psi_buffer_size:
-            self.past_psi_vals.pop(0)
-        psi_filt = np.nanmedian(self.past_psi_vals)
+        psi_filt = self.filter_psi(psi)
 
         logging.info(f'Unfiltered Psi {self.sample_counter}: {psi}')
         logging.info(f'Filtered Psi {self.sample_counter}: {psi_filt}')
 
+        if self.checkpoint_path and self.sample_counter % self.checkpoint_interval == 0:
+            try:
+                self.save_checkpoint()
+            except Exception as e:
+                logging.info(f'Could not save checkpoint {self.checkpoint_path}: {e!r}')
+
         return psi_filt
 
 
     def exit(self) -> None:
         """
-        Gracefully shut down JVM. Call whenever done with the calculator.
+        Release the calculators. Call whenever done with the calculator. The
+        JVM is left running to be reused, as it cannot be restarted in the same
+        process, and is shut down when the process exits.
         """
-        if jp.isJVMStarted():
-            logging.info('Shutting down JVM...')
-            jp.shutdownJVM()
+        self.reset()
+        self.xmiCalcs = []
+        self.vmiCalc = None
 
 
-@click.command()
-@click.option('--filename',  help = 'Numpy array dump of microscopic features of the system', required = True)
-@click.option('--threshold', help = 'Number of timesteps to wait before calculation, at least as many as the dimenstions of the system')
-def test(filename: str, threshold: int = SAMPLE_THRESHOLD) -> None:
+class GaussianEmergenceCalculator(EmergenceCalculator):
     """
-    Test the emergence calculator on the trajectories specified in `filename`.
+    Drop-in replacement for the JIDT-backed `EmergenceCalculator` which computes
+    the same Gaussian mutual information quantities in-process with NumPy, from
+    log-determinants of covariance blocks. It does not need a JVM.
+
+    Instead of one calculator per player, a single joint covariance of all the
+    micro and macro variables Z = [X_1, ..., X_N, V, V', X_1', ..., X_N'] is
+    accumulated, and all the MIs I(X_i;V') and I(V;V') are read from its
+    sub-blocks in one vectorised pass. The running sums and cross-products of
+    the observations are updated with one addition and at most one eviction per
+    frame, so the per-frame cost does not depend on the window length.
+
+    The other PhiID criteria of the primary feature, downward causation Delta
+    and causal decoupling Gamma, are read from the (V, X_j') and (X_i, X_j')
+    blocks of the same covariance, and their filtered values are available in
+    `delta` and `gamma`.
+
+    If the macro function is a `MacroSet`, psi is computed for each of its
+    features from the same joint covariance, with V = [V_1, ..., V_M]. The
+    primary feature drives the returned psi, and the filtered psi of every
+    feature is available in `macro_psi`.
+
+    If `scales` is given, the statistics are accumulated over several window
+    lengths at once, sharing the buffer of observations of the longest one, and
+    the filtered psi of the primary feature at every window length is available
+    in `scale_psi`, which is empty otherwise. The other quantities use
+    `observation_window_size`.
+
+    If `groups` is given, the psi of each subgroup of players, with its centroid
+    as macroscopic feature, is computed from the (X, X') blocks of the same
+    covariance. The filtered psi of every subgroup is available in `group_psi`.
+
+    If `surrogates` is set, the psi of the primary feature over the window is
+    periodically compared with the psi of surrogates of the window, and its
+    z-score and p-value are available in `psi_z` and `psi_p`.
     """
-    calc = EmergenceCalculator(compute_macro)
 
-    X = np.load(filename, allow_pickle=True)
+    def __init__(self, *args,
+            groups: Optional[Union[int, List[List[int]]]] = None,
+            group_workers: int = 0,
+            surrogates: int = 0,
+            surrogate_mode: str = 'time',
+            significance_interval: int = 12,
+            scales: Optional[List[int]] = None,
+            **kwargs
+        ) -> None:
+        """
+        Params
+        ------
+        groups
+            if set, either a list with the indices of the players in each
+            subgroup, or the number of spatial clusters of players, see
+            `SubgroupEmergence`
+        group_workers
+            number of threads computing the psi of the subgroups
+        surrogates
+            number of surrogates used to test the significance of psi, 0 to
+            disable the test
+        surrogate_mode
+            'time' or 'player', see `camera.core.surrogates`
+        significance_interval
+            number of frames between significance tests
+        scales
+            if set, other observation window sizes at which to compute psi
+            alongside `observation_window_size`
+
+        The other parameters are the same as for `EmergenceCalculator`.
+        """
+        super().__init__(*args, **kwargs)
+
+        self.windows = sorted(set(scales or []) | { self.observation_window_size })
+        self.primary = self.windows.index(self.observation_window_size)
+
+        if surrogates and self.observation_window_size <= 0:
+            raise ValueError('The significance of psi can only be tested with an observation window')
+
+        self.surrogates = surrogates
+        self.surrogate_mode = surrogate_mode
+        self.significance_interval = significance_interval
+        self.rng = np.random.default_rng()
+
+        self.macro_names = getattr(self.compute_macro, 'names', [ 'macro' ])
+        self.subgroups = SubgroupEmergence(groups, group_workers,
+            self.use_correction, self.use_local) if groups else None
+        self.reset()
+
+
+    def start_backend(self) -> None:
+        """
+        Nothing to start, the NumPy backend runs in-process.
+        """
+        pass
+
+
+    def params(self) -> np.ndarray:
+        """
+        Parameters which must match for a checkpoint to be resumed, including
+        the number of subgroups and the window sizes, which change the
+        statistics stored.
+        """
+        return np.concatenate([ super().params(), [ len(self.group_names) ], self.windows ])
+
+
+    def initialise_calculators(self, X: np.ndarray, V: np.ndarray) -> None:
+        """
+        Reset the sufficient statistics of the joint observations over every
+        window size, and the buffer of observations. Precompute the
+        indices of the (X_i, V') and (V, V') blocks of the joint covariance.
+        """
+        X = np.asarray(X, dtype = float)
+        V = np.asarray(V, dtype = float)
+
+        self.N = len(X)
+        self.D  = X.shape[1]
+        Dv = V.shape[1]
+
+        # indices of the (X_i, V_m') and (V_m, V_m') blocks for each feature m
+        nx = self.N * self.D
+        idx_Xi = np.arange(nx).reshape(self.N, self.D)
+        slices = getattr(self.compute_macro, 'slices', [ slice(0, Dv) ])
+        self.blocks = []
+        for sl in slices:
+            idx_V  = nx + np.arange(Dv)[sl]
+            idx_Vn = idx_V + Dv
+            idx_X  = np.hstack([ idx_Xi, np.broadcast_to(idx_Vn, (self.N, len(idx_Vn))) ])
+            self.blocks.append((len(idx_V), idx_X, np.hstack([ idx_V, idx_Vn ])[np.newaxis, :]))
+
+        # indices of the positions at consecutive frames [X, X'], the future
+        # positions being stored after the macro variables
+        self.idx_W = np.hstack([ np.arange(nx), nx + 2 * Dv + np.arange(nx) ])
+        idx_Xn = self.idx_W[nx:].reshape(self.N, self.D)
+
+        # indices of the (X_i, X_j') blocks, flattened over i then j, and of
+        # the (V, X_j') blocks of the primary feature
+        pairs = np.broadcast_arrays(idx_Xi[:, None, :], idx_Xn[None, :, :])
+        self.idx_XX = np.concatenate(pairs, axis = -1).reshape(self.N * self.N, 2 * self.D)
+        idx_V = self.blocks[0][2][0, :self.blocks[0][0]]
+        self.idx_VX = np.hstack([ np.broadcast_to(idx_V, (self.N, len(idx_V))), idx_Xn ])
+
+        self.stats = WindowedCovariance(2 * nx + 2 * Dv, self.windows)
+
+        self.is_initialised = True
+
+
+    def reset(self) -> None:
+        """
+        Drop all observations and past psi values of every feature and
+        subgroup.
+        """
+        super().reset()
+        self.macro_psi_raw = np.full(len(self.macro_names), float(PSI_START))
+        self.past_macro_psi = RollingMedian(self.psi_buffer_size, self.macro_psi_raw.shape, self.macro_psi_raw)
+        self.macro_psi = dict(zip(self.macro_names, self.macro_psi_raw))
+
+        self.scale_psi_raw = np.full(len(self.windows), float(PSI_START))
+        self.past_scale_psi = RollingMedian(self.psi_buffer_size, self.scale_psi_raw.shape, self.scale_psi_raw)
+        # only filtered with several windows, psi being that of the only one
+        self.scale_psi = dict(zip(map(str, self.windows), self.scale_psi_raw)) \
+            if len(self.windows) > 1 else {}
+
+        self.phiid_raw = np.full(2, np.nan)
+        self.past_phiid = RollingMedian(self.psi_buffer_size, self.phiid_raw.shape, self.phiid_raw)
+        self.delta = np.nan
+        self.gamma = np.nan
+        self.psi_z = np.nan
+        self.psi_p = np.nan
+
+        self.group_names = self.subgroups.names if self.subgroups else []
+        self.group_psi_raw = np.full(len(self.group_names), float(PSI_START))
+        self.past_group_psi = RollingMedian(self.psi_buffer_size, self.group_psi_raw.shape, self.group_psi_raw)
+        self.group_psi = dict(zip(self.group_names, self.group_psi_raw))
+        if self.subgroups:
+            self.subgroups.reset()
+
+
+    def filter_psi(self, psi: float) -> float:
+        """
+        Median-filter psi, Delta and Gamma, and the psi of every feature in the
+        macro set, at every window size and of every subgroup.
+        """
+        if len(self.windows) > 1:
+            self.scale_psi = dict(zip(map(str, self.windows),
+                                      self.past_scale_psi.append(self.scale_psi_raw)))
+            self.scale_psi_raw = np.full(len(self.windows), float(PSI_START))
+
+            logging.info(f'Filtered Psi per window size {self.sample_counter}: {self.scale_psi}')
+
+        # NaN before the first full sample window
+        self.delta, self.gamma = self.past_phiid.append(self.phiid_raw)
+        self.phiid_raw = np.full(2, np.nan)
+
+        logging.info(f'Filtered Delta {self.sample_counter}: {self.delta}')
+        logging.info(f'Filtered Gamma {self.sample_counter}: {self.gamma}')
+
+        self.macro_psi = dict(zip(self.macro_names,
+                                  self.past_macro_psi.append(self.macro_psi_raw)))
+        self.macro_psi_raw = np.full(len(self.macro_names), float(PSI_START))
+
+        if len(self.macro_names) > 1:
+            logging.info(f'Filtered Psi per macro {self.sample_counter}: {self.macro_psi}')
+
+        if self.subgroups:
+            # NaN for the subgroups with fewer than two players
+            self.group_psi = dict(zip(self.group_names,
+                                      self.past_group_psi.append(self.group_psi_raw)))
+            self.group_psi_raw = np.full(len(self.group_names), float(PSI_START))
+
+            logging.info(f'Filtered Psi per group {self.sample_counter}: {self.group_psi}')
+
+        return super().filter_psi(psi)
+
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        State of the calculator to be saved in a checkpoint: the sample counter,
+        the median filter buffers, the previous frame, the observations in the
+        window and the sufficient statistics.
+        """
+        state = { 'sample_counter': np.array(self.sample_counter),
+                  'past_psi_vals':  self.past_psi_vals.array(),
+                  'past_macro_psi': self.past_macro_psi.array(),
+                  'past_group_psi': self.past_group_psi.array(),
+                  'past_scale_psi': self.past_scale_psi.array(),
+                  'past_phiid':     self.past_phiid.array() }
+
+        if self.is_initialised:
+            state['past_X'] = np.asarray(self.past_X, dtype = float)
+            state['past_V'] = np.asarray(self.past_V, dtype = float)
+            state['observations'] = self.stats.observations.array()
+            state['evictions'] = np.array(self.stats.evictions)
+            state['n'] = self.stats.n
+            if self.stats.shift is not None:
+                state['shift'] = self.stats.shift
+                state['S1'] = self.stats.S1
+                state['S2'] = self.stats.S2
+                state['latest'] = self.latest
+
+        return state
+
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        """
+        Restore the state saved by `state`.
+        """
+        self.reset()
+        self.sample_counter = int(state['sample_counter'])
+        self.past_psi_vals.extend(state['past_psi_vals'])
+        self.past_macro_psi.extend(state['past_macro_psi'])
+        self.past_group_psi.extend(state['past_group_psi'])
+        self.past_scale_psi.extend(state['past_scale_psi'])
+        self.past_phiid.extend(state['past_phiid'])
+
+        if 'past_X' in state:
+            self.past_X = state['past_X']
+            self.past_V = state['past_V']
+            self.initialise_calculators(self.past_X, self.past_V)
+
+            self.stats.observations.extend(state['observations'])
+            self.stats.evictions = int(state['evictions'])
+            self.stats.n = state['n']
+            if 'shift' in state:
+                self.stats.shift = state['shift']
+                self.stats.S1 = state['S1']
+                self.stats.S2 = state['S2']
+                self.latest = state['latest']
+
+
+    def update_calculators(self, X: np.ndarray, V: np.ndarray) -> None:
+        """
+        Add the latest observation to the sufficient statistics of every
+        window size, and evict the oldest one from the windows which are full.
+        """
+        past_X = np.asarray(self.past_X, dtype = float)
+
+        if len(past_X) != self.N:
+            logging.info(f'Number of players changed to {len(past_X)}, resetting calculators')
+            self.initialise_calculators(past_X, self.past_V)
+
+        if X.shape != past_X.shape:
+            # the positions of the players cannot be paired across frames
+            return
+
+        self.latest = np.hstack([ past_X.ravel(), np.ravel(self.past_V),
+                                  np.ravel(V), X.ravel() ]).astype(float)
+        self.stats.add(self.latest)
+
+
+    def compute_psi(self, V: np.ndarray) -> float:
+        """
+        Compute psi from the joint covariance of the observations in the
+        window, with the macro-to-macro MI I(V;V') and the N micro-to-macro
+        MIs I(X_i;V'), for every feature in the macro set and every subgroup.
+        Also computes Delta and Gamma of the primary feature, and its psi at
+        every window size. Returns the psi of the primary feature, or
+        PSI_START until two observations are paired after the number of
+        players changed.
+        """
+        if self.stats.shift is None or self.stats.n[self.primary] < 2:
+            return float(PSI_START)
+
+        C = self.stats.covariance()
+        mu = self.stats.mean()
+
+        if len(self.windows) > 1:
+            self.scale_psi_raw = self.compute_scale_psi(C, mu)
+
+        C, mu = C[self.primary], mu[self.primary]
+
+        self.phiid_raw = self.compute_delta_gamma(C, mu if self.use_local else None)
+
+        if self.subgroups:
+            idx_W = self.idx_W
+            self.group_psi_raw = self.subgroups.compute(
+                C[idx_W[:, None], idx_W[None, :]], mu[idx_W], self.latest[idx_W], self.D)
+
+        for m, (Dv, idx_X, idx_V) in enumerate(self.blocks):
+            Cx = submatrices(C, idx_X)
+            Cv = submatrices(C, idx_V)[0]
+
+            marginal_mi = mutual_info(Cx, self.D)
+
+            if self.use_local:
+                psi = local_mutual_info(Cv, mu[idx_V[0]], self.latest[idx_V[0]], Dv) \
+                    - np.sum(local_mutual_info(Cx, mu[idx_X], self.latest[idx_X], self.D))
+            else:
+                psi = mutual_info(Cv, Dv) - np.sum(marginal_mi)
+
+            if self.use_correction:
+                psi += (self.N - 1) * np.min(marginal_mi)
+
+            self.macro_psi_raw[m] = psi
+
+        if self.surrogates and self.sample_counter % self.significance_interval == 0:
+            self.compute_significance()
+
+        return float(self.macro_psi_raw[0])
+
+
+    def compute_scale_psi(self, C: np.ndarray, mu: np.ndarray) -> np.ndarray:
+        """
+        Compute psi of the primary feature at every window size, from the
+        stacked joint covariances of the windows in one vectorised pass.
+
+        Params
+        ------
+        C, mu
+            numpy arrays of shape (K, d, d) and (K, d), joint covariance and
+            mean of the observations in each of the K windows
+
+        Returns
+        ------
+        numpy array of shape (K,) with psi at every window size
+        """
+        Dv, idx_X, idx_V = self.blocks[0]
+        Cx = submatrices(C, idx_X)
+        Cv = submatrices(C, idx_V)[:, 0]
+
+        marginal_mi = mutual_info(Cx, self.D)
+
+        if self.use_local:
+            psi = local_mutual_info(Cv, mu[:, idx_V[0]], self.latest[idx_V[0]], Dv) \
+                - np.sum(local_mutual_info(Cx, mu[:, idx_X], self.latest[idx_X], self.D), axis = -1)
+        else:
+            psi = mutual_info(Cv, Dv) - np.sum(marginal_mi, axis = -1)
+
+        if self.use_correction:
+            psi += (self.N - 1) * np.min(marginal_mi, axis = -1)
+
+        return psi
+
+
+    def compute_significance(self) -> None:
+        """
+        Compute the z-score and p-value of the psi of the primary feature over
+        the window against the psi of surrogates of the window, all evaluated
+        at once on stacked arrays.
+        """
+        Z  = self.stats.observations.array()[-self.observation_window_size:]
+        nx = self.N * self.D
+        Dv, _, idx_V = self.blocks[0]
+        idx_V, idx_Vn = idx_V[0, :Dv], idx_V[0, Dv:]
+
+        # the observations of a session are contiguous frames, so the
+        # positions and feature on the frames of the window are recovered from
+        # the past values and the future values of the latest observation
+        P = np.vstack([ Z[:, :nx], Z[-1:, -nx:] ]).reshape(-1, self.N, self.D)
+        V = np.vstack([ Z[:, idx_V], Z[-1:, idx_Vn] ])
+
+        psi  = float(gaussian_psi(P[:-1], V[:-1], V[1:], self.use_correction))
+        null = surrogate_psi(P, V, self.compute_macro, self.surrogates,
+                             self.surrogate_mode, self.use_correction, self.rng)
+        self.psi_z, self.psi_p = significance(psi, null)
+
+        logging.info(f'Psi significance {self.sample_counter}: z = {self.psi_z}, p = {self.psi_p}')
+
+
+    def compute_delta_gamma(self, C: np.ndarray, mu: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Compute the downward causation and causal decoupling criteria of the
+        primary feature from the joint covariance of the observations,
+
+            Delta = max_j [ I(V;X_j') - sum_i I(X_i;X_j') ]
+            Gamma = max_j I(V;X_j')
+
+        with the same lattice correction as psi, (N-1) min_i I(X_i;X_j'),
+        added to Delta if `use_correction` is set.
+
+        Params
+        ------
+        C
+            joint covariance of the observations in the window
+        mu
+            if given, mean of the observations in the window, to compute the
+            local criteria of the latest observation
+
+        Returns
+        ------
+        numpy array with Delta and Gamma
+        """
+        D, N = self.D, self.N
+        Dv = self.idx_VX.shape[1] - D
+        Cxx = submatrices(C, self.idx_XX)
+        Cvx = submatrices(C, self.idx_VX)
+
+        # the marginal blocks of the pairs are shared, so their
+        # log-determinants are computed once per player
+        ld_X  = logdet(Cxx[::N, :D, :D])
+        ld_Xn = logdet(Cxx[:N, D:, D:])
+        ld_XX = logdet(Cxx).reshape(N, N)
+        marginal_mi = 0.5 * (ld_X[:, None] + ld_Xn[None, :] - ld_XX)
+
+        if mu is not None:
+            mi_vx = local_mutual_info(Cvx, mu[self.idx_VX], self.latest[self.idx_VX], Dv)
+            mi_xx = local_mutual_info(Cxx, mu[self.idx_XX], self.latest[self.idx_XX],
+                                      D).reshape(N, N)
+        else:
+            mi_vx = mutual_info(Cvx, Dv)
+            mi_xx = marginal_mi
+
+        delta = mi_vx - np.sum(mi_xx, axis = 0)
+        if self.use_correction:
+            delta += (N - 1) * np.min(marginal_mi, axis = 0)
+
+        return np.array([ np.max(delta), np.max(mi_vx) ])
+
+
+    def exit(self) -> None:
+        """
+        Stop the threads computing the psi of the subgroups, if any. There is
+        no backend to shut down, the NumPy backend runs in-process.
+        """
+        if self.subgroups:
+            self.subgroups.exit()
+
+
+class KSGEmergenceCalculator(EmergenceCalculator):
+    """
+    Emergence calculator computing the MIs with the nonparametric KSG
+    estimators of `camera.core.ksg` instead of Gaussian ones, so that non-linear
+    coordination between the players is captured. It does not need a JVM.
+
+    The joint observations Z = [X_1, ..., X_N, V, V'] of the window are kept in
+    a `RingBuffer`, and the KD-trees are rebuilt from the whole window on every
+    frame psi is computed, since they do not support removing points. The tree
+    of V' is shared by all the MIs. The per-frame cost grows as T log T with the
+    window length T.
+    """
+
+    def __init__(self, *args, k: int = 4, workers: int = 1, **kwargs) -> None:
+        """
+        Params
+        ------
+        k
+            number of nearest neighbours of the KSG estimators
+        workers
+            number of threads used by the neighbour searches, -1 to use all
+            the cores
+
+        The other parameters are the same as for `EmergenceCalculator`.
+        """
+        self.k = k
+        self.workers = workers
+
+        super().__init__(*args, **kwargs)
+
+
+    def start_backend(self) -> None:
+        """
+        Nothing to start, the KSG backend runs in-process.
+        """
+        pass
+
+
+    def initialise_calculators(self, X: np.ndarray, V: np.ndarray) -> None:
+        """
+        Reset the window of joint observations.
+        """
+        self.N, self.D = np.shape(X)
+        self.Dv = np.shape(V)[1]
+
+        d = self.N * self.D + 2 * self.Dv
+        self.observations = RingBuffer(self.observation_window_size, (d,))
+
+        self.is_initialised = True
+
+
+    def params(self) -> np.ndarray:
+        """
+        Parameters which must match for a checkpoint to be resumed.
+        """
+        return np.append(super().params(), self.k)
+
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        State of the calculator to be saved in a checkpoint: the sample counter,
+        the median filter buffer, the previous frame and the observations in
+        the window.
+        """
+        state = { 'sample_counter': np.array(self.sample_counter),
+                  'past_psi_vals':  self.past_psi_vals.array() }
+
+        if self.is_initialised:
+            state['past_X'] = np.asarray(self.past_X, dtype = float)
+            state['past_V'] = np.asarray(self.past_V, dtype = float)
+            state['observations'] = self.observations.array()
+
+        return state
+
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        """
+        Restore the state saved by `state`.
+        """
+        self.reset()
+        self.sample_counter = int(state['sample_counter'])
+        self.past_psi_vals.extend(state['past_psi_vals'])
+
+        if 'past_X' in state:
+            self.past_X = state['past_X']
+            self.past_V = state['past_V']
+            self.initialise_calculators(self.past_X, self.past_V)
+            self.observations.extend(state['observations'])
+
+
+    def update_calculators(self, X: np.ndarray, V: np.ndarray) -> None:
+        """
+        Add the latest observation to the window, dropping the oldest one if
+        the window is full.
+        """
+        past_X = np.asarray(self.past_X, dtype = float)
+
+        if len(past_X) != self.N:
+            logging.info(f'Number of players changed to {len(past_X)}, resetting calculators')
+            self.initialise_calculators(past_X, self.past_V)
+
+        self.observations.append(np.hstack([ past_X.ravel(),
+                                 np.ravel(self.past_V), np.ravel(V) ]).astype(float))
+
+
+    def compute_psi(self, V: np.ndarray) -> float:
+        """
+        Compute psi from the KSG estimates of I(V;V') and I(X_i;V') over the
+        observations in the window.
+        """
+        Z  = self.observations.array()
+        nx = self.N * self.D
+        Xp = Z[:, :nx].reshape(len(Z), self.N, self.D)
+
+        return ksg_psi(Xp, Z[:, nx:nx + self.Dv], Z[:, nx + self.Dv:], self.k,
+                       self.use_correction, self.use_local, self.workers)
+
+
+    def exit(self) -> None:
+        """
+        Nothing to shut down, the KSG backend runs in-process.
+        """
+        pass
+
+
+BACKENDS = {
+    'jidt':  EmergenceCalculator,
+    'numpy': GaussianEmergenceCalculator,
+    'ksg':   KSGEmergenceCalculator,
+}
+
+
+def create_calculator(config: Optional[SimpleNamespace] = None) -> EmergenceCalculator:
+    """
+    Create an emergence calculator with the backend and parameters in `config`.
+    Parameters missing from the config take the values previously hard-coded
+    in the server.
+
+    Params
+    ------
+    config
+        namespace (dot-addressible dict) with the `emergence` section of the
+        YAML config, with the following optional parameters:
+
+        backend : str
+            'jidt' to use the Java toolkit, 'numpy' for the in-process Gaussian
+            backend, 'ksg' for the in-process nearest-neighbour backend
+        macros : list of str
+            names of the macroscopic features in `MACROS`. The NumPy backend
+            computes psi for all of them, the first one driving the returned
+            psi. The JIDT backend only uses the first one
+        groups : int or list of lists of int
+            if set, the NumPy backend also computes psi for subgroups of the
+            players, given either as the number of spatial clusters or as the
+            indices of the players in each group, see `SubgroupEmergence`
+        group_workers : int
+            number of threads computing the psi of the subgroups
+        ksg_neighbours, ksg_workers : int
+            number of nearest neighbours and of search threads of the 'ksg'
+            backend, see `KSGEmergenceCalculator`
+        surrogates, surrogate_mode, significance_interval
+            significance test of psi with the NumPy backend, see
+            `GaussianEmergenceCalculator`
+        scales : list of int
+            other window sizes at which the NumPy backend computes psi
+        use_correction, use_local : bool
+        psi_buffer_size, observation_window_size : int
+        checkpoint_path : str
+        checkpoint_interval : int
+        checkpoint_max_age : float
+            see `EmergenceCalculator`
+
+    Returns
+    ------
+    initialised calculator
+    """
+    if config is None:
+        config = SimpleNamespace()
+
+    backend = getattr(config, 'backend', 'jidt')
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown emergence backend: {backend}')
+
+    macros = getattr(config, 'macros', [ 'centroid' ])
+    kwargs = {}
+    if backend == 'jidt':
+        macros = macros[:1]
+        if getattr(config, 'groups', None):
+            logging.info('The JIDT backend does not compute the psi of subgroups, ignoring groups')
+    elif backend == 'ksg':
+        kwargs['k'] = getattr(config, 'ksg_neighbours', 4)
+        kwargs['workers'] = getattr(config, 'ksg_workers', 1)
+    else:
+        kwargs['groups'] = getattr(config, 'groups', None)
+        kwargs['group_workers'] = getattr(config, 'group_workers', 0)
+        kwargs['surrogates'] = getattr(config, 'surrogates', 0)
+        kwargs['surrogate_mode'] = getattr(config, 'surrogate_mode', 'time')
+        kwargs['significance_interval'] = getattr(config, 'significance_interval', 12)
+        kwargs['scales'] = getattr(config, 'scales', None)
+
+    return BACKENDS[backend](MacroSet(macros), **kwargs,
+        use_correction = getattr(config, 'use_correction', True),
+        psi_buffer_size = getattr(config, 'psi_buffer_size', 36),
+        observation_window_size = getattr(config, 'observation_window_size', 720),
+        use_local = getattr(config, 'use_local', False),
+        checkpoint_path = getattr(config, 'checkpoint_path', ''),
+        checkpoint_interval = getattr(config, 'checkpoint_interval', 120),
+        checkpoint_max_age = getattr(config, 'checkpoint_max_age', 60))
+
+
+def compute_psi_series(
+        X: np.ndarray,
+        macro_fun: Callable[[np.ndarray, np.ndarray], np.ndarray] = compute_macro,
+        use_correction: bool = True,
+        psi_buffer_size : int = 60,
+        observation_window_size : int = 120,
+        use_local : bool = False,
+        batch_size : int = 64
+    ) -> np.ndarray:
+    """
+    Offline equivalent of feeding every frame of `X` to the `update_and_compute`
+    method of a `GaussianEmergenceCalculator`, computing the whole psi series
+    at once from cumulative sums of the observations over strided windows. The
+    same median filter and SAMPLE_THRESHOLD are applied.
+
+    Params
+    ------
+    X
+        numpy array of shape (T, N, D) with the trajectories of N players
+    macro_fun
+        vectorised macro function applied to the whole trajectory at once. If
+        a `MacroSet` of several features is given, they are treated as a
+        single joint macroscopic feature
+    use_correction, psi_buffer_size, observation_window_size, use_local
+        see `EmergenceCalculator`
+    batch_size
+        number of players whose statistics are held in memory at once, to bound
+        memory usage on long recordings
+
+    Returns
+    ------
+    numpy array of shape (T,) with the filtered psi at each frame
+    """
+    X = np.asarray(X, dtype = float)
+    (T, N, D) = X.shape
+
+    dX = np.concatenate([ np.zeros((1, N, D)), np.diff(X, axis = 0) ])
+    V  = np.asarray(macro_fun(X, dX)).reshape(T, -1)
+    Dv = V.shape[1]
+
+    # the observation at frame t pairs (X, V) at frame t-1 with V at frame t,
+    # and psi is only computed for frames t > SAMPLE_THRESHOLD
+    first = SAMPLE_THRESHOLD
+    Vn = V[1:]
+
+    Zv = np.hstack([ V[:-1], Vn ])
+    mu, C = window_statistics(Zv, observation_window_size)
+    mu, C, Zv = mu[first:], C[first:], Zv[first:]
+    if use_local:
+        psi = local_mutual_info(C, mu, Zv, Dv)
+    else:
+        psi = mutual_info(C, Dv)
+
+    min_mi = np.full(len(psi), np.inf)
+    for i in range(0, N, batch_size):
+        Xb = X[:-1, i:i + batch_size]
+        Zx = np.concatenate([ Xb, np.broadcast_to(Vn[:, np.newaxis, :],
+                                  Xb.shape[:2] + (Dv,)) ], axis = 2)
+        mu, C = window_statistics(Zx, observation_window_size)
+        mu, C, Zx = mu[first:], C[first:], Zx[first:]
+
+        marginal_mi = mutual_info(C, D)
+        if use_local:
+            psi -= np.sum(local_mutual_info(C, mu, Zx, D), axis = 1)
+        else:
+            psi -= np.sum(marginal_mi, axis = 1)
+        min_mi = np.minimum(min_mi, np.min(marginal_mi, axis = 1))
+
+    if use_correction:
+        psi += (N - 1) * min_mi
+
+    raw = np.full(T, float(PSI_START))
+    raw[first + 1:] = psi
+
+    return median_filter_series(raw, psi_buffer_size)
+
+
+def median_filter_series(raw: np.ndarray, psi_buffer_size: int) -> np.ndarray:
+    """
+    Offline equivalent of `EmergenceCalculator.filter_psi` over a whole series
+    of raw psi values: median filter over the last psi_buffer_size values,
+    which initially holds PSI_START values.
+    """
+    padded = np.concatenate([ np.full(psi_buffer_size - 1, float(PSI_START)), raw ])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, psi_buffer_size)
+
+    return np.nanmedian(windows, axis = 1)
+
+
+def ksg_psi_frames(
+        Xp: np.ndarray,
+        Vp: np.ndarray,
+        Vn: np.ndarray,
+        frames: np.ndarray,
+        observation_window_size: int,
+        k: int,
+        use_correction: bool,
+        use_local: bool
+    ) -> np.ndarray:
+    """
+    Raw KSG psi at each of the given frames, from the observations up to that
+    frame. Runs in a worker process of `compute_ksg_psi_series`.
+
+    Params
+    ------
+    Xp, Vp, Vn
+        observations of the whole trajectory, where observation t - 1 pairs
+        (X, V) at frame t - 1 with V at frame t
+    frames
+        frames at which to compute psi
+    """
+    psi = np.empty(len(frames))
+    for j, t in enumerate(frames):
+        begin = max(0, t - observation_window_size) if observation_window_size > 0 else 0
+        psi[j] = ksg_psi(Xp[begin:t], Vp[begin:t], Vn[begin:t], k, use_correction, use_local)
+
+    return psi
+
+
+def compute_ksg_psi_series(
+        X: np.ndarray,
+        macro_fun: Callable[[np.ndarray, np.ndarray], np.ndarray] = compute_macro,
+        use_correction: bool = True,
+        psi_buffer_size : int = 60,
+        observation_window_size : int = 120,
+        use_local : bool = False,
+        k : int = 4,
+        processes : Optional[int] = None
+    ) -> np.ndarray:
+    """
+    Offline equivalent of feeding every frame of `X` to the `update_and_compute`
+    method of a `KSGEmergenceCalculator`, with the frames split in contiguous
+    chunks computed in parallel by a process pool.
+
+    Params
+    ------
+    X
+        numpy array of shape (T, N, D) with the trajectories of N players
+    macro_fun
+        vectorised macro function applied to the whole trajectory at once
+    use_correction, psi_buffer_size, observation_window_size, use_local
+        see `EmergenceCalculator`
+    k
+        number of nearest neighbours
+    processes
+        number of worker processes, by default the number of cores. If 1, the
+        series is computed in the calling process
+
+    Returns
+    ------
+    numpy array of shape (T,) with the filtered psi at each frame
+    """
+    X = np.asarray(X, dtype = float)
+    (T, N, D) = X.shape
+
+    dX = np.concatenate([ np.zeros((1, N, D)), np.diff(X, axis = 0) ])
+    V  = np.asarray(macro_fun(X, dX)).reshape(T, -1)
+
+    # psi is computed at frames t > SAMPLE_THRESHOLD from the observations
+    # [0, t) in the window
+    frames = np.arange(SAMPLE_THRESHOLD + 1, T)
+    args = (X[:-1], V[:-1], V[1:])
+    params = (observation_window_size, k, use_correction, use_local)
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(frames) < 2:
+        psi = ksg_psi_frames(*args, frames, *params)
+    else:
+        chunks = [ c for c in np.array_split(frames, processes) if len(c) ]
+        with cf.ProcessPoolExecutor(max_workers = processes) as pool:
+            futures = []
+            for chunk in chunks:
+                # only send each worker the observations its frames need
+                begin = max(0, chunk[0] - observation_window_size) if observation_window_size > 0 else 0
+                futures.append(pool.submit(ksg_psi_frames,
+                    *[ a[begin:chunk[-1]] for a in args ], chunk - begin, *params))
+            psi = np.concatenate([ f.result() for f in futures ])
+
+    raw = np.full(T, float(PSI_START))
+    raw[frames] = psi
+
+    return median_filter_series(raw, psi_buffer_size)
+
+
+def run_calculator(calc: EmergenceCalculator, X: np.ndarray) -> np.ndarray:
+    """
+    Feed each frame of the trajectories `X` of shape (T, N, D) to `calc` and
+    return the non-zero filtered psi values.
+    """
     P = []
     for i in range(len(X)):
         psi = calc.update_and_compute(X[i])
         if psi:
             P.append(psi)
 
+    calc.exit()
+
+    return np.array(P)
+
+
+@click.command()
+@click.option('--filename',  help = 'Numpy array dump of microscopic features of the system', required = True)
+@click.option('--threshold', help = 'Number of timesteps to wait before calculation, at least as many as the dimenstions of the system')
+@click.option('--backend',   help = 'Backend used to compute mutual information', default = 'jidt',
+                             type = click.Choice(list(BACKENDS.keys())))
+@click.option('--compare',   help = 'If set, also run the JIDT backend and compare psi values', is_flag = True, default = False)
+@click.option('--tol',       help = 'Maximum absolute difference in psi accepted when comparing backends', default = 1e-4)
+@click.option('--batch',     help = 'If set, compute the whole psi series at once instead of frame by frame, '
+                                    'in parallel for the ksg backend',
+                             is_flag = True, default = False)
+@click.option('--surrogates', help = 'If set, also test the significance of Gaussian psi every 12 frames against '
+                                     'this number of surrogates, in parallel', default = 0)
+@click.option('--mode',      help = 'Kind of surrogates', default = 'time', type = click.Choice(MODES))
+def test(filename: str, threshold: int = SAMPLE_THRESHOLD, backend: str = 'jidt',
+        compare: bool = False, tol: float = 1e-4, batch: bool = False,
+        surrogates: int = 0, mode: str = 'time') -> None:
+    """
+    Test the emergence calculator on the trajectories specified in `filename`.
+    """
+    X = np.load(filename, allow_pickle=True)
+
+    if surrogates:
+        frames = np.arange(SAMPLE_THRESHOLD + 1, len(X), 12)
+        S = significance_series(X, compute_macro, frames, surrogates = surrogates, mode = mode)
+        np.savetxt(f"{filename.split('.')[0]}-significance.csv", np.column_stack([ frames, S ]),
+                   fmt = [ '%d', '%.8g', '%.8g', '%.8g' ], delimiter = ',',
+                   header = 'frame,psi,z,p', comments = '')
+
+    if batch:
+        P = compute_ksg_psi_series(X) if backend == 'ksg' else compute_psi_series(X)
+        P = P[P != 0]
+    else:
+        calc = BACKENDS[backend](compute_macro)
+        P = run_calculator(calc, X)
+
     np.savetxt(f"{filename.split('.')[0]}-psi.csv", P)
 
-    calc.exit()
+    if compare and (batch or backend != 'jidt'):
+        Q = run_calculator(EmergenceCalculator(compute_macro), X)
+        if P.shape != Q.shape:
+            print(f'Backends produced different number of psi values: {len(P)} and {len(Q)}')
+            exit(1)
+
+        err = np.nanmax(np.abs(P - Q)) if len(P) else 0.0
+        print(f'Maximum absolute difference with jidt: {err}')
+        if err > tol:
+            exit(1)
 
 
 if __name__ == "__main__":
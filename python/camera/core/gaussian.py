@@ -0,0 +1,378 @@
+"""
+Pure-NumPy estimators for the mutual information of jointly Gaussian variables,
+equivalent to the `MutualInfoCalculatorMultiVariateGaussian` class of JIDT but
+operating on (stacks of) covariance matrices directly, so that many calculators
+can be evaluated in a single vectorised call.
+
+All quantities are returned in nats, as in JIDT.
+"""
+
+import numpy as np
+
+from typing import Iterable
+
+from camera.core.buffers import RingBuffer
+
+
+def covariance(Z: np.ndarray) -> np.ndarray:
+    """
+    Compute the sample covariance (normalised by T - 1, as in JIDT) of one or
+    more sets of observations.
+
+    Params
+    ------
+    Z
+        numpy array of shape (..., T, d) containing T observations of a
+        d-dimensional variable, for any number of leading batch dimensions
+
+    Returns
+    ------
+    numpy array of shape (..., d, d) with the covariance matrices
+    """
+    T = Z.shape[-2]
+    Zc = Z - Z.mean(axis = -2, keepdims = True)
+    return np.einsum('...ti,...tj->...ij', Zc, Zc) / (T - 1)
+
+
+def logdet(C: np.ndarray) -> np.ndarray:
+    """
+    Log-determinant of a stack of covariance matrices, or NaN for the matrices
+    which are not positive definite (e.g. not enough observations yet).
+
+    Params
+    ------
+    C
+        numpy array of shape (..., d, d)
+
+    Returns
+    ------
+    numpy array of shape (...)
+    """
+    sign, ld = np.linalg.slogdet(C)
+    return np.where(sign > 0, ld, np.nan)
+
+
+def mutual_info(C: np.ndarray, dx: int) -> np.ndarray:
+    """
+    Average mutual information I(X;Y) between the first `dx` and the remaining
+    dimensions of a Gaussian with covariance `C`.
+
+    Params
+    ------
+    C
+        numpy array of shape (..., dx + dy, dx + dy), joint covariance of X and Y
+    dx
+        number of dimensions of the source variable X
+
+    Returns
+    ------
+    numpy array of shape (...) with the MI in nats
+    """
+    return 0.5 * (logdet(C[..., :dx, :dx]) + logdet(C[..., dx:, dx:]) - logdet(C))
+
+
+def mahalanobis(C: np.ndarray, d: np.ndarray) -> np.ndarray:
+    """
+    Squared Mahalanobis norm d^T C^-1 d of the deviations `d`. If any matrix in
+    the stack is singular, the pseudo-inverse is used for the whole stack.
+
+    Params
+    ------
+    C
+        numpy array of shape (..., k, k)
+    d
+        numpy array of shape (..., k)
+
+    Returns
+    ------
+    numpy array of shape (...)
+    """
+    try:
+        s = np.linalg.solve(C, d[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        s = np.einsum('...ij,...j->...i', np.linalg.pinv(C), d)
+    return np.einsum('...i,...i->...', d, s)
+
+
+def local_mutual_info(
+        C: np.ndarray, mu: np.ndarray, z: np.ndarray, dx: int
+    ) -> np.ndarray:
+    """
+    Local (pointwise) mutual information i(x;y) = log p(x,y) / p(x)p(y) of a new
+    joint observation z = (x, y), under a Gaussian model with mean `mu` and
+    covariance `C` fitted on previous observations. This matches JIDT's
+    `computeLocalUsingPreviousObservations`.
+
+    Params
+    ------
+    C
+        numpy array of shape (..., dx + dy, dx + dy), joint covariance
+    mu
+        numpy array of shape (..., dx + dy), joint mean
+    z
+        numpy array of shape (..., dx + dy), the joint observation to evaluate
+    dx
+        number of dimensions of the source variable X
+
+    Returns
+    ------
+    numpy array of shape (...) with the local MI in nats
+    """
+    d = z - mu
+    m = mahalanobis(C, d) \
+      - mahalanobis(C[..., :dx, :dx], d[..., :dx]) \
+      - mahalanobis(C[..., dx:, dx:], d[..., dx:])
+    return mutual_info(C, dx) - 0.5 * m
+
+
+def window_statistics(Z: np.ndarray, window: int) -> tuple:
+    """
+    Means and covariances of the trailing windows of observations ending at
+    every time step, computed at once from cumulative sums. This is the batch
+    equivalent of feeding every observation to a `RunningCovariance` and
+    evicting those older than `window`.
+
+    Params
+    ------
+    Z
+        numpy array of shape (T, ..., d) with T observations of one or more
+        d-dimensional variables
+    window
+        number of observations in each window. If negative or zero, use all
+        past observations
+
+    Returns
+    ------
+    tuple of numpy arrays of shape (T, ..., d) and (T, ..., d, d) with the mean
+    and covariance of the window ending at each time step
+    """
+    T = Z.shape[0]
+
+    # centre the data to keep the cumulative sums small
+    centre = Z.mean(axis = 0)
+    Zc = Z - centre
+    S1 = np.cumsum(Zc, axis = 0)
+    S2 = np.cumsum(Zc[..., :, np.newaxis] * Zc[..., np.newaxis, :], axis = 0)
+    n = np.arange(1, T + 1, dtype = float)
+
+    if 0 < window < T:
+        S1 = np.concatenate([ S1[:window], S1[window:] - S1[:-window] ])
+        S2 = np.concatenate([ S2[:window], S2[window:] - S2[:-window] ])
+        n  = np.minimum(n, window)
+
+    n = n.reshape((T,) + (1,) * (Z.ndim - 1))
+    m = S1 / n
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        C = (S2 - n[..., np.newaxis] * m[..., :, np.newaxis] * m[..., np.newaxis, :]) \
+          / (n[..., np.newaxis] - 1)
+
+    return centre + m, C
+
+
+class RunningCovariance():
+    """
+    Running sufficient statistics (number of observations, sum and sum of
+    outer products) of one or more sets of d-dimensional observations, from
+    which the mean and covariance can be read at any time. Observations can
+    be added and removed in O(d^2), so a sliding window is updated at a cost
+    independent of its length.
+
+    Observations are shifted by the first one added before accumulating, which
+    keeps the sums small and avoids catastrophic cancellation when computing
+    the covariance from them.
+    """
+
+    def __init__(self, d: int, batch: tuple = ()) -> None:
+        """
+        Params
+        ------
+        d
+            dimension of each observation
+        batch
+            shape of the leading batch dimensions, for stacks of statistics
+            that are updated together
+        """
+        self.d = d
+        self.batch = tuple(batch)
+        self.reset()
+
+
+    def reset(self) -> None:
+        """
+        Drop all observations.
+        """
+        self.n = 0
+        self.shift = None
+        self.S1 = np.zeros(self.batch + (self.d,))
+        self.S2 = np.zeros(self.batch + (self.d, self.d))
+
+
+    def add(self, z: np.ndarray) -> None:
+        """
+        Add one observation of shape (*batch, d).
+        """
+        if self.shift is None:
+            self.shift = np.array(z, dtype = float)
+
+        y = z - self.shift
+        self.n  += 1
+        self.S1 += y
+        self.S2 += y[..., :, np.newaxis] * y[..., np.newaxis, :]
+
+
+    def remove(self, z: np.ndarray) -> None:
+        """
+        Remove one observation of shape (*batch, d) previously added.
+        """
+        y = z - self.shift
+        self.n  -= 1
+        self.S1 -= y
+        self.S2 -= y[..., :, np.newaxis] * y[..., np.newaxis, :]
+
+
+    def mean(self) -> np.ndarray:
+        """
+        Mean of the observations, of shape (*batch, d).
+        """
+        return self.shift + self.S1 / self.n
+
+
+    def covariance(self) -> np.ndarray:
+        """
+        Sample covariance of the observations, normalised by n - 1 as in
+        `covariance`, of shape (*batch, d, d).
+        """
+        m = self.S1 / self.n
+        return (self.S2 - self.n * m[..., :, np.newaxis] * m[..., np.newaxis, :]) / (self.n - 1)
+
+
+class WindowedCovariance():
+    """
+    Running covariances of the latest observations over several window lengths
+    at once. The windows share a single buffer holding the observations of the
+    longest one, and their sums and cross-products are stacked, so that a new
+    observation is accumulated into every window with one vectorised addition,
+    and only the windows which are full evict their oldest observation. The
+    cost per observation is close to that of the longest window alone.
+
+    The statistics of the windows are recomputed from the buffer once every
+    `max(windows)` evictions, to discard the rounding errors they accumulate.
+    """
+
+    def __init__(self, d: int, windows: Iterable[int]) -> None:
+        """
+        Params
+        ------
+        d
+            dimension of each observation
+        windows
+            lengths of the windows. A length of zero or less is an unbounded
+            window over all the observations since the last reset
+        """
+        self.d = d
+        self.windows = np.array(list(windows), dtype = int)
+
+        bounded = self.windows[self.windows > 0]
+        self.maxlen = int(bounded.max()) if len(bounded) else 0
+
+        self.reset()
+
+
+    def reset(self) -> None:
+        """
+        Drop all observations.
+        """
+        K = len(self.windows)
+        self.n = np.zeros(K, dtype = int)
+        self.shift = None
+        self.S1 = np.zeros((K, self.d))
+        self.S2 = np.zeros((K, self.d, self.d))
+
+        # stored observations, only needed when evicting
+        self.observations = RingBuffer(self.maxlen, (self.d,))
+        self.evictions = 0
+
+
+    def add(self, z: np.ndarray) -> None:
+        """
+        Add one observation of shape (d,) to every window, and evict the oldest
+        observation of the windows which are full.
+        """
+        z = np.asarray(z, dtype = float)
+        if self.shift is None:
+            self.shift = z.copy()
+
+        y = z - self.shift
+        self.n  += 1
+        self.S1 += y
+        self.S2 += np.outer(y, y)
+
+        if not self.maxlen:
+            return
+
+        # the oldest observation of a full window of length w is the w-th
+        # latest one before z is stored
+        full = np.flatnonzero((self.windows > 0) & (self.n > self.windows))
+        if len(full):
+            Y = self.observations[-self.windows[full]] - self.shift
+            self.n[full]  -= 1
+            self.S1[full] -= Y
+            self.S2[full] -= Y[:, :, np.newaxis] * Y[:, np.newaxis, :]
+            self.evictions += 1
+
+        self.observations.append(z)
+
+        if self.evictions >= self.maxlen:
+            self.rebuild()
+
+
+    def rebuild(self) -> None:
+        """
+        Recompute the statistics of the bounded windows from the buffer.
+        """
+        Y = self.observations.array() - self.shift
+        for k, w in enumerate(self.windows):
+            if w > 0:
+                Yk = Y[max(0, len(Y) - w):]
+                self.n[k]  = len(Yk)
+                self.S1[k] = Yk.sum(axis = 0)
+                self.S2[k] = Yk.T @ Yk
+
+        self.evictions = 0
+
+
+    def mean(self) -> np.ndarray:
+        """
+        Mean of the observations in each window, of shape (K, d).
+        """
+        return self.shift + self.S1 / self.n[:, np.newaxis]
+
+
+    def covariance(self) -> np.ndarray:
+        """
+        Sample covariance of the observations in each window, normalised by
+        n - 1 as in `covariance`, of shape (K, d, d).
+        """
+        n = self.n[:, np.newaxis, np.newaxis]
+        m = self.S1[:, np.newaxis, :] / n
+        return (self.S2 - n * np.swapaxes(m, 1, 2) * m) / (n - 1)
+
+
+def submatrices(C: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """
+    Extract the square blocks of the covariance matrix `C` indexed by each row
+    of `idx` in a single vectorised call.
+
+    Params
+    ------
+    C
+        numpy array of shape (..., d, d)
+    idx
+        integer numpy array of shape (B, k), each row indexing k of the d
+        dimensions of C
+
+    Returns
+    ------
+    numpy array of shape (..., B, k, k)
+    """
+    return C[..., idx[:, :, np.newaxis], idx[:, np.newaxis, :]]
@@ -0,0 +1,283 @@
+"""
+Emergence of subgroups of players, e.g. teams or spatial clusters, computed
+alongside the emergence of all the players.
+
+The macroscopic feature of a subgroup g is the centroid V_g of its players,
+which is a linear function A_g of the positions. The covariance of the group
+variables [X_i for i in g, V_g, V_g'] is then A_g C A_g^T, where C is the joint
+covariance of the positions of all the players at consecutive frames [X, X'],
+so every subgroup is computed from the statistics already accumulated for the
+whole floor, without a calculator of its own.
+"""
+
+import logging
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+
+# initialise logging to file
+import camera.core.logger
+
+from camera.core.gaussian import local_mutual_info, mutual_info
+
+
+def group_projection(members: np.ndarray, N: int, D: int) -> np.ndarray:
+    """
+    Linear map from the positions of all the players at consecutive frames
+    [X, X'], of dimension 2ND, to the variables of a subgroup
+    [X_i for i in members, V_g, V_g'], of dimension (n + 2)D, where V_g is the
+    centroid of the subgroup.
+
+    Params
+    ------
+    members
+        indices of the n players in the subgroup
+    N, D
+        number of players and dimension of their positions
+
+    Returns
+    ------
+    numpy array of shape ((n + 2)D, 2ND)
+    """
+    n = len(members)
+    A = np.zeros((n + 2, D, 2, N, D))
+    eye = np.eye(D)
+
+    A[np.arange(n), :, 0, members, :] = eye
+    A[n,     :, 0, members, :] = eye / n
+    A[n + 1, :, 1, members, :] = eye / n
+
+    return A.reshape((n + 2) * D, 2 * N * D)
+
+
+def group_psi(
+        C: np.ndarray,
+        members: np.ndarray,
+        D: int,
+        use_correction: bool = True,
+        mu: Optional[np.ndarray] = None,
+        z: Optional[np.ndarray] = None
+    ) -> float:
+    """
+    Compute psi of a subgroup of players with the centroid as macroscopic
+    feature, from the joint covariance of the positions of all the players.
+
+    Params
+    ------
+    C
+        numpy array of shape (2ND, 2ND), covariance of [X, X']
+    members
+        indices of the players in the subgroup
+    D
+        dimension of the positions
+    use_correction
+        whether to use the 1st-order lattice correction
+    mu, z
+        if given, mean of [X, X'] and latest observation of [X, X'], to
+        compute the local psi of the latest observation
+
+    Returns
+    ------
+    psi of the subgroup, or NaN if it has fewer than two players
+    """
+    n = len(members)
+    if n < 2:
+        return np.nan
+
+    N = C.shape[0] // (2 * D)
+    A = group_projection(members, N, D)
+    Cg = A @ C @ A.T
+
+    # (X_i, V_g') blocks of every player and (V_g, V_g') block
+    idx_Xi = np.arange(n * D).reshape(n, D)
+    idx_Vn = np.broadcast_to(np.arange((n + 1) * D, (n + 2) * D), (n, D))
+    idx_X  = np.hstack([ idx_Xi, idx_Vn ])
+    idx_V  = np.arange(n * D, (n + 2) * D)
+
+    Cx = Cg[idx_X[:, :, None], idx_X[:, None, :]]
+    Cv = Cg[idx_V[:, None], idx_V[None, :]]
+
+    marginal_mi = mutual_info(Cx, D)
+
+    if mu is not None:
+        mu, z = A @ mu, A @ z
+        psi = local_mutual_info(Cv, mu[idx_V], z[idx_V], D) \
+            - np.sum(local_mutual_info(Cx, mu[idx_X], z[idx_X], D))
+    else:
+        psi = mutual_info(Cv, D) - np.sum(marginal_mi)
+
+    if use_correction:
+        psi += (n - 1) * np.min(marginal_mi)
+
+    return float(psi)
+
+
+def cluster_players(
+        P: np.ndarray,
+        k: int,
+        centres: Optional[np.ndarray] = None,
+        iterations: int = 10
+    ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split the players into k spatial clusters with k-means.
+
+    Params
+    ------
+    P
+        numpy array of shape (N, D) with the positions of the players
+    k
+        number of clusters
+    centres
+        numpy array of shape (k, D) with the centres of the clusters found on
+        the previous frame, so that clusters keep their labels over time. If
+        None, the centres are initialised with farthest point sampling
+    iterations
+        number of k-means iterations
+
+    Returns
+    ------
+    labels
+        numpy array of shape (N,) with the cluster of each player
+    centres
+        numpy array of shape (k, D) with the centres of the clusters
+    """
+    P = np.asarray(P, dtype = float)
+    k = min(k, len(P))
+
+    if centres is None or len(centres) != k:
+        chosen = [ 0 ]
+        d = np.linalg.norm(P - P[0], axis = -1)
+        for _ in range(1, k):
+            chosen.append(int(np.argmax(d)))
+            d = np.minimum(d, np.linalg.norm(P - P[chosen[-1]], axis = -1))
+        centres = P[chosen]
+
+    centres = np.array(centres, dtype = float)
+    for _ in range(iterations):
+        labels = np.argmin(np.linalg.norm(P[:, None, :] - centres[None, :, :], axis = -1), axis = 1)
+        counts = np.bincount(labels, minlength = k)
+        sums = np.zeros_like(centres)
+        np.add.at(sums, labels, P)
+        # empty clusters keep their previous centre
+        nonempty = counts > 0
+        centres[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+    return labels, centres
+
+
+class SubgroupEmergence():
+    def __init__(self,
+            groups: Union[int, List[List[int]]],
+            workers: int = 0,
+            use_correction: bool = True,
+            use_local: bool = False
+        ) -> None:
+        """
+        Computes psi for subgroups of the players from the joint covariance of
+        the positions of all the players at consecutive frames. The subgroups
+        are computed in parallel by a pool of worker threads, since NumPy
+        releases the GIL in the linear algebra.
+
+        Params
+        ------
+        groups
+            either a list of lists with the indices of the players in each
+            group, e.g. one list per team, or the number of spatial clusters
+            into which the players are split with k-means on their average
+            positions over the observation window
+        workers
+            number of worker threads. If 0, the subgroups are computed in the
+            calling thread
+        use_correction, use_local
+            see `EmergenceCalculator`
+        """
+        if isinstance(groups, int):
+            if groups < 1:
+                raise ValueError(f'Invalid number of player clusters: {groups}')
+            self.k = groups
+            self.mapping = None
+        else:
+            self.k = len(groups)
+            self.mapping = [ np.asarray(g, dtype = int) for g in groups ]
+
+        self.names = [ str(g) for g in range(self.k) ]
+        self.use_correction = use_correction
+        self.use_local = use_local
+
+        self.pool = ThreadPoolExecutor(max_workers = workers) if workers > 0 else None
+        self.centres = None
+
+        logging.info(f'Computing emergence of {self.k} subgroups with {workers} workers')
+
+
+    def reset(self) -> None:
+        """
+        Forget the spatial clusters of the previous session.
+        """
+        self.centres = None
+
+
+    def members(self, P: np.ndarray) -> List[np.ndarray]:
+        """
+        Indices of the players in each subgroup.
+
+        Params
+        ------
+        P
+            numpy array of shape (N, D) with the average positions of the
+            players, used for spatial clustering
+
+        Returns
+        ------
+        list with one array of player indices per subgroup
+        """
+        N = len(P)
+        if self.mapping is not None:
+            return [ g[g < N] for g in self.mapping ]
+
+        labels, self.centres = cluster_players(P, self.k, self.centres)
+        members = [ np.flatnonzero(labels == g) for g in range(len(self.centres)) ]
+        return members + [ np.array([], dtype = int) ] * (self.k - len(members))
+
+
+    def compute(self, C: np.ndarray, mu: np.ndarray, z: np.ndarray, D: int) -> np.ndarray:
+        """
+        Compute psi of every subgroup.
+
+        Params
+        ------
+        C
+            numpy array of shape (2ND, 2ND), covariance of [X, X']
+        mu, z
+            numpy arrays of shape (2ND,), mean of [X, X'] over the observation
+            window and latest observation
+        D
+            dimension of the positions
+
+        Returns
+        ------
+        numpy array of shape (k,) with psi of each subgroup, NaN for the
+        subgroups with fewer than two players
+        """
+        N = len(mu) // (2 * D)
+        members = self.members(mu[:N * D].reshape(N, D))
+
+        def job(g: np.ndarray) -> float:
+            if self.use_local:
+                return group_psi(C, g, D, self.use_correction, mu, z)
+            return group_psi(C, g, D, self.use_correction)
+
+        if self.pool is None:
+            return np.array([ job(g) for g in members ])
+
+        return np.array(list(self.pool.map(job, members)))
+
+
+    def exit(self) -> None:
+        """
+        Stop the worker threads.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
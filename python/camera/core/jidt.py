@@ -0,0 +1,91 @@
+"""
+Transfer layer between NumPy and the Java Information Dynamics Toolkit (JIDT),
+called through JPype.
+
+The JVM is managed process-wide: it can be started in the background ahead of
+its first use, is shared by all the calculators created in the process, and is
+only shut down when the process exits, since JPype cannot restart a JVM.
+
+Arrays are handed to JPype as contiguous float64 buffers, which JPype copies
+into Java arrays in bulk without going through Python lists, and whole
+observation windows are added to the JIDT calculators in a single call.
+"""
+
+import atexit
+import jpype as jp
+import logging
+import numpy as np
+import os
+import threading
+
+INFODYNAMICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'infodynamics.jar')
+GAUSSIAN_MI_CALCULATOR = 'infodynamics.measures.continuous.gaussian.MutualInfoCalculatorMultiVariateGaussian'
+
+jvm_lock = threading.Lock()
+
+
+def start_jvm() -> None:
+    """
+    Start the JVM with JIDT on the classpath, unless it is already running. If
+    the JVM is being started by another thread, wait for it to be ready. The
+    JVM is shut down when the process exits.
+    """
+    with jvm_lock:
+        if jp.isJVMStarted():
+            return
+
+        logging.info('Starting JVM...')
+        jp.startJVM(jp.getDefaultJVMPath(), '-ea', '-Djava.class.path=%s'%INFODYNAMICS_PATH)
+        # load the calculator class now rather than on the first frame
+        jp.JClass(GAUSSIAN_MI_CALCULATOR)
+        atexit.register(shutdown_jvm)
+        logging.info('JVM started using jpype1')
+
+
+def warm_up_jvm() -> threading.Thread:
+    """
+    Start the JVM in a background thread, so that it is ready by the time the
+    first calculator is created.
+
+    Returns
+    ------
+    the thread starting the JVM
+    """
+    thread = threading.Thread(target = start_jvm, daemon = True)
+    thread.start()
+    return thread
+
+
+def shutdown_jvm() -> None:
+    """
+    Gracefully shut down the JVM. Registered to run at process exit.
+    """
+    if jp.isJVMStarted():
+        logging.info('Shutting down JVM...')
+        jp.shutdownJVM()
+
+
+def javify(Xi: np.ndarray) -> jp.JArray:
+    """
+    Convert a numpy array into a Java array to pass to the JIDT classes and
+    functions.
+    Given a 1-dimensional np array of shape (D,)  , return Java array of size 1xD
+    Given a 2-dimensional np array of shape (T, D), return Java array of size TxD
+
+    The data is passed to JPype as a contiguous float64 buffer, which is copied
+    to the JVM in bulk rather than element by element.
+
+    Params
+    ------
+    Xi
+        numpy array of shape (D,) or (T,D) representing one or more observations
+        of one 'micro' part of the system or of the macroscopic feature
+
+    Returns
+    ------
+    jXi
+        the Xi array cast to a Java double[][] array
+    """
+    Xi = np.ascontiguousarray(np.atleast_2d(Xi), dtype = np.float64)
+    return jp.JArray.of(Xi)
+
@@ -0,0 +1,186 @@
+"""
+Kraskov-Stoegbauer-Grassberger (KSG) nearest-neighbour estimators of mutual
+information, following algorithm 1 of:
+
+Kraskov A, Stoegbauer H, Grassberger P (2004) Estimating mutual information.
+Physical Review E 69(6): 066138.
+
+as the `MutualInfoCalculatorMultiVariateKraskov1` class of JIDT, including the
+small noise it adds to the observations to break ties. Unlike the
+Gaussian estimators, they capture non-linear dependencies between the players.
+The neighbour searches use KD-trees from `scipy.spatial` with the max-norm, and
+the trees of variables shared by several MIs, such as the future macroscopic
+feature, are only built once per window.
+
+All quantities are returned in nats, as in JIDT.
+"""
+
+import numpy as np
+
+from scipy.spatial import cKDTree
+from scipy.special import digamma
+from typing import Optional
+
+# standard deviation of the noise added to the normalised observations, as the
+# NOISE_LEVEL_TO_ADD property of JIDT
+NOISE_LEVEL = 1e-8
+
+
+def normalise(Z: np.ndarray) -> np.ndarray:
+    """
+    Scale every column of the observations Z of shape (T, d) to zero mean and
+    unit variance, as JIDT does by default, so that the max-norm weighs all
+    dimensions equally. Constant columns are only centred.
+    """
+    std = Z.std(axis = 0, ddof = 1)
+    return (Z - Z.mean(axis = 0)) / np.where(std > 0, std, 1.0)
+
+
+def add_noise(Z: np.ndarray, level: float = NOISE_LEVEL, seed: int = 0) -> np.ndarray:
+    """
+    Add Gaussian noise of `level` times the standard deviation of every column
+    (1 for constant columns) to the observations Z of shape (T, d), as JIDT
+    does by default. Pixel-quantised or stationary positions are at exactly
+    equal distances, which biases the neighbour counts within the strict
+    radius, and the noise breaks these ties. The seed is fixed, so that the
+    estimates are reproducible.
+    """
+    std = Z.std(axis = 0, ddof = 1)
+    rng = np.random.default_rng(seed)
+    return Z + level * np.where(std > 0, std, 1.0) * rng.standard_normal(Z.shape)
+
+
+def neighbour_counts(tree: cKDTree, Z: np.ndarray, eps: np.ndarray, workers: int = 1) -> np.ndarray:
+    """
+    Number of points of `tree` strictly closer than `eps` to each point of Z in
+    the max-norm, not counting the point itself.
+
+    Params
+    ------
+    tree
+        KD-tree built on the observations Z of a marginal variable
+    Z
+        numpy array of shape (T, d) with the observations
+    eps
+        numpy array of shape (T,) with the search radius around each point
+    workers
+        number of threads used by the search, -1 to use all the cores
+
+    Returns
+    ------
+    numpy array of shape (T,)
+    """
+    # the radius is inclusive, so shrink it to the next smaller float
+    r = np.nextafter(eps, 0)
+    return tree.query_ball_point(Z, r, p = np.inf, return_length = True, workers = workers) - 1
+
+
+def local_ksg_mutual_info(
+        X: np.ndarray,
+        Y: np.ndarray,
+        k: int = 4,
+        workers: int = 1,
+        tree_x: Optional[cKDTree] = None,
+        tree_y: Optional[cKDTree] = None
+    ) -> np.ndarray:
+    """
+    Local KSG mutual information I(X;Y) of every observation, whose average is
+    the KSG estimate of I(X;Y).
+
+    Params
+    ------
+    X, Y
+        numpy arrays of shape (T, dx) and (T, dy) with T paired observations,
+        already normalised
+    k
+        number of nearest neighbours in the joint space
+    workers
+        number of threads used by the neighbour searches, -1 to use all cores
+    tree_x, tree_y
+        KD-trees of X and Y, if already built to be shared with other MIs
+
+    Returns
+    ------
+    numpy array of shape (T,) with the local MI in nats
+    """
+    T = len(X)
+    XY = np.hstack([ X, Y ])
+
+    # distance to the k-th neighbour in the joint space, excluding the point
+    eps = cKDTree(XY).query(XY, k = [ k + 1 ], p = np.inf, workers = workers)[0][:, 0]
+
+    tree_x = cKDTree(X) if tree_x is None else tree_x
+    tree_y = cKDTree(Y) if tree_y is None else tree_y
+    nx = neighbour_counts(tree_x, X, eps, workers)
+    ny = neighbour_counts(tree_y, Y, eps, workers)
+
+    return digamma(k) + digamma(T) - digamma(nx + 1) - digamma(ny + 1)
+
+
+def ksg_mutual_info(X: np.ndarray, Y: np.ndarray, k: int = 4, workers: int = 1, **kwargs) -> float:
+    """
+    KSG estimate of the mutual information I(X;Y), see `local_ksg_mutual_info`.
+    """
+    return float(np.mean(local_ksg_mutual_info(X, Y, k, workers, **kwargs)))
+
+
+def ksg_psi(
+        Xp: np.ndarray,
+        Vp: np.ndarray,
+        Vn: np.ndarray,
+        k: int = 4,
+        use_correction: bool = True,
+        use_local: bool = False,
+        workers: int = 1,
+        noise: float = NOISE_LEVEL
+    ) -> float:
+    """
+    Compute psi from one window of observations with KSG estimators of the
+    macro-to-macro MI I(V;V') and the micro-to-macro MIs I(X_i;V'). The tree of
+    the future macroscopic feature V' is shared by all the MIs.
+
+    Params
+    ------
+    Xp
+        numpy array of shape (T, N, D) with the positions of the players
+    Vp, Vn
+        numpy arrays of shape (T, Dv) with the macroscopic feature at the same
+        frames as Xp and at the next frames
+    k
+        number of nearest neighbours
+    use_correction
+        whether to use the 1st-order lattice correction
+    use_local
+        if true, psi of the latest observation from the local MIs, otherwise
+        psi of the window from the average MIs
+    workers
+        number of threads used by the neighbour searches, -1 to use all cores
+    noise
+        relative level of the noise added to the normalised observations to
+        break ties, see `add_noise`, 0 to disable it
+
+    Returns
+    ------
+    psi in nats
+    """
+    T, N, D = Xp.shape
+    Z = normalise(np.hstack([ Xp.reshape(T, N * D), Vp, Vn ]))
+    if noise > 0:
+        Z = add_noise(Z, noise)
+    Xp = Z[:, :N * D].reshape(T, N, D)
+    Vp, Vn = np.split(Z[:, N * D:], 2, axis = 1)
+
+    tree_vn = cKDTree(Vn)
+    summary = (lambda mi: mi[-1]) if use_local else np.mean
+
+    psi = summary(local_ksg_mutual_info(Vp, Vn, k, workers, tree_y = tree_vn))
+    marginal_mi = np.empty(N)
+    for i in range(N):
+        local_mi = local_ksg_mutual_info(Xp[:, i], Vn, k, workers, tree_y = tree_vn)
+        marginal_mi[i] = np.mean(local_mi)
+        psi -= summary(local_mi)
+
+    if use_correction:
+        psi += (N - 1) * np.min(marginal_mi)
+
+    return float(psi)
@@ -0,0 +1,104 @@
+"""
+Library of vectorised macroscopic features of the positions of the players,
+used as the supervenient feature V in the computation of emergence.
+
+Every feature takes the positions X and the displacements dX since the previous
+frame as numpy arrays of shape (..., N, D), and returns a numpy array of shape
+(..., Dv), so the same functions apply to a single frame of shape (N, D) or to
+a whole trajectory of shape (T, N, D).
+"""
+
+import numpy as np
+
+from typing import Callable, Dict, List
+
+
+def centroid(X: np.ndarray, dX: np.ndarray) -> np.ndarray:
+    """
+    Centre of mass of the players, of shape (..., D).
+    """
+    return X.mean(axis = -2)
+
+
+def mean_velocity(X: np.ndarray, dX: np.ndarray) -> np.ndarray:
+    """
+    Average velocity of the players, i.e. velocity of the centre of mass, of
+    shape (..., D).
+    """
+    return dX.mean(axis = -2)
+
+
+def polarisation(X: np.ndarray, dX: np.ndarray) -> np.ndarray:
+    """
+    Norm of the average heading of the players, of shape (..., 1), from 0 when
+    players move in all directions to 1 when they all move in the same
+    direction. Players that did not move do not contribute a heading.
+    """
+    speed = np.linalg.norm(dX, axis = -1, keepdims = True)
+    heading = np.divide(dX, speed, out = np.zeros_like(dX), where = speed > 0)
+    return np.linalg.norm(heading.mean(axis = -2), axis = -1, keepdims = True)
+
+
+def angular_momentum(X: np.ndarray, dX: np.ndarray) -> np.ndarray:
+    """
+    Average angular momentum of the players around their centre of mass in the
+    plane of the first two dimensions, of shape (..., 1). Positive when the
+    group rotates anticlockwise.
+    """
+    r = X - X.mean(axis = -2, keepdims = True)
+    L = r[..., 0] * dX[..., 1] - r[..., 1] * dX[..., 0]
+    return L.mean(axis = -1)[..., np.newaxis]
+
+
+def dispersion(X: np.ndarray, dX: np.ndarray) -> np.ndarray:
+    """
+    Root mean square distance of the players from their centre of mass, of
+    shape (..., 1).
+    """
+    r = X - X.mean(axis = -2, keepdims = True)
+    return np.sqrt(np.mean(np.sum(r ** 2, axis = -1), axis = -1))[..., np.newaxis]
+
+
+MACROS: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    'centroid':         centroid,
+    'mean_velocity':    mean_velocity,
+    'polarisation':     polarisation,
+    'angular_momentum': angular_momentum,
+    'dispersion':       dispersion,
+}
+
+
+class MacroSet():
+    def __init__(self, names: List[str], D: int = 2) -> None:
+        """
+        Several macroscopic features from `MACROS` evaluated together, and
+        concatenated into a single vector, so that a calculator can compute
+        emergence for all of them from the same statistics of the micro parts.
+
+        Params
+        ------
+        names
+            names of the features in `MACROS`. The first one is the primary
+            feature of the set
+        D
+            dimension of the position of each player
+        """
+        for name in names:
+            if name not in MACROS:
+                raise ValueError(f'Unknown macro feature: {name}')
+
+        self.names = list(names)
+
+        # dimension of each feature, from a dummy frame of two players
+        X = np.zeros((2, D))
+        dims = [ MACROS[name](X, X).shape[-1] for name in self.names ]
+        ends = np.cumsum(dims).tolist()
+        self.slices = [ slice(e - d, e) for d, e in zip(dims, ends) ]
+
+
+    def __call__(self, X: np.ndarray, dX: np.ndarray) -> np.ndarray:
+        """
+        Evaluate all the features on positions X and displacements dX of shape
+        (..., N, D), and return their concatenation of shape (..., Dv).
+        """
+        return np.concatenate([ MACROS[name](X, dX) for name in self.names ], axis = -1)
@@ -0,0 +1,187 @@
+"""
+Staged processing of a stream of frames, with each stage in its own thread and
+the stages connected by bounded queues, so that e.g. the detection of a frame
+overlaps the tracking of the previous one. OpenCV and NumPy release the GIL
+during their heavy calls, so the stages run on several cores.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from typing import Any, Callable, Dict, List, Tuple
+
+# initialise logging to file
+import camera.core.logger
+
+
+# passed down through every stage at the end of the stream
+_END = object()
+
+
+class Pipeline():
+    def __init__(self,
+            source: Callable[[], Any],
+            stages: List[Tuple[str, Callable[[Any], Any]]],
+            queue_size: int = 2,
+            smoothing: float = 0.05
+        ) -> None:
+        """
+        Runs a source of items and the stages processing them each in its own
+        thread, connected by FIFO queues. Every item goes through the stages in
+        the order in which it was produced, as each stage is a single thread.
+
+        Params
+        ------
+        source
+            function returning the next item of the stream, e.g. a frame, or
+            None at the end of the stream. It runs as the 'capture' stage
+        stages
+            list of (name, function) pairs. Each function takes the item
+            returned by the previous stage, and returns the item passed to the
+            next one, or None to drop it
+        queue_size
+            maximum number of items waiting before each stage. When a stage
+            falls behind, the stages before it block rather than dropping items
+        smoothing
+            weight of the latest item in the moving averages of the stage times
+        """
+        self.source = source
+        self.stages = [ ('capture', source) ] + list(stages)
+        self.queues = [ queue.Queue(maxsize = queue_size) for _ in stages ]
+        self.smoothing = smoothing
+
+        self.stopped = threading.Event()
+        self.threads = []
+        self.times = { name: 0.0 for name, _ in self.stages }
+        self.items = { name: 0 for name, _ in self.stages }
+        self.started = None
+
+
+    def start(self) -> 'Pipeline':
+        """
+        Start the threads of all the stages.
+        """
+        self.started = time.perf_counter()
+        self.threads = [ threading.Thread(target = self.run_stage, args = (i,), daemon = True)
+                         for i in range(len(self.stages)) ]
+        for thread in self.threads:
+            thread.start()
+
+        return self
+
+
+    def run(self) -> None:
+        """
+        Process the whole stream on the calling thread instead, one stage after
+        the other, with the same statistics, e.g. as a baseline for `start`.
+        """
+        self.started = time.perf_counter()
+        while not self.stopped.is_set():
+            item = self.process('capture', self.source)
+            if item is None:
+                return
+
+            for name, function in self.stages[1:]:
+                if item is None:
+                    break
+                item = self.process(name, function, item)
+
+
+    def process(self, name: str, function: Callable, *args) -> Any:
+        """
+        Call the function of a stage and update its moving average time. If it
+        fails, the error is logged, the item is dropped and the pipeline stops.
+        """
+        begin = time.perf_counter()
+        try:
+            item = function(*args)
+        except Exception:
+            logging.exception(f'Pipeline stage {name} failed, stopping')
+            self.stopped.set()
+            return None
+
+        elapsed = time.perf_counter() - begin
+        n = self.items[name]
+        self.times[name] = elapsed if not n else \
+            (1 - self.smoothing) * self.times[name] + self.smoothing * elapsed
+        self.items[name] = n + 1
+
+        return item
+
+
+    def run_stage(self, i: int) -> None:
+        """
+        Main loop of the i-th stage. Once the pipeline is stopped, the source
+        ends the stream, and the other stages drop the items still queued
+        until the end of the stream reaches them.
+        """
+        name, function = self.stages[i]
+        inbox  = self.queues[i - 1] if i > 0 else None
+        outbox = self.queues[i] if i < len(self.queues) else None
+
+        while True:
+            if inbox is None:
+                item = None if self.stopped.is_set() else self.process(name, function)
+                if item is None:
+                    item = _END
+            else:
+                item = inbox.get()
+                if item is not _END:
+                    item = None if self.stopped.is_set() else self.process(name, function, item)
+
+            if item is not None and outbox is not None:
+                outbox.put(item)
+
+            if item is _END:
+                return
+
+
+    def is_alive(self) -> bool:
+        """
+        Whether the stream has not reached the end of the last stage.
+        """
+        return any(thread.is_alive() for thread in self.threads)
+
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stop the pipeline, dropping the items in progress, and wait for the
+        threads of the stages to exit.
+        """
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Throughput and per-stage statistics of the pipeline
+
+        Returns
+        ------
+            dict with the average 'fps' through the last stage since the start,
+            and 'stages' mapping the name of each stage to its moving average
+            time per item 'ms', the number of 'items' it processed, and the
+            number of items 'queued' before it
+        """
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        last = self.stages[-1][0]
+
+        stages = {}
+        for i, (name, _) in enumerate(self.stages):
+            stages[name] = { 'ms': 1000 * self.times[name], 'items': self.items[name],
+                             'queued': self.queues[i - 1].qsize() if i > 0 else 0 }
+
+        return { 'fps': self.items[last] / elapsed if elapsed else 0.0, 'stages': stages }
+
+
+    def log_stats(self) -> None:
+        """
+        Write the throughput and per-stage statistics to the logfile.
+        """
+        stats = self.stats()
+        stages = ', '.join(f"{name} {s['ms']:.2f} ms ({s['queued']} queued)"
+                           for name, s in stats['stages'].items())
+        logging.info(f"Pipeline at {stats['fps']:.1f} fps: {stages}")
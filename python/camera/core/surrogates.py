@@ -0,0 +1,260 @@
+"""
+Significance of psi against surrogate data in which the coordination measured
+by psi is destroyed. Surrogates of a window of observations are generated as
+stacked arrays with one leading dimension per surrogate, and their Gaussian psi
+is computed in one vectorised pass rather than by re-running a calculator.
+
+Two kinds of surrogates are supported:
+
+'time'    the future macroscopic feature V' is shuffled in time with respect to
+          the micro and macro variables of the previous frame (X, V), so that
+          neither predicts it, as in the significance tests of JIDT
+'player'  the trajectory of each player is circularly shifted by an independent
+          random lag, keeping the dynamics of every player but destroying their
+          coordination, and the macroscopic feature is recomputed
+"""
+
+import concurrent.futures as cf
+import numpy as np
+import os
+
+from typing import Callable, Optional, Tuple
+
+from camera.core.gaussian import covariance, mutual_info
+
+MODES = [ 'time', 'player' ]
+
+
+def gaussian_psi(Xp: np.ndarray, Vp: np.ndarray, Vn: np.ndarray, use_correction: bool = True) -> np.ndarray:
+    """
+    Gaussian psi of stacks of windows of observations.
+
+    Params
+    ------
+    Xp
+        numpy array of shape (..., T, N, D) with the positions of the players
+    Vp, Vn
+        numpy arrays of shape (..., T, Dv) with the macroscopic feature at the
+        same frames as Xp and at the next frames
+    use_correction
+        whether to use the 1st-order lattice correction
+
+    Returns
+    ------
+    numpy array of shape (...) with psi of each window
+    """
+    N, D = Xp.shape[-2:]
+    Dv = Vp.shape[-1]
+
+    psi = mutual_info(covariance(np.concatenate([ Vp, Vn ], axis = -1)), Dv)
+
+    # (..., N, T, D + Dv) observations of (X_i, V') for every player
+    Xi = np.moveaxis(Xp, -2, -3)
+    Zx = np.concatenate([ Xi, np.broadcast_to(Vn[..., np.newaxis, :, :], Xi.shape[:-1] + (Dv,)) ], axis = -1)
+    marginal_mi = mutual_info(covariance(Zx), D)
+
+    psi = psi - np.sum(marginal_mi, axis = -1)
+    if use_correction:
+        psi = psi + (N - 1) * np.min(marginal_mi, axis = -1)
+
+    return psi
+
+
+def time_shuffles(T: int, surrogates: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Independent random permutations of T frames, of shape (surrogates, T).
+    """
+    return rng.permuted(np.broadcast_to(np.arange(T), (surrogates, T)), axis = 1)
+
+
+def player_shifts(P: np.ndarray, surrogates: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Circularly shift the trajectory of each player by an independent random
+    lag.
+
+    Params
+    ------
+    P
+        numpy array of shape (T, N, D) with the positions of the players
+    surrogates
+        number of surrogate trajectories
+
+    Returns
+    ------
+    numpy array of shape (surrogates, T, N, D)
+    """
+    T, N = P.shape[:2]
+    lags = rng.integers(0, T, size = (surrogates, 1, N))
+    frames = (np.arange(T)[np.newaxis, :, np.newaxis] + lags) % T
+    return P[frames, np.arange(N)]
+
+
+def surrogate_psi(
+        P: np.ndarray,
+        V: np.ndarray,
+        macro_fun: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        surrogates: int,
+        mode: str = 'time',
+        use_correction: bool = True,
+        rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+    """
+    Psi of surrogates of a window of contiguous frames.
+
+    Params
+    ------
+    P
+        numpy array of shape (T + 1, N, D) with the positions of the players
+        on the frames of the window
+    V
+        numpy array of shape (T + 1, Dv) with the macroscopic feature on the
+        same frames
+    macro_fun
+        vectorised macro function, used to recompute the macroscopic feature
+        of the 'player' surrogates. Its output is truncated to the first Dv
+        dimensions, i.e. the primary feature of a `MacroSet`
+    surrogates
+        number of surrogates
+    mode
+        'time' or 'player', see `MODES`
+    use_correction
+        whether to use the 1st-order lattice correction
+    rng
+        random generator
+
+    Returns
+    ------
+    numpy array of shape (surrogates,) with the psi of every surrogate
+    """
+    if mode not in MODES:
+        raise ValueError(f'Unknown surrogate mode: {mode}')
+
+    rng = np.random.default_rng() if rng is None else rng
+
+    if mode == 'time':
+        perm = time_shuffles(len(V) - 1, surrogates, rng)
+        Xp = np.broadcast_to(P[:-1], (surrogates,) + P[:-1].shape)
+        Vp = np.broadcast_to(V[:-1], (surrogates,) + V[:-1].shape)
+        return gaussian_psi(Xp, Vp, V[1:][perm], use_correction)
+
+    Ps = player_shifts(P, surrogates, rng)
+    dX = np.diff(Ps, axis = 1)
+    Vs = np.asarray(macro_fun(Ps[:, 1:], dX)).reshape(dX.shape[:2] + (-1,))[..., :V.shape[-1]]
+
+    # the first frame has no displacement, so the observations start at the
+    # second frame
+    return gaussian_psi(Ps[:, 1:-1], Vs[:, :-1], Vs[:, 1:], use_correction)
+
+
+def significance(psi: float, null: np.ndarray) -> Tuple[float, float]:
+    """
+    Z-score of psi and one-sided p-value of psi being above chance, against the
+    psi of the surrogates.
+
+    Returns
+    ------
+    tuple with the z-score and the p-value
+    """
+    null = null[np.isfinite(null)]
+    if not len(null) or not np.isfinite(psi):
+        return np.nan, np.nan
+
+    std = np.std(null, ddof = 1) if len(null) > 1 else 0.0
+    z = (psi - np.mean(null)) / std if std > 0 else np.nan
+    p = (1 + np.sum(null >= psi)) / (1 + len(null))
+
+    return float(z), float(p)
+
+
+def significance_frames(
+        X: np.ndarray,
+        V: np.ndarray,
+        frames: np.ndarray,
+        macro_fun: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        observation_window_size: int,
+        surrogates: int,
+        mode: str,
+        use_correction: bool,
+        seed: int
+    ) -> np.ndarray:
+    """
+    Psi of the window ending at each of the given frames, with its z-score and
+    p-value against surrogates of the window. Runs in a worker process of
+    `significance_series`.
+
+    Returns
+    ------
+    numpy array of shape (len(frames), 3) with psi, z-score and p-value
+    """
+    rng = np.random.default_rng(seed)
+    out = np.empty((len(frames), 3))
+
+    for j, t in enumerate(frames):
+        begin = max(0, t - observation_window_size)
+        P, W = X[begin:t + 1], V[begin:t + 1]
+        psi = float(gaussian_psi(P[:-1], W[:-1], W[1:], use_correction))
+        null = surrogate_psi(P, W, macro_fun, surrogates, mode, use_correction, rng)
+        out[j] = (psi,) + significance(psi, null)
+
+    return out
+
+
+def significance_series(
+        X: np.ndarray,
+        macro_fun: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        frames: np.ndarray,
+        observation_window_size: int = 120,
+        surrogates: int = 100,
+        mode: str = 'time',
+        use_correction: bool = True,
+        processes: Optional[int] = None,
+        seed: int = 0
+    ) -> np.ndarray:
+    """
+    Offline significance of psi over a recording, with the frames split in
+    contiguous chunks computed in parallel by a process pool.
+
+    Params
+    ------
+    X
+        numpy array of shape (T, N, D) with the trajectories of N players
+    macro_fun
+        vectorised macro function applied to the whole trajectory at once
+    frames
+        frames at which to test the psi of the window ending on that frame
+    observation_window_size
+        number of observations in each window
+    surrogates, mode, use_correction
+        see `surrogate_psi`
+    processes
+        number of worker processes, by default the number of cores. If 1, the
+        series is computed in the calling process
+    seed
+        seed of the random generators, offset by the index of each chunk
+
+    Returns
+    ------
+    numpy array of shape (len(frames), 3) with psi, z-score and p-value
+    """
+    X = np.asarray(X, dtype = float)
+    (T, N, D) = X.shape
+
+    dX = np.concatenate([ np.zeros((1, N, D)), np.diff(X, axis = 0) ])
+    V  = np.asarray(macro_fun(X, dX)).reshape(T, -1)
+
+    args = (macro_fun, observation_window_size, surrogates, mode, use_correction)
+
+    processes = processes or os.cpu_count() or 1
+    chunks = [ c for c in np.array_split(np.asarray(frames), processes) if len(c) ]
+    if processes == 1 or len(chunks) < 2:
+        return significance_frames(X, V, np.asarray(frames), *args, seed)
+
+    with cf.ProcessPoolExecutor(max_workers = processes) as pool:
+        futures = []
+        for i, chunk in enumerate(chunks):
+            # only send each worker the frames its windows need
+            begin = max(0, chunk[0] - observation_window_size)
+            futures.append(pool.submit(significance_frames, X[begin:chunk[-1] + 1],
+                V[begin:chunk[-1] + 1], chunk - begin, *args, seed + i))
+
+        return np.concatenate([ f.result() for f in futures ])
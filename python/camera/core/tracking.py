@@ -3,7 +3,7 @@ from types import SimpleNamespace
 import numpy as np
 from scipy.spatial import distance as dist
 from scipy.optimize import linear_sum_assignment
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 # initialise logging to file
 import camera.core.logger
@@ -26,6 +26,10 @@ class EuclideanMultiTracker():
         self.detected  = []
         self.momodels  = []
 
+        # number of tracked objects without a matching detection in the last
+        # update
+        self.lost = 0
+
         self.num_players  = config.max_players
 
         self.MoMoClass = KFMotionModel
@@ -53,8 +57,17 @@ class EuclideanMultiTracker():
         del self.detected[obj]
 
 
+    def predict_bboxes(self) -> List[Tuple[float, float, float, float]]:
+        """
+        Bounding boxes of the tracked objects in the next frame, as predicted by
+        their motion models, e.g. to only look for them in the surrounding
+        regions of the frame.
+        """
+        return [ mm.predict_bbox() for mm in self.momodels ]
+
+
     def update(
-            self, bboxes: List[Tuple[float, float, float, float]]
+            self, bboxes: Union[np.ndarray, List[Tuple[float, float, float, float]]]
         ) -> List[Tuple[float, float, float, float]]:
         """
         Update centre of mass position of each object in the tracker, depending
@@ -63,23 +76,26 @@ class EuclideanMultiTracker():
         Params
         ------
         bboxes
-            bounding boxes returned by an object detector, list of tuples
-            with form (x, y, w, h)
+            bounding boxes returned by an object detector, numpy array of
+            shape (K, 4) or list of tuples with form (x, y, w, h)
 
         Returns
         ------
         the dictionary of tracked objects
         """
+        bboxes = np.asarray(bboxes, dtype = float).reshape(-1, 4)
 
         if len(self.momodels) == 0:
             # No momodels so far -- initialise one for each bbox
             logging.info("First detection, initialising motion models")
             self.momodels = [self.MoMoClass(bb) for bb in bboxes]
-            self.detected = bboxes
+            self.detected = list(bboxes)
+            self.lost = 0
 
         elif len(bboxes) == 0:
             # No bboxes detected -- update all models manually
             logging.info("Nothing detected, using all motion models")
+            self.lost = len(self.momodels)
             for i, mm in enumerate(self.momodels):
                 self.detected[i] = mm.predict_bbox()
                 mm.update(self.detected[i])
@@ -92,8 +108,7 @@ class EuclideanMultiTracker():
             num_momodels   = len(self.momodels)
             predicted_pos = np.array([mm.predict() for mm in self.momodels])
 
-            cmass = lambda x, y, w, h: np.array([x + w/2, y + h/2])
-            new_cmass = np.array([ cmass(*bbox) for bbox in bboxes ])
+            new_cmass = bboxes[:, :2] + bboxes[:, 2:] / 2
 
             # we compute Euclidean distances between all pairs of new and old
             # centres of mass
@@ -104,7 +119,7 @@ class EuclideanMultiTracker():
             rows, cols = linear_sum_assignment(dists)
             A = np.zeros([num_momodels, num_detections])
             A[rows, cols] = 1
-
+            self.lost = num_momodels - len(rows)
 
             # match detected bboxes against known motion models. If a motion
             # model has no matching detection, update with its mean prediction
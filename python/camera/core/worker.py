@@ -0,0 +1,317 @@
+import logging
+import multiprocessing as mp
+import numpy as np
+import queue
+
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, Optional
+
+# initialise logging to file
+import camera.core.logger
+
+from camera.core.emergence import PSI_START, create_calculator
+
+POLICIES = [ 'skip', 'coalesce' ]
+
+
+def run_worker(config: Optional[SimpleNamespace], policy: str,
+        inbox: mp.Queue, outbox: mp.Queue, session: int = 0) -> None:
+    """
+    Main loop of the emergence worker process. Creates an emergence calculator
+    from `config`, then computes psi for every array of positions received in
+    `inbox` and publishes the results in `outbox`, until None is received. If
+    'reset' is received, the calculator is reset to start a new session, and if
+    'resume' is received it is resumed from its latest checkpoint. The results
+    are tagged with the session, counted from `session`.
+
+    With the 'coalesce' policy, if several frames are waiting in the inbox only
+    the most recent one is processed and the older ones are discarded.
+
+    If computing psi fails on a frame, the error is logged and counted, and the
+    frame is skipped.
+    """
+    calc = create_calculator(config)
+    processed = 0
+    coalesced = 0
+    failed    = 0
+
+    while True:
+        X = inbox.get()
+
+        if policy == 'coalesce':
+            try:
+                while isinstance(X, np.ndarray):
+                    X_next = inbox.get_nowait()
+                    if isinstance(X_next, np.ndarray):
+                        coalesced += 1
+                    X = X_next
+            except queue.Empty:
+                pass
+
+        if X is None:
+            break
+
+        if isinstance(X, str) and X == 'reset':
+            calc.reset()
+            session += 1
+            processed = 0
+            coalesced = 0
+            failed    = 0
+            continue
+
+        if isinstance(X, str) and X == 'resume':
+            calc.resume()
+            continue
+
+        try:
+            psi = calc.update_and_compute(X)
+        except Exception:
+            failed += 1
+            logging.exception(f'Emergence worker failed on frame {processed + failed}, skipping it')
+            outbox.put({ 'session': session, 'failed': failed })
+            continue
+        processed += 1
+
+        outbox.put({ 'session': session, 'psi': psi,
+                     'macro_psi': getattr(calc, 'macro_psi', {}),
+                     'group_psi': getattr(calc, 'group_psi', {}),
+                     'scale_psi': getattr(calc, 'scale_psi', {}),
+                     'delta': getattr(calc, 'delta', np.nan),
+                     'gamma': getattr(calc, 'gamma', np.nan),
+                     'psi_z': getattr(calc, 'psi_z', np.nan),
+                     'psi_p': getattr(calc, 'psi_p', np.nan),
+                     'processed': processed, 'coalesced': coalesced, 'failed': failed })
+
+    calc.exit()
+    logging.info(f'Emergence worker exiting after {processed} frames, {coalesced} coalesced, '
+                 f'{failed} failed')
+
+
+class EmergenceWorker():
+    def __init__(self,
+            config: Optional[SimpleNamespace] = None,
+            queue_size: int = 4,
+            policy: str = 'coalesce'
+        ) -> None:
+        """
+        Runs an emergence calculator in a dedicated process, so that the cost
+        of computing psi does not stall the tracking loop. Positions are fed to
+        the worker through a bounded queue, and the latest psi is published
+        back. It exposes the same `update_and_compute`, `reset` and `exit`
+        methods as `EmergenceCalculator`, but `update_and_compute` never blocks.
+        The worker process can be reset and reused across sessions, so that the
+        calculator backend, e.g. the JVM, is only started once.
+
+        Params
+        ------
+        config
+            namespace (dot-addressible dict) with the `emergence` section of the
+            YAML config, used to create the calculator in the worker process
+        queue_size
+            maximum number of frames waiting to be processed by the worker
+        policy
+            what to do when the worker falls behind:
+
+            'skip'      frames submitted while the queue is full are dropped
+            'coalesce'  as 'skip', and the worker also only processes the most
+                        recent of the frames waiting in the queue
+        """
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown emergence worker policy: {policy}')
+
+        self.config = config
+        self.queue_size = queue_size
+        self.policy = policy
+
+        self.session = 0
+        self.psi = float(PSI_START)
+        self.macro_psi = {}
+        self.group_psi = {}
+        self.scale_psi = {}
+        self.delta = np.nan
+        self.gamma = np.nan
+        self.psi_z = np.nan
+        self.psi_p = np.nan
+        self.submitted = 0
+        self.skipped   = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.failed    = 0
+
+        self.start()
+
+
+    def start(self) -> None:
+        """
+        Start a worker process with new queues, its results tagged with the
+        current session.
+        """
+        ctx = mp.get_context('spawn')
+        self.inbox  = ctx.Queue(maxsize = self.queue_size)
+        self.outbox = ctx.Queue()
+        self.process = ctx.Process(target = run_worker,
+            args = (self.config, self.policy, self.inbox, self.outbox, self.session), daemon = True)
+
+        self.process.start()
+        # cleared when the worker is stopped, so that it is only reported
+        # dead if it exits on its own
+        self.running = True
+
+        logging.info(f'Started emergence worker with queue size {self.queue_size} '
+                     f'and policy {self.policy}')
+
+
+    def send(self, message: str) -> None:
+        """
+        Send a control message to the worker process without blocking. If the
+        process died, a new one is started first. Otherwise the frames waiting
+        in its inbox are dropped, as they are superseded by the message.
+        """
+        if not self.process.is_alive():
+            logging.info(f'Emergence worker is dead, restarting it: {self.stats()}')
+            # the frames left in the old inbox will never be read
+            self.inbox.cancel_join_thread()
+            self.start()
+        else:
+            try:
+                while True:
+                    self.inbox.get_nowait()
+                    self.skipped += 1
+            except queue.Empty:
+                pass
+
+        try:
+            self.inbox.put(message, timeout = 1)
+        except queue.Full:
+            logging.info(f'Emergence worker inbox full, dropping {message}')
+
+
+    def poll(self) -> float:
+        """
+        Collect all the results published by the worker since the last call,
+        and return the latest psi. If the worker process died, it is logged
+        once, and the last psi it published is returned from then on.
+        """
+        try:
+            while True:
+                result = self.outbox.get_nowait()
+                # ignore results from before the last reset
+                if result['session'] != self.session:
+                    continue
+                self.failed = result['failed']
+                if 'psi' not in result:
+                    continue
+                self.psi = result['psi']
+                self.macro_psi = result['macro_psi']
+                self.group_psi = result['group_psi']
+                self.scale_psi = result['scale_psi']
+                self.delta = result['delta']
+                self.gamma = result['gamma']
+                self.psi_z = result['psi_z']
+                self.psi_p = result['psi_p']
+                self.processed = result['processed']
+                self.coalesced = result['coalesced']
+        except queue.Empty:
+            pass
+
+        if self.running and not self.process.is_alive():
+            self.running = False
+            logging.info(f'Emergence worker died with exit code {self.process.exitcode}: {self.stats()}')
+
+        return self.psi
+
+
+    def update_and_compute(self, X: Iterable[np.ndarray]) -> float:
+        """
+        Submit the positions of the current frame to the worker, or drop them
+        if the worker is behind, and return the latest psi it published.
+        """
+        try:
+            # copy, as the queue pickles the frame later in a feeder thread
+            # and the caller may reuse its buffer for the next frame
+            self.inbox.put_nowait(np.array(X, dtype = float))
+            self.submitted += 1
+        except queue.Full:
+            self.skipped += 1
+
+        if (self.submitted + self.skipped) % 120 == 0 and self.skipped + self.coalesced:
+            logging.info(f'Emergence worker behind: {self.stats()}')
+
+        return self.poll()
+
+
+    def reset(self) -> None:
+        """
+        Reset the calculator in the worker process and the counters, to start
+        a new session. If the worker process died, a new one is started.
+        """
+        logging.info(f'Resetting emergence worker: {self.stats()}')
+
+        self.send('reset')
+        self.session += 1
+        self.psi = float(PSI_START)
+        self.macro_psi = {}
+        self.group_psi = {}
+        self.scale_psi = {}
+        self.delta = np.nan
+        self.gamma = np.nan
+        self.psi_z = np.nan
+        self.psi_p = np.nan
+        self.submitted = 0
+        self.skipped   = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.failed    = 0
+
+
+    def resume(self) -> None:
+        """
+        Resume the calculator in the worker process from its latest checkpoint,
+        if there is a recent enough one.
+        """
+        self.send('resume')
+
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of frames submitted to the worker, skipped because its queue
+        was full, processed, discarded by coalescing, and on which computing
+        psi failed, and whether the worker process is alive.
+        """
+        return { 'submitted': self.submitted, 'skipped': self.skipped,
+                 'processed': self.processed, 'coalesced': self.coalesced,
+                 'failed': self.failed, 'alive': self.process.is_alive() }
+
+
+    def exit(self) -> None:
+        """
+        Stop the worker process after the frames in its queue are processed.
+        """
+        self.running = False
+        if not self.process.is_alive():
+            return
+
+        # make room for the sentinel if the queue is full
+        try:
+            self.inbox.put(None, timeout = 1)
+        except queue.Full:
+            try:
+                self.inbox.get_nowait()
+                self.skipped += 1
+            except queue.Empty:
+                pass
+            self.inbox.put(None)
+
+        # keep draining the results, or the worker cannot flush them and exit
+        for _ in range(50):
+            self.poll()
+            self.process.join(timeout = 0.1)
+            if not self.process.is_alive():
+                break
+
+        if self.process.is_alive():
+            logging.info('Emergence worker did not exit, terminating')
+            self.process.terminate()
+
+        self.poll()
+        logging.info(f'Stopped emergence worker: {self.stats()}')
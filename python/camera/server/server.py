@@ -54,8 +54,20 @@ def create_app(server_type, conf, conf_path, camera_stream=None):
 
     @app.route("/sync")
     def return_sync():
+        # the headsets expect a bare number, the details are opt-in
+        if request.args.get('detail'):
+            return jsonify(proc.sync_detail())
+        # a window size can be picked per request, e.g. /sync?scale=120
+        scale = request.args.get('scale')
+        if scale == proc.window or scale in proc.scale_psi:
+            return jsonify(proc.scale_sync(scale))
         return jsonify(proc.Sync)
 
+    @app.route("/pipeline")
+    def pipeline_stats():
+        # throughput, per-stage timing and queue depths of the pipelined mode
+        return jsonify(proc.pipeline_stats())
+
     @app.route("/start_tracking")
     def start_tracking():
         if not proc.running:
@@ -104,15 +116,19 @@ def create_app(server_type, conf, conf_path, camera_stream=None):
     @app.route("/observe", methods = ['GET', 'POST'])
     def observe():
         if request.method == "POST":
-            psi = int(request.form.get("manPsi"))
-            use_psi = request.form.get("psi")
-
-            if use_psi:
-                proc.task = 'emergence'
+            if "scale" in request.form:
+                proc.set_scale(request.form["scale"])
             else:
-                proc.set_manual_psi(psi)
-            return render_template("observe.html", running_text=is_running(), psi=proc.psi, task=proc.task)
-        return render_template("observe.html", running_text=is_running(), psi=proc.psi, task=proc.task)
+                psi = int(request.form.get("manPsi"))
+                use_psi = request.form.get("psi")
+
+                if use_psi:
+                    proc.task = 'emergence'
+                else:
+                    proc.set_manual_psi(psi)
+        return render_template("observe.html", running_text=is_running(), psi=proc.psi,
+            task=proc.task, macro_psi=proc.macro_psi, delta=proc.delta, gamma=proc.gamma,
+            psi_z=proc.psi_z, psi_p=proc.psi_p, scale_psi=proc.scale_psi, scale=proc.scale)
 
     @app.route("/video_feed")
     def video_feed():
@@ -8,19 +8,98 @@ import os
 import threading
 import time
 from types import SimpleNamespace
-from typing import Any, Dict, List, Tuple, Generator
+from typing import Any, Dict, List, Optional, Tuple, Generator
 
 # initialise logging to file
 import camera.core.logger
 
 # import relevant project libs
-from camera.tools.colour   import hex_to_hsv
+from camera.tools.colour   import bgr_to_i420, hex_to_hsv, i420_to_bgr
 from camera.tools.config   import parse, unwrap_resolution
-from camera.core.emergence import EmergenceCalculator, compute_macro
-from camera.core.detection import Detector
+from camera.core.emergence import create_calculator
+from camera.core.jidt      import warm_up_jvm
+from camera.core.worker    import EmergenceWorker
+from camera.core.detection import create_detector
+from camera.core.pipeline  import Pipeline
 from camera.core.tracking  import EuclideanMultiTracker
 
 
+class PiYUVStream():
+    def __init__(self, resolution: Tuple[int, int], framerate: int) -> None:
+        """
+        Threaded PiCamera stream, as `imutils.video.PiVideoStream`, but
+        capturing the unencoded YUV420 output of the camera instead of BGR.
+
+        Frames are numpy arrays of shape (3h/2, w) in the I420 format, as taken
+        by a `YUVDetector`. The camera pads the width and height of the planes
+        to multiples of 32 and 16, which are cropped back to the resolution.
+
+        Params
+        ------
+        resolution
+            tuple (width, height) of the frames
+        framerate
+            number of frames per second
+        """
+        from picamera import PiCamera
+
+        self.camera = PiCamera(resolution = resolution, framerate = framerate)
+        self.w, self.h = resolution
+        self.fw = (self.w + 31) // 32 * 32
+        self.fh = (self.h + 15) // 16 * 16
+        self.buffer = np.empty(self.fw * self.fh * 3 // 2, dtype = np.uint8)
+
+        self.frame = None
+        self.stopped = False
+
+
+    def start(self) -> 'PiYUVStream':
+        """
+        Start capturing frames in a background thread.
+        """
+        threading.Thread(target = self.update, daemon = True).start()
+        return self
+
+
+    def update(self) -> None:
+        """
+        Capture frames into the buffer until the stream is stopped.
+        """
+        for _ in self.camera.capture_continuous(self.buffer, format = 'yuv', use_video_port = True):
+            self.frame = self.crop(self.buffer)
+
+            if self.stopped:
+                self.camera.close()
+                return
+
+
+    def crop(self, buffer: np.ndarray) -> np.ndarray:
+        """
+        I420 frame of the resolution of the stream from the padded planes in
+        `buffer`.
+        """
+        fw, fh, w, h = self.fw, self.fh, self.w, self.h
+        Y = buffer[:fw * fh].reshape(fh, fw)[:h, :w]
+        U = buffer[fw * fh:fw * fh * 5 // 4].reshape(fh // 2, fw // 2)[:h // 2, :w // 2]
+        V = buffer[fw * fh * 5 // 4:].reshape(fh // 2, fw // 2)[:h // 2, :w // 2]
+
+        return np.concatenate([ Y.ravel(), U.ravel(), V.ravel() ]).reshape(h * 3 // 2, w)
+
+
+    def read(self) -> np.ndarray:
+        """
+        Latest frame captured.
+        """
+        return self.frame
+
+
+    def stop(self) -> None:
+        """
+        Stop capturing frames and close the camera.
+        """
+        self.stopped = True
+
+
 class Camera():
     def __init__(self, cam_type: Any, config: SimpleNamespace, camera_stream = None) -> None:
         """
@@ -41,10 +120,15 @@ class Camera():
             framerate  : int
             iso, shutter_speed, saturation: int
             awb_mode: string
+            format: string
+                'bgr' for BGR frames, or 'yuv' for I420 frames, captured as
+                such by a PiCamera and converted from BGR for videos
+                (default: 'bgr')
         """
         self.config = config
         self.cam_type = cam_type
         self.camera_stream = camera_stream
+        self.yuv = getattr(config, 'format', 'bgr') == 'yuv'
 
 
     def start(self) -> VideoStream:
@@ -61,7 +145,17 @@ class Camera():
         ------
         video stream containing the frames fetched from the camera or video
         """
-        if self.cam_type == 'pi':
+        if self.cam_type == 'pi' and self.yuv:
+            resolution = unwrap_resolution(self.config.resolution)
+            self.video_stream_obj = PiYUVStream(resolution, self.config.framerate)
+            self.video_stream = self.video_stream_obj.start()
+            self.picamera = self.video_stream_obj.camera
+
+            ## set picam defaults
+            self.update_settings(self.config)
+
+            time.sleep(2)
+        elif self.cam_type == 'pi':
             resolution = unwrap_resolution(self.config.resolution)
             self.video_stream_obj = VideoStream(usePiCamera = 1,
                 resolution = resolution, framerate = self.config.framerate)
@@ -73,13 +167,18 @@ class Camera():
 
             time.sleep(2)
         elif type(self.cam_type) is int:
+            if self.yuv:
+                raise ValueError('YUV frames are only supported with a PiCamera or a video file')
             self.video_stream = self.camera_stream
             self.video_stream.start()
         else:
             if not os.path.isfile(self.cam_type):
                 raise ValueError(f'No such file: {self.cam_type}')
 
-            self.video_stream = FileVideoStream(self.cam_type).start()
+            # convert the frames of the video in the reader thread, to test
+            # the YUV pipeline offline
+            transform = bgr_to_i420 if self.yuv else None
+            self.video_stream = FileVideoStream(self.cam_type, transform = transform).start()
 
         return self.video_stream
 
@@ -123,6 +222,10 @@ class VideoProcessor():
                 if ''          no task, used for calibration phase
                 if 'emergence' use the EmergenceCalculator to compute sync
                 if 'manual'    use a slider in the Web UI to set sync
+            config.emergence
+                used in the initialisation of the EmergenceCalculator, includes
+                the backend ('jidt' or 'numpy') and calculator parameters, and
+                whether to run it in a separate worker process
             config.camera
                 used in the initialisation of the Camera object, includes camera
                 parameters (iso, shutter speed etc), and video parameters
@@ -147,10 +250,15 @@ class VideoProcessor():
         self.task = self.config.game.task
         self.camera_stream  = camera_stream
 
+        # whether the camera produces I420 frames, which are only converted
+        # to BGR to be recorded or streamed
+        self.yuv = getattr(self.config.camera, 'format', 'bgr') == 'yuv'
+
         # initialize the output frame and a lock used to ensure thread-safe
         # exchanges of the output frames (useful when multiple browsers/tabs
         # are viewing the stream)
         self.output_frame = None
+        self.output_annotations = ([], '')
 
         self.video_stream = None
         self.video_writer = None
@@ -158,8 +266,79 @@ class VideoProcessor():
         self.tracking_thread = threading.Thread(target = self.tracking)
         self.lock = threading.Lock()
 
+        # held while the tracker is updated or read, as the detection of the
+        # next frame reads its predictions when the frames are pipelined
+        self.tracker_lock = threading.Lock()
+        self.pipeline = None
+
         self.calc = None
         self.psi = 0.0
+        self.macro_psi = {}
+        self.group_psi = {}
+        self.scale_psi = {}
+        self.delta = np.nan
+        self.gamma = np.nan
+        self.psi_z = np.nan
+        self.psi_p = np.nan
+
+        # observation window size whose psi drives the headsets, if psi is
+        # computed at several window sizes, and that of `psi`
+        self.window = str(getattr(getattr(self.config, 'emergence', None),
+                                  'observation_window_size', ''))
+        self.scale = self.window
+
+        # centres of mass of the tracked players, reused across frames
+        self.X = np.empty((self.config.tracking.max_players, 2))
+
+        # start the emergence backend at boot, so that the first run does not
+        # wait for it, and share it across runs
+        if self.task == 'emergence':
+            emergence_conf = getattr(self.config, 'emergence', None)
+            if getattr(emergence_conf, 'worker', False):
+                self.create_calculator()
+            elif getattr(emergence_conf, 'backend', 'jidt') == 'jidt':
+                warm_up_jvm()
+
+
+    def create_calculator(self) -> None:
+        """
+        Create the emergence calculator with the parameters in config.emergence,
+        either in-process or in a separate worker process.
+        """
+        emergence_conf = getattr(self.config, 'emergence', None)
+        if getattr(emergence_conf, 'worker', False):
+            # compute emergence in a separate process, so that tracking keeps
+            # its frame rate however long psi takes
+            self.calc = EmergenceWorker(emergence_conf,
+                queue_size = getattr(emergence_conf, 'queue_size', 4),
+                policy = getattr(emergence_conf, 'policy', 'coalesce'))
+        else:
+            self.calc = create_calculator(emergence_conf)
+
+
+    def centres(self, boxes: List[Tuple[float, float, float, float]]) -> np.ndarray:
+        """
+        Compute the centres of mass of the bounding boxes of the tracked players
+        into the preallocated array `X`.
+
+        Params
+        ------
+        boxes
+            list of tuples (x, y, w, h)
+
+        Returns
+        ------
+        numpy array of shape (N, 2), a view of `X` valid until the next call
+        """
+        boxes = np.asarray(boxes, dtype = float)
+        if len(boxes) > len(self.X):
+            self.X = np.empty((len(boxes), 2))
+
+        X = self.X[:len(boxes)]
+        np.multiply(boxes[:, 2:], 0.5, out = X)
+        X += boxes[:, :2]
+
+        return X
 
 
     @property
@@ -175,14 +354,80 @@ class VideoProcessor():
         ------
             synch param between 0 (unsync) and 1 (full sync)
         """
+        if self.task == 'emergence':
+            return self.scale_sync(self.scale)
+        return self.psi_to_sync(self.psi)
+
+
+    def scale_sync(self, scale: str) -> float:
+        """
+        Synchronisation param from the psi at the observation window size
+        `scale`, or from `psi` if it is that of the config or psi is not
+        computed at that size
+        """
+        if scale != self.window and scale in self.scale_psi:
+            return self.psi_to_sync(float(self.scale_psi[scale]))
+        return self.psi_to_sync(self.psi)
+
+
+    def psi_to_sync(self, psi: float) -> float:
+        """
+        Map a value of psi to a synchronisation param for the current task
+        """
         if self.task == 'manual':
-            return self.psi / 10.0
+            return psi / 10.0
         elif self.task == 'emergence':
             a = 0
             b = 3
-            return 1.0 / (1 + np.exp((self.psi - a) / b))
+            return 1.0 / (1 + np.exp((psi - a) / b))
         else:
-            return self.psi
+            return psi
+
+
+    def sync_detail(self) -> Dict[str, Any]:
+        """
+        Synchronisation param with the values it is computed from, the other
+        PhiID criteria, and the synchronisation param of each subgroup of
+        players, if any
+
+        Returns
+        ------
+            dict with the global 'sync', 'psi', 'delta' and 'gamma', the
+            z-score 'psi_z' and p-value 'psi_p' of psi against surrogates,
+            'scales' mapping each observation window size to its 'sync' and
+            'psi' and 'scale' the one driving 'sync', and 'groups' mapping the
+            name of each subgroup to its 'sync' and 'psi'.
+            Values which are not available, e.g. for subgroups without enough
+            players or backends not computing them, are null
+        """
+        finite = lambda x: float(x) if np.isfinite(x) else None
+
+        groups = {}
+        for name, psi in self.group_psi.items():
+            psi = finite(psi)
+            sync = self.psi_to_sync(psi) if psi is not None else None
+            groups[name] = { 'sync': sync, 'psi': psi }
+
+        scales = {}
+        for name, psi in self.scale_psi.items():
+            psi = finite(psi)
+            sync = self.psi_to_sync(psi) if psi is not None else None
+            scales[name] = { 'sync': sync, 'psi': psi }
+
+        return { 'sync': float(self.Sync), 'psi': float(self.psi),
+                 'scale': self.scale, 'scales': scales,
+                 'delta': finite(self.delta), 'gamma': finite(self.gamma),
+                 'psi_z': finite(self.psi_z), 'psi_p': finite(self.psi_p),
+                 'groups': groups }
+
+
+    def set_scale(self, scale: str) -> None:
+        """
+        Pick the observation window size whose psi drives the headsets, among
+        the window sizes at which psi is computed.
+        """
+        self.scale = str(scale)
+        logging.info(f"Setting the observation window size driving sync to {scale}")
 
 
     def set_manual_psi(self, psi: float) -> None:
@@ -243,7 +488,7 @@ class VideoProcessor():
         self.config.detection.min_colour  = parse(hex_to_hsv(min_colour))
         self.config.detection.max_colour  = parse(hex_to_hsv(max_colour))
 
-        self.detector = Detector(self.config.detection)
+        self.detector = create_detector(self.config.detection, self.yuv)
 
         logging.info(f"Updated detector from Web UI and reinitialised:")
         logging.info(f"  min_contour : {min_contour} ")
@@ -294,6 +539,10 @@ class VideoProcessor():
         new frame and track. Annotate image and produce a streamable output
         via the global `output_frame` variable.
 
+        If `tracking.pipeline` is set, the capture, detection, tracking and
+        annotation of the frames run in a `Pipeline` instead, see
+        `pipelined_tracking`.
+
         Params
         ------
             None
@@ -310,11 +559,11 @@ class VideoProcessor():
             - updates the positions dict every frame
             - logs tracked positions to log file
         """
+        if getattr(self.config.tracking, 'pipeline', False):
+            return self.pipelined_tracking()
+
         # read the first frame and detect objects
-        with self.lock:
-            frame = self.video_stream.read()
-            if self.record:
-                self.video_writer.write(frame)
+        frame = self.capture()
 
         if frame is None:
             logging.info('Error reading first frame. Exiting.')
@@ -323,43 +572,174 @@ class VideoProcessor():
         bboxes  = self.detector.detect_colour(frame)
         self.positions = self.tracker.update(bboxes)
 
-        if self.config.tracking.annotate:
-            frame = self.detector.draw_annotations(frame, self.positions)
-
-        # acquire the lock, set the output frame, and release the lock
-        with self.lock:
-            self.output_frame = frame.copy()
+        self.publish(frame, self.positions)
 
         # loop over frames from the video stream and track
         while self.running:
+            frame = self.capture()
+
+            if frame is not None:
+                self.annotate(self.track(self.detect(frame)))
+
+
+    def pipelined_tracking(self) -> None:
+        """
+        Tracking process with the capture, detection, tracking and annotation
+        of the frames each in its own thread, connected by queues of at most
+        `tracking.pipeline_queue_size` frames, so that e.g. the detection of a
+        frame overlaps the tracking and emergence of the previous one. The
+        frames go through every stage in order. In the ROI mode, the windows of
+        a frame are predicted by the tracker updated with the frames before it
+        which have been tracked yet, so a margin of a few frames is needed.
+        The pipeline ends at the first frame which cannot be read, e.g. at the
+        end of a video file.
+
+        The per-stage timing and queue depths are logged every
+        `tracking.pipeline_log_interval` seconds, and available from
+        `pipeline_stats`.
+        """
+        queue_size = getattr(self.config.tracking, 'pipeline_queue_size', 2)
+        interval = getattr(self.config.tracking, 'pipeline_log_interval', 10)
+
+        self.pipeline = Pipeline(self.capture, [ ('detect', self.detect),
+            ('track', self.track), ('annotate', self.annotate) ], queue_size).start()
+
+        logged = time.time()
+        while self.running and self.pipeline.is_alive():
+            time.sleep(0.1)
+            if time.time() - logged >= interval:
+                self.pipeline.log_stats()
+                logged = time.time()
+
+        self.pipeline.stop()
+        self.pipeline.log_stats()
+
+
+    def pipeline_stats(self) -> Dict[str, Any]:
+        """
+        Throughput, per-stage timing and queue depths of the pipeline, see
+        `Pipeline.stats`, or an empty dict if the frames are not pipelined.
+        """
+        return self.pipeline.stats() if self.pipeline else {}
+
+
+    def capture(self) -> Optional[np.ndarray]:
+        """
+        Read the next frame of the video stream, and record it if set.
+        """
+        with self.lock:
+            frame = self.video_stream.read()
+
+            if frame is not None and self.record:
+                self.video_writer.write(self.bgr(frame))
+
+        return frame
+
+
+    def detect(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Detect the players in a frame, around the positions predicted by the
+        tracker in the ROI mode.
+
+        Returns
+        ------
+            tuple of the frame and the bounding boxes detected in it
+        """
+        return frame, self.detector.detect_tracked(frame, self.tracker, self.tracker_lock)
+
+
+    def track(self, detected: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, list, str]:
+        """
+        Update the tracker with the bounding boxes detected in a frame, then
+        emergence with the positions of the players.
+
+        Params
+        ------
+        detected
+            tuple of the frame and the bounding boxes, as returned by `detect`
+
+        Returns
+        ------
+            tuple of the frame, the tracked positions and the status text to
+            annotate it with
+        """
+        frame, bboxes = detected
+        with self.tracker_lock:
+            self.positions = self.tracker.update(bboxes)
+            positions = list(self.positions)
+
+        if self.task == 'emergence':
+            if len(positions) > 1:
+                # compute emergence of positions and update psi
+                X = self.centres(positions)
+                self.psi = self.calc.update_and_compute(X)
+                self.macro_psi = getattr(self.calc, 'macro_psi', {})
+                self.group_psi = getattr(self.calc, 'group_psi', {})
+                self.scale_psi = getattr(self.calc, 'scale_psi', {})
+                self.delta = getattr(self.calc, 'delta', np.nan)
+                self.gamma = getattr(self.calc, 'gamma', np.nan)
+                self.psi_z = getattr(self.calc, 'psi_z', np.nan)
+                self.psi_p = getattr(self.calc, 'psi_p', np.nan)
+
+        if self.task == 'emergence':
+            psi_status = f"Psi: {round(self.psi, 3)}"
+        else:
+            psi_status = ''
+
+        return frame, positions, psi_status
+
+
+    def annotate(self, tracked: Tuple[np.ndarray, list, str]) -> None:
+        """
+        Publish a frame with the positions tracked in it, as returned by
+        `track`, see `publish`.
+        """
+        self.publish(*tracked)
+
+
+    def bgr(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Frame of the video stream in BGR, converted from I420 if needed.
+        """
+        return i420_to_bgr(frame) if self.yuv else frame
+
+
+    def publish(self, frame: np.ndarray, positions: list, extra_text: str = '') -> None:
+        """
+        Set the output frame, annotated with the tracked positions and
+        `extra_text` if `tracking.annotate` is set. I420 frames are only
+        converted to BGR and annotated when they are streamed, by
+        `display_frame`, so that no conversion is made for frames nobody sees.
+        """
+        if self.yuv:
             with self.lock:
-                frame = self.video_stream.read()
+                self.output_frame = frame.copy()
+                self.output_annotations = (list(positions), extra_text)
+            return
 
-                if frame is not None and self.record:
-                    self.video_writer.write(frame)
+        if self.config.tracking.annotate:
+            frame = self.detector.draw_annotations(frame, positions,
+                                    extra_text = extra_text)
 
-            if frame is not None:
-                bboxes = self.detector.detect_colour(frame)
-                self.positions = self.tracker.update(bboxes)
+        # acquire the lock, set the output frame, and release the lock
+        with self.lock:
+            self.output_frame = frame.copy()
 
-                if self.task == 'emergence':
-                    if len(self.positions) > 1:
-                        # compute emergence of positions and update psi
-                        X = [ [ x + w/2, y + h/2 ]
-                                for (x, y, w, h) in self.positions ]
-                        self.psi = self.calc.update_and_compute(np.array(X))
 
-                if self.config.tracking.annotate:
-                    if self.task == 'emergence':
-                        psi_status = f"Psi: {round(self.psi, 3)}"
-                    else:
-                        psi_status = ''
-                    frame = self.detector.draw_annotations(frame, self.positions,
-                                            extra_text = psi_status)
+    def display_frame(self) -> np.ndarray:
+        """
+        Output frame in BGR, converted from I420 and annotated if needed. To be
+        called with the lock held.
+        """
+        if not self.yuv:
+            return self.output_frame
+
+        frame = i420_to_bgr(self.output_frame)
+        if self.config.tracking.annotate:
+            positions, extra_text = self.output_annotations
+            frame = self.detector.draw_annotations(frame, positions, extra_text = extra_text)
 
-                # acquire the lock, set the output frame, and release the lock
-                with self.lock:
-                    self.output_frame = frame.copy()
+        return frame
 
 
     def generate_frame(self) -> Generator[bytes, None, None]:
@@ -386,7 +766,7 @@ class VideoProcessor():
                 if self.output_frame is None:
                     continue
                 # encode the frame in JPEG format
-                (flag, encoded_frame) = cv2.imencode(".jpg", self.output_frame)
+                (flag, encoded_frame) = cv2.imencode(".jpg", self.display_frame())
                 # ensure the frame was successfully encoded
                 if not flag:
                     continue
@@ -415,7 +795,7 @@ class VideoProcessor():
             self.camera = Camera(self.config.server.CAMERA, self.config.camera, self.camera_stream)
             self.video_stream = self.camera.start()
 
-            self.detector = Detector(self.config.detection)
+            self.detector = create_detector(self.config.detection, self.yuv)
 
             self.tracker = EuclideanMultiTracker(self.config.tracking)
 
@@ -432,11 +812,21 @@ class VideoProcessor():
 
             # initialise emergence calculator
             self.psi  = 0
+            self.macro_psi = {}
+            self.group_psi = {}
+            self.scale_psi = {}
+            self.delta = np.nan
+            self.gamma = np.nan
+            self.psi_z = np.nan
+            self.psi_p = np.nan
             if self.task == 'emergence':
-                # TODO: add to config!!
-                self.calc = EmergenceCalculator(compute_macro,
-                    use_correction = True, psi_buffer_size = 36,
-                    observation_window_size = 720)
+                if self.calc:
+                    self.calc.reset()
+                else:
+                    self.create_calculator()
+                # skip the warm-up period if a recent checkpoint exists, e.g.
+                # after a restart mid-experiment
+                self.calc.resume()
                 logging.info("Initilised EmergenceCalculator")
             elif self.task == '':
                 logging.info("No task specified, continuing")
@@ -454,7 +844,8 @@ class VideoProcessor():
 
     def stop(self) -> None:
         """
-        Release the video stream and writer pointers and gracefully exit the JVM
+        Release the video stream and writer pointers. The emergence calculator
+        and its backend are kept running, to be reset and reused by the next run
 
         Params
         ------
@@ -476,8 +867,4 @@ class VideoProcessor():
                 logging.info('Closing video writer...')
                 self.video_writer.release()
 
-        if self.task == 'emergence':
-            if self.calc:
-                self.calc.exit()
-
 
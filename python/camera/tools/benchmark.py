@@ -0,0 +1,588 @@
+#!/usr/bin/python
+import click
+
+import copy
+import cv2
+import glob
+import itertools
+import jpype as jp
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import time
+import yaml
+
+from scipy.stats import spearmanr
+from typing import Any, Dict, List, Tuple
+
+from camera.core.detection import BufferedDetector, Detector, YUVDetector
+from camera.core.emergence import BACKENDS, SAMPLE_THRESHOLD, EmergenceCalculator, \
+        KSGEmergenceCalculator, compute_ksg_psi_series, compute_macro
+from camera.core.jidt import javify
+from camera.core.macro import MacroSet
+from camera.core.pipeline import Pipeline
+from camera.tools.colour import bgr_to_i420, i420_to_bgr
+from camera.tools.config import parse
+from camera.tools.flocking import vicsek
+
+
+def random_walk(T: int, N: int, D: int = 2, seed: int = 0) -> np.ndarray:
+    """
+    Generate trajectories of N players taking independent Gaussian steps in a
+    D-dimensional unit box, in the (T, N, D) format dumped by the tracker.
+    """
+    rng = np.random.default_rng(seed)
+    X = 0.5 + np.cumsum(rng.normal(scale = 0.005, size = (T, N, D)), axis = 0)
+    return np.clip(X, 0, 1)
+
+
+def time_frames(calc, X: np.ndarray, warmup: int) -> np.ndarray:
+    """
+    Feed the frames in X to the calculator and return the time in seconds
+    spent in `update_and_compute` for each frame after the first `warmup`.
+    """
+    times = []
+    for t in range(len(X)):
+        begin = time.perf_counter()
+        calc.update_and_compute(X[t])
+        if t >= warmup:
+            times.append(time.perf_counter() - begin)
+
+    return np.array(times)
+
+
+def save_csv(out: str, header: Tuple[str, ...], rows: List[Tuple]) -> None:
+    """
+    Save benchmark results as a CSV file with the given column names.
+    """
+    with open(out, 'w') as f:
+        f.write(','.join(header) + '\n')
+        for row in rows:
+            f.write(','.join(map(str, row)) + '\n')
+
+
+@click.command()
+@click.option('--backend', help = 'Emergence backends to benchmark', multiple = True,
+                           default = [ 'numpy' ], type = click.Choice(list(BACKENDS.keys())))
+@click.option('--windows', help = 'Comma-separated observation window sizes',
+                           default = '120,360,720,1440,2880,5000')
+@click.option('--players', help = 'Number of players', default = 10)
+@click.option('--frames',  help = 'Number of frames timed once the window is full', default = 200)
+@click.option('--out',     help = 'If set, save the results as CSV to this path', default = '')
+def window(backend: List[str], windows: str, players: int, frames: int, out: str) -> None:
+    """
+    Measure the per-frame latency of the emergence calculator as a function of
+    the observation window size.
+    """
+    rows = []
+    print('backend\twindow\tmean_ms\tp95_ms')
+    for b in backend:
+        for w in map(int, windows.split(',')):
+            warmup = max(w, SAMPLE_THRESHOLD) + 1
+            X = random_walk(warmup + frames, players)
+            calc = BACKENDS[b](compute_macro, observation_window_size = w)
+            times = 1000 * time_frames(calc, X, warmup)
+            rows.append((b, w, times.mean(), np.percentile(times, 95)))
+            print(f'{b}\t{w}\t{times.mean():.3f}\t{np.percentile(times, 95):.3f}')
+
+    if out:
+        save_csv(out, ('backend', 'window', 'mean_ms', 'p95_ms'), rows)
+
+
+@click.command()
+@click.option('--backend', help = 'Emergence backends to benchmark', multiple = True,
+                           default = [ 'numpy' ], type = click.Choice(list(BACKENDS.keys())))
+@click.option('--players', help = 'Comma-separated numbers of players',
+                           default = '10,50,100,200,400')
+@click.option('--window',  help = 'Observation window size', default = 720)
+@click.option('--frames',  help = 'Number of frames timed once the window is full', default = 200)
+@click.option('--out',     help = 'If set, save the results as CSV to this path', default = '')
+def players(backend: List[str], players: str, window: int, frames: int, out: str) -> None:
+    """
+    Measure the per-frame latency of the emergence calculator as a function of
+    the number of players.
+    """
+    rows = []
+    print('backend\tplayers\tmean_ms\tp95_ms')
+    for b in backend:
+        for n in map(int, players.split(',')):
+            warmup = max(window, SAMPLE_THRESHOLD) + 1
+            X = random_walk(warmup + frames, n)
+            calc = BACKENDS[b](compute_macro, observation_window_size = window)
+            times = 1000 * time_frames(calc, X, warmup)
+            rows.append((b, n, times.mean(), np.percentile(times, 95)))
+            print(f'{b}\t{n}\t{times.mean():.3f}\t{np.percentile(times, 95):.3f}')
+
+    if out:
+        save_csv(out, ('backend', 'players', 'mean_ms', 'p95_ms'), rows)
+
+
+def list_javify(Xi: np.ndarray) -> jp.JArray:
+    """
+    Previous conversion of a numpy array of shape (D,) or (1,D) to a Java
+    array, going through a Python list, kept as a baseline for `bridge`.
+    """
+    Xi = np.atleast_2d(Xi)
+    D = Xi.shape[1]
+    return jp.JArray(jp.JDouble, D)(Xi.tolist())
+
+
+@click.command()
+@click.option('--players', help = 'Number of players', default = 10)
+@click.option('--window',  help = 'Observation window size', default = 720)
+@click.option('--reps',    help = 'Number of frames to time for each path', default = 20)
+def bridge(players: int, window: int, reps: int) -> None:
+    """
+    Compare the per-frame cost of passing an observation window to the JIDT
+    calculators by converting each row through Python lists and adding one
+    observation per call, against bulk buffer transfers with one call per
+    calculator.
+    """
+    calc = EmergenceCalculator(compute_macro)
+
+    X  = random_walk(window + 1, players)
+    V  = X.mean(axis = 1)
+    Xp, Vp, Vn = X[:-1], V[:-1], V[1:]
+
+    # the previous implementation stored Java arrays for every frame and
+    # converted only the newest frame, but re-added the whole window
+    jXp = [ [ list_javify(Xi) for Xi in Xt ] for Xt in Xp ]
+    jVp = [ list_javify(v) for v in Vp ]
+    jVn = [ list_javify(v) for v in Vn ]
+
+    def list_path():
+        [ list_javify(Xi) for Xi in Xp[-1] ]
+        list_javify(Vp[-1])
+        list_javify(Vn[-1])
+
+        calc.initialise_calculators(Xp[-1], Vn[-1:])
+        for jvp, jv in zip(jVp, jVn):
+            calc.vmiCalc.addObservations(jvp, jv)
+        for jxp, jv in zip(jXp, jVn):
+            for jxip, c in zip(jxp, calc.xmiCalcs):
+                c.addObservations(jxip, jv)
+
+    def buffer_path():
+        obs_X = np.ascontiguousarray(Xp.transpose(1, 0, 2))
+
+        calc.initialise_calculators(Xp[-1], Vn[-1:])
+        jV = javify(Vn)
+        calc.vmiCalc.addObservations(javify(Vp), jV)
+        for Xip, c in zip(obs_X, calc.xmiCalcs):
+            c.addObservations(javify(Xip), jV)
+
+    print('path\tmean_ms')
+    for name, path in [ ('list', list_path), ('buffer', buffer_path) ]:
+        times = []
+        for _ in range(reps):
+            begin = time.perf_counter()
+            path()
+            times.append(time.perf_counter() - begin)
+        print(f'{name}\t{1000 * np.mean(times):.3f}')
+
+    calc.exit()
+
+
+@click.command()
+@click.option('--players',   help = 'Number of players', default = 10)
+@click.option('--window',    help = 'Observation window size', default = 720)
+@click.option('--frames',    help = 'Number of frames timed once the window is full', default = 100)
+@click.option('--fps',       help = 'Live frame rate the calculator must keep up with', default = 12.0)
+@click.option('--neighbours', help = 'Number of nearest neighbours of the KSG estimators', default = 4)
+@click.option('--processes', help = 'Comma-separated numbers of processes for the offline series',
+                             default = '1,4')
+@click.option('--length',    help = 'Number of frames of the offline trajectory', default = 2000)
+def ksg(players: int, window: int, frames: int, fps: float, neighbours: int,
+        processes: str, length: int) -> None:
+    """
+    Check that the KSG backend keeps up with the live frame rate with a full
+    observation window, and measure the speed-up of the parallel offline
+    computation of a psi series.
+    """
+    warmup = max(window, SAMPLE_THRESHOLD) + 1
+    X = random_walk(warmup + frames, players)
+    calc = KSGEmergenceCalculator(compute_macro, observation_window_size = window, k = neighbours)
+    times = 1000 * time_frames(calc, X, warmup)
+
+    budget = 1000 / fps
+    p95 = np.percentile(times, 95)
+    print('players\twindow\tmean_ms\tp95_ms\tbudget_ms')
+    print(f'{players}\t{window}\t{times.mean():.3f}\t{p95:.3f}\t{budget:.3f}')
+    print(f'live: {"within" if p95 <= budget else "OVER"} the {fps:g} fps budget')
+
+    X = random_walk(length, players)
+    print('processes\tseconds\tframes_per_s')
+    for p in map(int, processes.split(',')):
+        begin = time.perf_counter()
+        compute_ksg_psi_series(X, observation_window_size = window, k = neighbours, processes = p)
+        elapsed = time.perf_counter() - begin
+        print(f'{p}\t{elapsed:.2f}\t{length / elapsed:.1f}')
+
+
+def version() -> str:
+    """
+    Git revision of the benchmarked code, with a suffix if the tree has local
+    changes, or an empty string outside of a git checkout.
+    """
+    try:
+        return subprocess.run([ 'git', 'describe', '--always', '--dirty' ], capture_output = True,
+                              text = True, check = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def coupling_psi(backend: str, couplings: List[float], players: int, window: int,
+                 seeds: int, length: int) -> np.ndarray:
+    """
+    Average psi of synthetic flocks at every coupling strength, with the mean
+    velocity as macroscopic feature, computed frame by frame by a calculator
+    of the given backend.
+
+    Returns
+    ------
+    numpy array of shape (len(couplings), seeds) with the psi of every flock
+    averaged over the frames after the window is full
+    """
+    warmup = max(window, SAMPLE_THRESHOLD) + 1
+    psi = np.empty((len(couplings), seeds))
+    for (i, c), s in itertools.product(enumerate(couplings), range(seeds)):
+        X = vicsek(length, players, c, seed = s)
+        calc = BACKENDS[backend](MacroSet([ 'mean_velocity' ]), observation_window_size = window)
+        psi[i, s] = np.mean([ calc.update_and_compute(Xt) for Xt in X ][warmup:])
+        calc.exit()
+
+    return psi
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Configurations timed in both reports whose mean latency grew by more than
+    a factor `tolerance` over the baseline.
+    """
+    keys = ('backend', 'players', 'window', 'use_local', 'use_correction')
+    before = { tuple(r[k] for k in keys): r['mean_ms'] for r in baseline.get('timing', []) }
+
+    slower = []
+    for r in report['timing']:
+        key = tuple(r[k] for k in keys)
+        if key in before and r['mean_ms'] > tolerance * before[key]:
+            slower.append(dict(zip(keys, key), mean_ms = r['mean_ms'], baseline_ms = before[key]))
+
+    return slower
+
+
+@click.command()
+@click.option('--backend',   help = 'Emergence backends to benchmark', multiple = True,
+                             default = [ 'numpy' ], type = click.Choice(list(BACKENDS.keys())))
+@click.option('--players',   help = 'Comma-separated numbers of players', default = '10,50,200')
+@click.option('--windows',   help = 'Comma-separated observation window sizes', default = '120,720')
+@click.option('--frames',    help = 'Number of frames timed once the window is full', default = 100)
+@click.option('--couplings', help = 'Comma-separated coupling strengths of the accuracy check',
+                             default = '0,0.25,0.5,0.75,1')
+@click.option('--check-players', help = 'Number of players of the accuracy check', default = 10)
+@click.option('--check-window',  help = 'Observation window size of the accuracy check', default = 720)
+@click.option('--seeds',     help = 'Number of flocks per coupling strength', default = 3)
+@click.option('--length',    help = 'Number of frames of the flocks of the accuracy check', default = 1500)
+@click.option('--out',       help = 'If set, save the report as JSON to this path', default = '')
+@click.option('--baseline',  help = 'JSON report of a previous version to compare against', default = '')
+@click.option('--tolerance', help = 'Slow-down over the baseline reported as a regression', default = 1.25)
+def suite(backend: List[str], players: str, windows: str, frames: int, couplings: str,
+          check_players: int, check_window: int, seeds: int, length: int, out: str,
+          baseline: str, tolerance: float) -> None:
+    """
+    End-to-end benchmark of the emergence calculators on synthetic flocks from
+    `camera.tools.flocking`. Times `update_and_compute` per frame across the
+    numbers of players, window sizes, local and average psi, and with and
+    without the lattice correction. Checks that psi rises with the coupling of
+    the flock. Exits with an error if the check fails, or if a configuration is
+    slower than in the baseline report.
+    """
+    report = { 'version': version(), 'python': platform.python_version(),
+               'numpy': np.__version__, 'machine': platform.machine(),
+               'timing': [], 'accuracy': [] }
+
+    windows = list(map(int, windows.split(',')))
+
+    print('backend\tplayers\twindow\tlocal\tcorrection\tmean_ms\tp95_ms')
+    for n in map(int, players.split(',')):
+        X = vicsek(max(max(windows), SAMPLE_THRESHOLD) + 1 + frames, n)
+        for b, w, local, correction in itertools.product(backend, windows, [ False, True ], [ True, False ]):
+            warmup = max(w, SAMPLE_THRESHOLD) + 1
+            calc = BACKENDS[b](compute_macro, observation_window_size = w,
+                               use_local = local, use_correction = correction)
+            times = 1000 * time_frames(calc, X[:warmup + frames], warmup)
+            calc.exit()
+
+            row = { 'backend': b, 'players': n, 'window': w, 'use_local': local,
+                    'use_correction': correction, 'mean_ms': float(times.mean()),
+                    'p95_ms': float(np.percentile(times, 95)) }
+            report['timing'].append(row)
+            print(f'{b}\t{n}\t{w}\t{local}\t{correction}\t{row["mean_ms"]:.3f}\t{row["p95_ms"]:.3f}')
+
+    failed = False
+    couplings = list(map(float, couplings.split(',')))
+    print('backend\tcoupling\tpsi')
+    for b in backend:
+        psi = coupling_psi(b, couplings, check_players, check_window, seeds, length).mean(axis = 1)
+        rho = float(spearmanr(couplings, psi)[0])
+        rises = bool(rho > 0 and psi[-1] > psi[0])
+        failed |= not rises
+
+        report['accuracy'].append({ 'backend': b, 'players': check_players, 'window': check_window,
+                                    'couplings': couplings, 'psi': psi.tolist(),
+                                    'spearman': rho, 'psi_rises_with_coupling': rises })
+        for c, p in zip(couplings, psi):
+            print(f'{b}\t{c:g}\t{p:.3f}')
+        print(f'{b}: psi {"rises" if rises else "does NOT rise"} with coupling (Spearman {rho:.2f})')
+
+    if baseline:
+        with open(baseline) as f:
+            report['regressions'] = regressions(report, json.load(f), tolerance)
+        for r in report['regressions']:
+            print(f'REGRESSION {r}')
+        failed |= bool(report['regressions'])
+
+    if out:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent = 2)
+
+    if failed:
+        sys.exit(1)
+
+
+@click.command()
+@click.option('--images', help = 'Glob of the frames to detect players in',
+                          default = '../media/img/test*.png')
+@click.option('--config', help = 'Config file with the detection settings',
+                          default = './camera/config/default.yml')
+@click.option('--scales', help = 'Comma-separated factors by which the frames are upscaled',
+                          default = '1,2,3')
+@click.option('--reps',   help = 'Number of passes over the frames', default = 20)
+def detection(images: str, config: str, scales: str, reps: int) -> None:
+    """
+    Compare the per-frame latency of the `Detector` and of the
+    `BufferedDetector`, thresholding the frames in HSV or with a colour lookup
+    table, and check they detect the same bounding boxes. The frames are also
+    upscaled to emulate higher-resolution cameras.
+    """
+    with open(config, 'r') as fh:
+        conf = parse(yaml.safe_load(fh)).detection
+
+    frames = [ cv2.imread(f) for f in sorted(glob.glob(images)) ]
+    if not frames:
+        raise click.BadParameter(f'No frames match {images}')
+
+    lut = copy.copy(conf)
+    lut.colour_lut = True
+    detectors = [ Detector(conf), BufferedDetector(conf), Detector(lut), BufferedDetector(lut) ]
+
+    print('width\theight\tdetector\tlut\tmean_ms\tidentical')
+    for s in map(int, scales.split(',')):
+        scaled = [ cv2.resize(f, None, fx = s, fy = s, interpolation = cv2.INTER_NEAREST)
+                   for f in frames ]
+        reference = [ detectors[0].detect_colour(f) for f in scaled ]
+
+        for det in detectors:
+            identical = all(np.array_equal(det.detect_colour(f), r) for f, r in zip(scaled, reference))
+            begin = time.perf_counter()
+            for _ in range(reps):
+                for f in scaled:
+                    det.detect_colour(f)
+            elapsed = 1000 * (time.perf_counter() - begin) / (reps * len(scaled))
+
+            fh, fw = scaled[0].shape[:2]
+            print(f'{fw}\t{fh}\t{type(det).__name__}\t{det.lut is not None}\t{elapsed:.3f}\t{identical}')
+
+
+@click.command()
+@click.option('--images', help = 'Glob of the frames to detect players in',
+                          default = '../media/img/test*.png')
+@click.option('--config', help = 'Config file with the detection settings',
+                          default = './camera/config/default.yml')
+@click.option('--scales', help = 'Comma-separated factors by which the frames are upscaled',
+                          default = '1,2,3')
+@click.option('--reps',   help = 'Number of passes over the frames', default = 20)
+def yuv(images: str, config: str, scales: str, reps: int) -> None:
+    """
+    Compare the `YUVDetector` on I420 frames with the `Detector` on the same
+    frames converted to BGR, as a camera producing BGR frames would, both in
+    per-frame latency and in detected players. A box of the `Detector` is
+    matched if the centre of a box of the `YUVDetector` is within 1% of the
+    frame size of its centre.
+    """
+    with open(config, 'r') as fh:
+        conf = parse(yaml.safe_load(fh)).detection
+
+    frames = [ cv2.imread(f) for f in sorted(glob.glob(images)) ]
+    if not frames:
+        raise click.BadParameter(f'No frames match {images}')
+
+    bgr, i420 = Detector(conf), YUVDetector(conf)
+    centre = lambda boxes: boxes[:, :2] + boxes[:, 2:] / 2
+
+    print('width\theight\tbgr_ms\tyuv_ms\tbgr_boxes\tyuv_boxes\tmatched')
+    for s in map(int, scales.split(',')):
+        scaled = [ bgr_to_i420(cv2.resize(f, None, fx = s, fy = s, interpolation = cv2.INTER_NEAREST))
+                   for f in frames ]
+
+        counts = np.zeros(3, dtype = int)
+        for f in scaled:
+            a, b = centre(bgr.detect_colour(i420_to_bgr(f))), centre(i420.detect_colour(f))
+            matched = 0
+            if len(a) and len(b):
+                matched = np.sum(np.min(np.linalg.norm(a[:, None] - b[None], axis = -1), axis = 1) < 0.01)
+            counts += [ len(a), len(b), matched ]
+
+        elapsed = []
+        for detect in (lambda f: bgr.detect_colour(i420_to_bgr(f)), i420.detect_colour):
+            begin = time.perf_counter()
+            for _ in range(reps):
+                for f in scaled:
+                    detect(f)
+            elapsed.append(1000 * (time.perf_counter() - begin) / (reps * len(scaled)))
+
+        fh, fw = scaled[0].shape[0] * 2 // 3, scaled[0].shape[1]
+        print(f'{fw}\t{fh}\t{elapsed[0]:.3f}\t{elapsed[1]:.3f}\t{counts[0]}\t{counts[1]}\t{counts[2]}')
+
+
+def sorted_rows(boxes: np.ndarray) -> np.ndarray:
+    """
+    Bounding boxes sorted by their coordinates, to compare detections found in
+    a different order.
+    """
+    return boxes[np.lexsort(boxes.T[::-1])]
+
+
+@click.command()
+@click.option('--images', help = 'Glob of the frames to detect players in',
+                          default = '../media/img/test*.png')
+@click.option('--config', help = 'Config file with the detection settings',
+                          default = './camera/config/default.yml')
+@click.option('--scales', help = 'Comma-separated factors by which the frames are upscaled',
+                          default = '2,4,6')
+@click.option('--tiles',  help = 'Comma-separated numbers of tiles', default = '2,4,8')
+@click.option('--reps',   help = 'Number of passes over the frames', default = 10)
+def tiles(images: str, config: str, scales: str, tiles: str, reps: int) -> None:
+    """
+    Compare the per-frame latency of the detectors on the full frame and split
+    into tiles processed in parallel threads, and check the tiles detect the
+    same bounding boxes as the full frame. The frames are upscaled to emulate
+    4K cameras, and converted to I420 for the `YUVDetector`.
+    """
+    with open(config, 'r') as fh:
+        conf = parse(yaml.safe_load(fh)).detection
+
+    frames = [ cv2.imread(f) for f in sorted(glob.glob(images)) ]
+    if not frames:
+        raise click.BadParameter(f'No frames match {images}')
+
+    def configured(cls, n):
+        c = copy.copy(conf)
+        c.tiles = n
+        return cls(c)
+
+    print('width\theight\tdetector\ttiles\tmean_ms\tidentical')
+    for s in map(int, scales.split(',')):
+        scaled = [ cv2.resize(f, None, fx = s, fy = s, interpolation = cv2.INTER_NEAREST)
+                   for f in frames ]
+        fh, fw = scaled[0].shape[:2]
+
+        for cls in (Detector, BufferedDetector, YUVDetector):
+            inputs = [ bgr_to_i420(f) for f in scaled ] if cls is YUVDetector else scaled
+            reference = [ sorted_rows(r) for r in map(configured(cls, 1).detect_colour, inputs) ]
+
+            for n in [ 1 ] + list(map(int, tiles.split(','))):
+                det = configured(cls, n)
+                identical = all(np.array_equal(sorted_rows(det.detect_colour(f)), r)
+                                for f, r in zip(inputs, reference))
+                begin = time.perf_counter()
+                for _ in range(reps):
+                    for f in inputs:
+                        det.detect_colour(f)
+                elapsed = 1000 * (time.perf_counter() - begin) / (reps * len(inputs))
+
+                print(f'{fw}\t{fh}\t{cls.__name__}\t{n}\t{elapsed:.3f}\t{identical}')
+
+
+@click.command()
+@click.option('--images',  help = 'Glob of the frames to detect players in',
+                           default = '../media/img/test*.png')
+@click.option('--config',  help = 'Config file with the detection settings',
+                           default = './camera/config/default.yml')
+@click.option('--heights', help = 'Comma-separated heights of the 16:9 frames',
+                           default = '720,1080')
+@click.option('--backend', help = 'Emergence backend', default = 'numpy',
+                           type = click.Choice(list(BACKENDS.keys())))
+@click.option('--players', help = 'Number of players', default = 10)
+@click.option('--window',  help = 'Observation window size', default = 720)
+@click.option('--frames',  help = 'Number of frames processed', default = 300)
+@click.option('--queue',   help = 'Maximum number of frames waiting before each stage', default = 2)
+def pipeline(images: str, config: str, heights: str, backend: str, players: int,
+             window: int, frames: int, queue: int) -> None:
+    """
+    Compare the sustained frame rate of processing frames one stage after the
+    other and in a `Pipeline`, as in `VideoProcessor`. Each frame is copied out
+    of a list of frames as by a camera, its players are detected, psi is
+    computed from synthetic flocking trajectories, and the frame is annotated.
+    """
+    with open(config, 'r') as fh:
+        conf = parse(yaml.safe_load(fh)).detection
+
+    sources = [ cv2.imread(f) for f in sorted(glob.glob(images)) ]
+    if not sources:
+        raise click.BadParameter(f'No frames match {images}')
+
+    warmup = max(window, SAMPLE_THRESHOLD) + 1
+    X = vicsek(warmup + frames, players)
+
+    print('width\theight\tmode\tfps\t' + '\t'.join(f'{s}_ms' for s in ('capture', 'detect', 'track', 'annotate')))
+    for h in map(int, heights.split(',')):
+        w = h * 16 // 9
+        scaled = [ cv2.resize(f, (w, h)) for f in sources ]
+
+        for mode in ('sequential', 'pipeline'):
+            detector = Detector(conf)
+            calc = BACKENDS[backend](compute_macro, observation_window_size = window)
+            for t in range(warmup):
+                calc.update_and_compute(X[t])
+
+            t = iter(range(frames))
+            def capture():
+                i = next(t, None)
+                return None if i is None else (i, scaled[i % len(scaled)].copy())
+            detect = lambda item: (item, detector.detect_colour(item[1]))
+            track = lambda item: (item[0][1], item[1], calc.update_and_compute(X[warmup + item[0][0]]))
+            annotate = lambda item: detector.draw_annotations(item[0], item[1], extra_text = f'Psi: {item[2]:.3f}')
+
+            run = Pipeline(capture, [ ('detect', detect), ('track', track), ('annotate', annotate) ], queue)
+            if mode == 'pipeline':
+                run.start()
+                while run.is_alive():
+                    time.sleep(0.01)
+            else:
+                run.run()
+            stats = run.stats()
+
+            ms = '\t'.join(f"{s['ms']:.2f}" for s in stats['stages'].values())
+            print(f"{w}\t{h}\t{mode}\t{stats['fps']:.1f}\t{ms}")
+
+
+@click.group()
+def options():
+	pass
+
+options.add_command(window)
+options.add_command(players)
+options.add_command(bridge)
+options.add_command(ksg)
+options.add_command(suite)
+options.add_command(detection)
+options.add_command(yuv)
+options.add_command(pipeline)
+options.add_command(tiles)
+
+if __name__ == '__main__':
+    options()
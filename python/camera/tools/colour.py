@@ -1,7 +1,7 @@
 import cv2
 import numpy as np
 
-from typing import Dict
+from typing import Dict, Optional
 
 def hex_to_hsv(c: str) -> Dict[str, int]:
     """
@@ -46,3 +46,20 @@ def hsv_to_hex(hsv: Dict[str, int]) -> str:
     hexs = [ f"0{i}" if len(i) == 1 else i for i in hexs ]
     return '#' + ''.join(hexs)
 
+
+
+def bgr_to_i420(frame: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """
+    Convert a BGR frame to the I420 format of a `PiYUVStream`, e.g. to feed the
+    frames of a recorded video to a `YUVDetector`. None is passed through, as
+    at the end of a `FileVideoStream`.
+    """
+    return None if frame is None else cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+
+
+def i420_to_bgr(frame: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """
+    Convert an I420 frame to BGR, e.g. to annotate or record it. None is passed
+    through.
+    """
+    return None if frame is None else cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+import click
+
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+
+def vicsek(
+        T: int,
+        N: int,
+        coupling: float = 1.0,
+        radius: float = 0.2,
+        speed: float = 0.005,
+        noise: float = 0.5,
+        seed: int = 0
+    ) -> np.ndarray:
+    """
+    Generate the trajectories of N players flocking in the unit square with a
+    Vicsek-style model, in the (T, N, D) format dumped by the tracker. At every
+    frame, each player moves at constant speed and turns towards the average
+    heading of the players within `radius`, plus uniform angular noise:
+
+        theta_i <- arg[ (1 - c) e^(i theta_i) + c mean_j e^(i theta_j) ] + noise xi
+
+    The coupling c interpolates between independent correlated random walks
+    (c = 0) and the standard Vicsek model (c = 1). Players bounce off the walls
+    of the square, so that their positions stay continuous.
+
+    Params
+    ------
+    T, N
+        number of frames and of players
+    coupling
+        strength of the alignment with the neighbours, between 0 and 1
+    radius
+        interaction radius
+    speed
+        distance moved per frame
+    noise
+        amplitude of the angular noise, as a fraction of pi
+    seed
+        seed of the random generator
+
+    Returns
+    ------
+    numpy array of shape (T, N, 2)
+    """
+    rng = np.random.default_rng(seed)
+    P = rng.uniform(0, 1, size = (N, 2))
+    theta = rng.uniform(-np.pi, np.pi, size = N)
+
+    X = np.empty((T, N, 2))
+    for t in range(T):
+        X[t] = P
+
+        # average heading over the neighbours within the radius, the player
+        # included, from the sparse list of pairs
+        heading = np.exp(1j * theta)
+        pairs = cKDTree(P).query_pairs(radius, output_type = 'ndarray')
+        total = heading.copy()
+        count = np.ones(N)
+        np.add.at(total, pairs[:, 0], heading[pairs[:, 1]])
+        np.add.at(total, pairs[:, 1], heading[pairs[:, 0]])
+        np.add.at(count, pairs.ravel(), 1)
+
+        theta = np.angle((1 - coupling) * heading + coupling * total / count) \
+              + noise * rng.uniform(-np.pi, np.pi, size = N)
+
+        P = P + speed * np.stack([ np.cos(theta), np.sin(theta) ], axis = -1)
+
+        # reflect off the walls
+        low, high = P < 0, P > 1
+        P = np.where(low, -P, np.where(high, 2 - P, P))
+        theta = np.where(low[:, 0] | high[:, 0], np.pi - theta, theta)
+        theta = np.where(low[:, 1] | high[:, 1], -theta, theta)
+
+    return X
+
+
+@click.command()
+@click.option('--frames',   help = 'Number of frames', default = 2000)
+@click.option('--players',  help = 'Number of players', default = 10)
+@click.option('--coupling', help = 'Alignment strength between 0 and 1', default = 1.0)
+@click.option('--radius',   help = 'Interaction radius', default = 0.2)
+@click.option('--speed',    help = 'Distance moved per frame', default = 0.005)
+@click.option('--noise',    help = 'Angular noise as a fraction of pi', default = 0.5)
+@click.option('--seed',     help = 'Seed of the random generator', default = 0)
+@click.option('--out',      help = 'Path of the numpy dump of the trajectories', required = True)
+def generate(frames: int, players: int, coupling: float, radius: float, speed: float,
+             noise: float, seed: int, out: str) -> None:
+    """
+    Generate synthetic flocking trajectories and save them as a numpy dump, in
+    the same format as `trajectories.py track`.
+    """
+    X = vicsek(frames, players, coupling, radius, speed, noise, seed)
+    X.dump(out)
+    print(f'Saved {frames} frames of {players} players with coupling {coupling} to {out}')
+
+
+@click.group()
+def options():
+	pass
+
+options.add_command(generate)
+
+if __name__ == '__main__':
+    options()
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+import click
+
+import concurrent.futures as cf
+import itertools
+import logging
+import numpy as np
+import os
+import time
+
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Tuple
+
+# initialise logging to file
+import camera.core.logger
+
+from camera.core.emergence import BACKENDS, compute_psi_series
+from camera.core.macro     import MACROS, MacroSet
+
+PARAMS = [ 'macro', 'psi_buffer_size', 'observation_window_size',
+           'use_correction', 'use_local' ]
+
+
+def parse_list(values: str, cast: Any) -> List[Any]:
+    """
+    Parse a comma-separated list of parameter values.
+    """
+    if cast is bool:
+        return [ v.strip().lower() in ('1', 'true', 'yes') for v in values.split(',') ]
+    return [ cast(v) for v in values.split(',') ]
+
+
+def run_task(task: Dict[str, Any]) -> np.ndarray:
+    """
+    Compute the psi series of one trajectory file for one combination of
+    parameters. Runs in a worker process.
+
+    Params
+    ------
+    task
+        dict with the path of the trajectory file under 'filename', the
+        engine under 'engine' ('batch' or an emergence backend), and the
+        values of all the parameters in PARAMS
+
+    Returns
+    ------
+    numpy array with the filtered psi at each frame
+    """
+    X = np.load(task['filename'], allow_pickle = True)
+    kwargs = { k: task[k] for k in PARAMS if k != 'macro' }
+    macro_fun = MacroSet([ task['macro'] ])
+
+    if task['engine'] == 'batch':
+        return compute_psi_series(X, macro_fun, **kwargs)
+
+    # the JVM is shared by all the tasks run by the same worker process
+    calc = BACKENDS[task['engine']](macro_fun, **kwargs)
+    psi = np.array([ calc.update_and_compute(Xt) for Xt in X ])
+    calc.exit()
+
+    return psi
+
+
+def run_isolated(task: Dict[str, Any]) -> np.ndarray:
+    """
+    Run a single task in its own worker process, so that if the process dies
+    no other task is affected.
+    """
+    with cf.ProcessPoolExecutor(max_workers = 1) as pool:
+        return pool.submit(run_task, task).result()
+
+
+def run_sweep(
+        tasks: List[Dict[str, Any]], workers: int
+    ) -> Tuple[Dict[int, np.ndarray], Dict[int, str]]:
+    """
+    Fan the tasks out across a process pool. A task raising an exception is
+    recorded as failed. If a worker process dies, the pool breaks and all its
+    unfinished tasks are rerun, each in its own process, so that only the
+    task which killed the worker is lost.
+
+    Returns
+    ------
+    tuple of dicts, mapping the index of each task to its psi series if it
+    succeeded, or to the error message if it failed
+    """
+    results  = {}
+    failures = {}
+    broken   = []
+
+    def collect(i: int, future: cf.Future) -> None:
+        try:
+            results[i] = future.result()
+            logging.info(f"Sweep task {i} done: {tasks[i]}")
+        except BrokenProcessPool:
+            broken.append(i)
+        except Exception as e:
+            failures[i] = repr(e)
+            logging.info(f"Sweep task {i} failed: {tasks[i]}: {e!r}")
+
+    with cf.ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = { pool.submit(run_task, task): i for i, task in enumerate(tasks) }
+        for future in cf.as_completed(futures):
+            collect(futures[future], future)
+
+    if broken:
+        logging.info(f"Worker process died, rerunning {len(broken)} tasks in isolation")
+        retry, broken = broken, []
+        with cf.ThreadPoolExecutor(max_workers = workers) as pool:
+            futures = { pool.submit(run_isolated, tasks[i]): i for i in retry }
+            for future in cf.as_completed(futures):
+                collect(futures[future], future)
+
+        for i in broken:
+            failures[i] = 'worker process died'
+            logging.info(f"Sweep task {i} failed: {tasks[i]}: worker process died")
+
+    return results, failures
+
+
+def save_results(out: str, tasks: List[Dict[str, Any]], results: Dict[int, np.ndarray]) -> None:
+    """
+    Save the psi series of all successful tasks in one table indexed by file
+    and parameters. If `out` ends in .npz, save a NumPy archive with one
+    column per parameter and a (tasks, frames) psi array padded with NaN,
+    otherwise a CSV file in long format with one row per task and frame.
+    """
+    idx = sorted(results.keys())
+    cols = [ 'filename' ] + PARAMS
+
+    if out.endswith('.npz'):
+        T = max([ len(results[i]) for i in idx ], default = 0)
+        psi = np.full((len(idx), T), np.nan)
+        for row, i in enumerate(idx):
+            psi[row, :len(results[i])] = results[i]
+
+        np.savez(out, psi = psi, **{ c: np.array([ tasks[i][c] for i in idx ]) for c in cols })
+    else:
+        with open(out, 'w') as f:
+            f.write(','.join(cols + [ 'frame', 'psi' ]) + '\n')
+            for i in idx:
+                prefix = ','.join(str(tasks[i][c]) for c in cols)
+                for t, psi in enumerate(results[i]):
+                    f.write(f'{prefix},{t},{psi}\n')
+
+
+@click.command()
+@click.option('--filename',   help = 'Numpy array dump of trajectories, can be repeated', required = True, multiple = True)
+@click.option('--out',        help = 'Path of the CSV or .npz file to save results to', default = 'sweep.csv')
+@click.option('--engine',     help = "'batch' to compute each series at once, or an emergence backend",
+                              default = 'batch', type = click.Choice([ 'batch' ] + list(BACKENDS.keys())))
+@click.option('--macro',      help = 'Comma-separated macro features', default = 'centroid')
+@click.option('--buffer',     help = 'Comma-separated psi_buffer_size values', default = '60')
+@click.option('--window',     help = 'Comma-separated observation_window_size values', default = '120')
+@click.option('--correction', help = 'Comma-separated use_correction values', default = 'true')
+@click.option('--local',      help = 'Comma-separated use_local values', default = 'false')
+@click.option('--workers',    help = 'Number of worker processes, by default all cores', default = os.cpu_count())
+def sweep(filename: Tuple[str], out: str, engine: str, macro: str, buffer: str,
+        window: str, correction: str, local: str, workers: int) -> None:
+    """
+    Compute emergence on a set of trajectory files for every combination of the
+    given parameters, in parallel across a process pool, and gather the psi
+    series in one table.
+    """
+    grid = [ parse_list(macro, str), parse_list(buffer, int), parse_list(window, int),
+             parse_list(correction, bool), parse_list(local, bool) ]
+    for m in grid[0]:
+        if m not in MACROS:
+            raise click.BadParameter(f'Unknown macro feature: {m}')
+
+    tasks = [ dict(zip(PARAMS, values), filename = f, engine = engine)
+              for f in filename for values in itertools.product(*grid) ]
+    print(f'Running {len(tasks)} tasks on {workers} workers')
+
+    begin = time.time()
+    results, failures = run_sweep(tasks, workers)
+    print(f'Completed {len(results)} tasks in {time.time() - begin:.1f}s')
+
+    for i, err in sorted(failures.items()):
+        print(f'Task failed: {tasks[i]}: {err}')
+
+    save_results(out, tasks, results)
+    print(f'Saved results to {out}')
+
+
+if __name__ == '__main__':
+    sweep()
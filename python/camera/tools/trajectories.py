@@ -219,7 +219,7 @@ def track(filename: str, tracker: str, realtime: bool, out: str):
     else:
         multiTracker = cv2.MultiTracker_create()
         for box in trackingBoxes:
-            multiTracker.add(get_opencv_tracker(tracker), frame, box)
+            multiTracker.add(get_opencv_tracker(tracker), frame, tuple(box))
 
         opencv_multitracking(vid, multiTracker, det, out)
 
@@ -0,0 +1,155 @@
+import copy
+import cv2
+import glob
+import numpy as np
+import os
+import pytest
+import threading
+import yaml
+
+from types import SimpleNamespace
+
+from camera.core.detection import BufferedDetector, Detector, YUVDetector
+from camera.tools.colour import bgr_to_i420
+from camera.tools.config import parse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+
+@pytest.fixture(scope = 'module')
+def conf():
+    with open(os.path.join(ROOT, 'python', 'camera', 'config', 'default.yml')) as fh:
+        conf = parse(yaml.safe_load(fh)).detection
+    conf.lut_cache = ''
+    return conf
+
+
+@pytest.fixture(scope = 'module')
+def frames():
+    return [ cv2.imread(f) for f in sorted(glob.glob(os.path.join(ROOT, 'media', 'img', 'test*.png'))) ]
+
+
+def configured(conf, **kwargs):
+    conf = copy.copy(conf)
+    for key, value in kwargs.items():
+        setattr(conf, key, value)
+    return conf
+
+
+def sorted_rows(boxes: np.ndarray) -> np.ndarray:
+    return boxes[np.lexsort(boxes.T[::-1])]
+
+
+def tracker(boxes: np.ndarray, lost: int = 0) -> SimpleNamespace:
+    """
+    Stand-in for an `EuclideanMultiTracker` tracking and predicting `boxes`.
+    """
+    return SimpleNamespace(lost = lost, momodels = list(boxes), num_players = len(boxes),
+                           predict_bboxes = lambda: boxes)
+
+
+def test_roi_finds_the_predicted_boxes(conf, frames):
+    full, roi = Detector(conf), Detector(configured(conf, roi_interval = 10))
+
+    for frame in frames:
+        boxes = full.detect_colour(frame)
+        roi.frames_since_scan = 0
+        assert np.array_equal(sorted_rows(roi.detect_tracked(frame, tracker(boxes))), sorted_rows(boxes))
+
+
+def test_roi_scans_the_full_frame(conf, frames):
+    roi = Detector(configured(conf, roi_interval = 3))
+    boxes = Detector(conf).detect_colour(frames[0])
+    # no window to process around the predictions
+    nothing = tracker(boxes)
+    nothing.predict_bboxes = lambda: np.empty((0, 4))
+
+    found = [ len(roi.detect_tracked(frames[0], nothing)) for _ in range(6) ]
+    assert found == [ 0, 0, len(boxes), 0, 0, len(boxes) ]
+
+    # as soon as a player is lost
+    assert len(roi.detect_tracked(frames[0], tracker(np.empty((0, 4)), lost = 1))) == len(boxes)
+
+
+@pytest.mark.parametrize('scale', [ 1, 4 ])
+def test_pyramid_finds_the_full_frame_boxes(conf, frames, scale):
+    full, pyramid = Detector(conf), Detector(configured(conf, pyramid_scale = 0.25))
+
+    for frame in frames:
+        frame = cv2.resize(frame, None, fx = scale, fy = scale, interpolation = cv2.INTER_NEAREST)
+        assert np.array_equal(sorted_rows(pyramid.detect_colour(frame)),
+                              sorted_rows(full.detect_colour(frame)))
+
+
+def test_buffered_finds_the_same_boxes(conf, frames):
+    full, buffered = Detector(conf), BufferedDetector(conf)
+
+    # growing frames reallocate the buffers, and smaller ones use views of them
+    for scale in (1, 2, 1):
+        for frame in frames:
+            frame = cv2.resize(frame, None, fx = scale, fy = scale, interpolation = cv2.INTER_NEAREST)
+            assert np.array_equal(buffered.detect_colour(frame), full.detect_colour(frame))
+
+    # and so do the windows of the ROI mode
+    windows = [ (0, 0, 100, 80), (200, 100, 640, 480) ]
+    assert np.array_equal(buffered.find_boxes_in_windows(frames[0], windows),
+                          full.find_boxes_in_windows(frames[0], windows))
+
+
+def test_lut_mask_matches_hsv_threshold(conf, frames):
+    detector = Detector(configured(conf, colour_lut = True))
+    noise = np.random.default_rng(0).integers(0, 256, size = (512, 512, 3), dtype = np.uint8)
+
+    for frame in frames + [ noise ]:
+        hsv = cv2.inRange(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV), detector.min_hsv, detector.max_hsv)
+        assert np.array_equal(detector.lookup_mask(frame), hsv)
+
+
+def test_lut_is_loaded_from_the_cache(conf, tmp_path):
+    built = Detector(configured(conf, colour_lut = True, lut_cache = str(tmp_path)))
+    assert len(list(tmp_path.glob('lut_*.npy'))) == 1
+
+    def rebuild(*bounds):
+        pytest.fail('The lookup table was rebuilt instead of loaded')
+
+    loaded = Detector(configured(conf, lut_cache = str(tmp_path))).load_lut(rebuild)
+    assert np.array_equal(loaded, built.lut)
+
+
+@pytest.mark.parametrize('cls', [ Detector, BufferedDetector, YUVDetector ])
+@pytest.mark.parametrize('tiles', [ 2, 3, 8 ])
+def test_tiles_find_the_full_frame_boxes(conf, frames, cls, tiles):
+    full, tiled = cls(conf), cls(configured(conf, tiles = tiles))
+
+    for frame in frames:
+        frame = cv2.resize(frame, None, fx = 2, fy = 2, interpolation = cv2.INTER_NEAREST)
+        if cls is YUVDetector:
+            frame = bgr_to_i420(frame)
+        assert np.array_equal(sorted_rows(tiled.detect_colour(frame)),
+                              sorted_rows(full.detect_colour(frame)))
+
+
+def test_tiles_across_blobs_and_empty_rows(conf):
+    rng = np.random.default_rng(0)
+    frame = np.zeros((480, 640, 3), np.uint8)
+    for x, y, r in zip(rng.integers(0, 640, 60), rng.integers(0, 480, 60), rng.integers(2, 20, 60)):
+        cv2.circle(frame, (int(x), int(y)), int(r), (0, 255, 0), -1)
+    # a bar across all the strips, so that no row is empty
+    frame[:, 300:305] = (0, 255, 0)
+
+    expected = sorted_rows(Detector(conf).detect_colour(frame))
+    for tiles in (2, 5, 50):
+        assert np.array_equal(sorted_rows(Detector(configured(conf, tiles = tiles)).detect_colour(frame)),
+                              expected)
+
+
+def test_tile_threads_are_shared_across_detectors(conf, frames):
+    tile_threads = lambda: sum(t.name.startswith('tiles') for t in threading.enumerate())
+    threads = tile_threads()
+
+    detectors = [ Detector(configured(conf, tiles = 4)) for _ in range(5) ]
+    for detector in detectors:
+        detector.detect_colour(frames[0])
+
+    # at most the threads of a single pool of 4 workers
+    assert tile_threads() - threads <= 4
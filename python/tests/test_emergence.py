@@ -0,0 +1,43 @@
+import numpy as np
+
+from camera.core.emergence import PSI_START, SAMPLE_THRESHOLD, GaussianEmergenceCalculator, \
+        compute_macro
+
+
+def warmed_up(N: int, seed: int = 0, **kwargs) -> GaussianEmergenceCalculator:
+    """
+    Gaussian calculator fed with random walks of N players past the sample
+    threshold and the median filter, so that it returns computed values.
+    """
+    rng = np.random.default_rng(seed)
+    calc = GaussianEmergenceCalculator(compute_macro, observation_window_size = 200, **kwargs)
+    X = rng.uniform(0, 1, size = (N, 2))
+    for _ in range(SAMPLE_THRESHOLD + 100):
+        X = X + rng.normal(0, 0.01, size = X.shape)
+        calc.update_and_compute(X)
+    return calc
+
+
+def test_players_changing_on_consecutive_frames():
+    calc = warmed_up(8)
+    rng = np.random.default_rng(1)
+
+    for N in (9, 10, 10, 10):
+        psi = calc.update_and_compute(rng.uniform(0, 1, size = (N, 2)))
+        assert np.isfinite(psi)
+
+    assert calc.N == 10
+    assert calc.stats.n[calc.primary] == 2
+
+
+def test_single_window_has_no_scale_psi():
+    calc = warmed_up(5)
+
+    assert calc.scale_psi == {}
+
+
+def test_scale_psi_is_filtered_at_every_window():
+    calc = warmed_up(5, scales = [ 100 ])
+
+    assert set(calc.scale_psi) == { '100', '200' }
+    assert all(psi != PSI_START for psi in calc.scale_psi.values())
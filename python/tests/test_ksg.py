@@ -0,0 +1,30 @@
+import numpy as np
+
+from camera.core.ksg import add_noise, ksg_mutual_info, ksg_psi, normalise
+
+
+def tied(shape: tuple, levels: int = 3, seed: int = 0) -> np.ndarray:
+    """
+    Independent observations taking only a few values, so that most of the
+    distances between them are exactly equal.
+    """
+    return np.random.default_rng(seed).integers(0, levels, size = shape).astype(float)
+
+
+def test_mutual_info_of_tied_independent_variables():
+    Z = add_noise(normalise(np.hstack([ tied((500, 2)), tied((500, 1), seed = 1) ])))
+
+    assert abs(ksg_mutual_info(Z[:, :2], Z[:, 2:])) < 0.1
+
+
+def test_psi_of_tied_independent_players():
+    T, N = 500, 4
+    Xp = tied((T, N, 2))
+    # a stationary player
+    Xp[:, 0] = 1
+    Vp, Vn = tied((T, 2), seed = 1), tied((T, 2), seed = 2)
+
+    psi = ksg_psi(Xp, Vp, Vn)
+
+    assert abs(psi) < 0.2
+    assert ksg_psi(Xp, Vp, Vn) == psi
@@ -0,0 +1,68 @@
+import numpy as np
+import queue
+import threading
+import time
+
+from types import SimpleNamespace
+
+from camera.core.worker import EmergenceWorker, run_worker
+
+
+def stopped_worker(**kwargs) -> EmergenceWorker:
+    """
+    Emergence worker on the NumPy backend whose process was killed, so that
+    the frames submitted stay in its inbox.
+    """
+    worker = EmergenceWorker(SimpleNamespace(backend = 'numpy'), **kwargs)
+    worker.process.terminate()
+    worker.process.join()
+    return worker
+
+
+def test_submitted_frame_is_copied():
+    worker = stopped_worker()
+    X = np.ones((3, 2))
+
+    worker.update_and_compute(X[:2])
+    X[:] = 2
+
+    assert np.array_equal(worker.inbox.get(timeout = 5), np.ones((2, 2)))
+
+
+def test_reset_restarts_dead_worker():
+    worker = stopped_worker(queue_size = 2, policy = 'skip')
+    for _ in range(3):
+        worker.update_and_compute(np.random.default_rng(0).uniform(0, 1, size = (4, 2)))
+
+    resetting = threading.Thread(target = worker.reset, daemon = True)
+    resetting.start()
+    resetting.join(timeout = 10)
+    assert not resetting.is_alive()
+
+    # the new process publishes the results of the new session
+    rng = np.random.default_rng(1)
+    deadline = time.time() + 30
+    while worker.processed == 0 and time.time() < deadline:
+        worker.update_and_compute(rng.uniform(0, 1, size = (4, 2)))
+        time.sleep(0.1)
+    assert worker.processed > 0
+
+    worker.exit()
+
+
+def test_control_messages_are_not_coalesced():
+    inbox, outbox = queue.Queue(), queue.Queue()
+    X = np.random.default_rng(0).uniform(0, 1, size = (4, 2))
+    for message in (X, X, 'resume', X):
+        inbox.put(message)
+
+    running = threading.Thread(target = run_worker,
+        args = (SimpleNamespace(backend = 'numpy'), 'coalesce', inbox, outbox), daemon = True)
+    running.start()
+
+    result = outbox.get(timeout = 10)
+    inbox.put(None)
+    running.join(timeout = 10)
+
+    assert result['processed'] == 1
+    assert result['coalesced'] == 1